@@ -4,12 +4,13 @@ import os
 
 import fastapi
 from fastapi.datastructures import URL
-import requests
+import httpx
 
 
 from aoai_simulated_api import constants
 from aoai_simulated_api.auth import validate_api_key_header
 from aoai_simulated_api.models import RequestContext
+from aoai_simulated_api.record_replay.http_client import get_http_client
 
 #
 # This example shows a multi-file extension to the simulator
@@ -58,7 +59,7 @@ doc_intelligence_response_headers_to_remove = [
 
 async def forward_to_azure_document_intelligence(
     context: RequestContext,
-) -> fastapi.Response | requests.Response | dict | None:
+) -> fastapi.Response | httpx.Response | dict | None:
     request = context.request
     if not request.url.path.startswith("/formrecognizer/"):
         # assume not an Doc Intelligence request
@@ -92,13 +93,15 @@ async def forward_to_azure_document_intelligence(
     }
     fwd_headers["api-key"] = doc_intelligence_api_key
 
-    body = await request.body()
+    body = await context.get_request_body()
 
-    response = requests.request(
+    # use the simulator's shared HTTP client to avoid blocking the event loop and re-use connections
+    http_client = get_http_client(context.config.recording)
+    response = await http_client.request(
         request.method,
         url,
         headers=fwd_headers,
-        data=body,
+        content=body,
     )
 
     for header in doc_intelligence_response_headers_to_remove:
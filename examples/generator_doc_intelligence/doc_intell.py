@@ -11,6 +11,7 @@ from aoai_simulated_api.auth import validate_api_key_header
 from aoai_simulated_api.constants import SIMULATOR_KEY_LIMITER
 from aoai_simulated_api.models import RequestContext
 from aoai_simulated_api.generator.openai import raw_lorem_get_word
+from aoai_simulated_api.generator.routing import generator_route
 
 document_analysis_config = {}
 
@@ -37,13 +38,9 @@ def get_word_count_for_result(content_length: int) -> int:
     return response_content_length
 
 
+@generator_route(path="/formrecognizer/documentModels/{modelId}:analyze", methods=["POST"])
 async def doc_intelligence_analyze(context: RequestContext) -> Response | None:
     request = context.request
-    is_match, path_params = context.is_route_match(
-        request=request, path="/formrecognizer/documentModels/{modelId}:analyze", methods=["POST"]
-    )
-    if not is_match:
-        return None
 
     # This is an example of how you can use the validate_api_key_header function
     # This validates the "ocp-apim-subscription-key" header in the request against the configured API key
@@ -52,7 +49,7 @@ async def doc_intelligence_analyze(context: RequestContext) -> Response | None:
     )
 
     # Required parameters (modelId, api-version)
-    model_id = path_params["modelId"]
+    model_id = context.path_params["modelId"]
     api_version = request.query_params.get("api-version")
 
     # Get the size of the request body
@@ -99,15 +96,9 @@ async def doc_intelligence_analyze(context: RequestContext) -> Response | None:
     return Response(status_code=202, headers=headers)
 
 
+@generator_route(path="/formrecognizer/documentModels/{model_id}/analyzeResults/{result_id}", methods=["GET"])
 async def doc_intelligence_analyze_result(context: RequestContext) -> Response | None:
     request = context.request
-    is_match, path_params = context.is_route_match(
-        request=request,
-        path="/formrecognizer/documentModels/{model_id}/analyzeResults/{result_id}",
-        methods=["GET"],
-    )
-    if not is_match:
-        return None
 
     # This is an example of how you can use the validate_api_key_header function
     # This validates the "ocp-apim-subscription-key" header in the request against the configured API key
@@ -115,7 +106,7 @@ async def doc_intelligence_analyze_result(context: RequestContext) -> Response |
         request=request, header_name="ocp-apim-subscription-key", allowed_key_value=context.config.simulator_api_key
     )
 
-    result_id = path_params["result_id"]
+    result_id = context.path_params["result_id"]
     doc_config = document_analysis_config.get(result_id)
     if not doc_config:
         return Response(status_code=404)
@@ -0,0 +1,53 @@
+"""
+Benchmark the per-request cost of the rate-limiting sliding windows as the number of entries in the window grows.
+
+Run from the root of the repo:
+    python scripts/benchmark_sliding_window.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "aoai-simulated-api", "src"))
+
+# pylint: disable-next=wrong-import-position
+from aoai_simulated_api.limiters import IndexedSlidingWindow, SlidingWindow
+
+window_sizes = [10, 100, 1_000, 10_000, 100_000]
+sample_count = 20_000
+
+# Filling the list-based SlidingWindow is quadratic in the number of entries, so skip it for the largest sizes
+max_sliding_window_size = 10_000
+
+
+def measure(window_class, window_entry_count: int) -> float:
+    # Set the limits high enough that they aren't hit so that every request is added to the window
+    window = window_class(requests_per_10_seconds=10_000_000, tokens_per_minute=10_000_000_000)
+
+    # Fill the window with entries spread over the last 5 seconds
+    timestamp = 1000.0
+    step = 5 / window_entry_count
+    for _ in range(window_entry_count):
+        window.add_request(token_cost=10, timestamp=timestamp)
+        timestamp += step
+
+    start = time.perf_counter()
+    for _ in range(sample_count):
+        window.add_request(token_cost=10, timestamp=timestamp)
+    return (time.perf_counter() - start) / sample_count
+
+
+def main():
+    print(f"{'entries':>10} {'SlidingWindow (µs)':>20} {'IndexedSlidingWindow (µs)':>27}")
+    for window_size in window_sizes:
+        if window_size <= max_sliding_window_size:
+            sliding_duration = f"{measure(SlidingWindow, window_size) * 1_000_000:.2f}"
+        else:
+            sliding_duration = "-"
+        indexed_duration = measure(IndexedSlidingWindow, window_size)
+        print(f"{window_size:>10} {sliding_duration:>20} {indexed_duration * 1_000_000:>27.2f}")
+
+
+if __name__ == "__main__":
+    main()
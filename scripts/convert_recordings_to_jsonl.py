@@ -0,0 +1,22 @@
+"""
+Convert YAML recording files to the JSON Lines recording format (RECORDING_FORMAT=jsonl).
+The converted files are written alongside the YAML files.
+
+Run from the root of the repo:
+    python scripts/convert_recordings_to_jsonl.py [recording_dir]
+"""
+
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "aoai-simulated-api", "src"))
+
+# pylint: disable-next=wrong-import-position
+from aoai_simulated_api.record_replay.persistence import convert_yaml_recordings
+
+logging.basicConfig(level=logging.INFO)
+
+recording_dir = sys.argv[1] if len(sys.argv) > 1 else ".recording"
+converted_paths = convert_yaml_recordings(recording_dir)
+print(f"Converted {len(converted_paths)} recording file(s) in {recording_dir}")
@@ -5,12 +5,14 @@ from fastapi import Depends, FastAPI, Request, Response, HTTPException
 
 from aoai_simulated_api.auth import validate_api_key_header
 from aoai_simulated_api.config_loader import get_config, set_config
+from aoai_simulated_api.executor import configure_executor
 from aoai_simulated_api.generator.manager import invoke_generators
 from aoai_simulated_api.latency import LatencyGenerator
 from aoai_simulated_api.limiters import apply_limits
-from aoai_simulated_api.models import RequestContext
+from aoai_simulated_api.models import ChatCompletionStreamingLatency, RequestContext
 from aoai_simulated_api.record_replay.handler import RecordReplayHandler
-from aoai_simulated_api.record_replay.persistence import YamlRecordingPersister
+from aoai_simulated_api.record_replay.matching import RequestMatcher
+from aoai_simulated_api.record_replay.persistence import create_recording_persister
 
 
 logger = logging.getLogger(__name__)
@@ -34,19 +36,37 @@ def apply_config():
     if get_config().simulator_mode in ["record", "replay"]:
         logger.info("📼 Recording directory                     : %s", get_config().recording.dir)
         logger.info("📼 Recording auto-save                     : %s", get_config().recording.autosave)
-        persister = YamlRecordingPersister(get_config().recording.dir)
+        logger.info("📼 Recording format                        : %s", get_config().recording.format)
+        logger.info("📼 Request match mode                      : %s", get_config().recording.match_mode)
+        similarity_threshold = None
+        if get_config().recording.similarity_match:
+            similarity_threshold = get_config().recording.similarity_threshold
+            logger.info("📼 Similarity match threshold              : %s", similarity_threshold)
+        persister = create_recording_persister(get_config().recording.format, get_config().recording.dir)
 
         record_replay_handler = RecordReplayHandler(
             simulator_mode=get_config().simulator_mode,
             persister=persister,
             forwarders=get_config().recording.forwarders,
             autosave=get_config().recording.autosave,
+            stream_timing_scale=get_config().recording.stream_timing_scale,
+            cache_max_bytes=get_config().recording.cache_max_bytes,
+            request_matcher=RequestMatcher.from_recording_config(get_config().recording),
+            similarity_threshold=similarity_threshold,
         )
+        if get_config().recording.preload:
+            # load the recordings before handling requests to avoid loading them on the first requests
+            record_replay_handler.preload(get_config().recording.preload_max_workers)
     else:
         logger.info("📝 allow_undefined_openai_deployments      : %s", get_config().allow_undefined_openai_deployments)
+        if get_config().response_pool.size > 0:
+            logger.info("📝 Response pool size                      : %s", get_config().response_pool.size)
 
     logger.info("📝 Using OpenAI deployments                : %s", get_config().openai_deployments)
     logger.info("📝 Using latencies                         : %s", get_config().latency)
+    logger.info("📝 Using executor                          : %s", get_config().executor)
+
+    configure_executor(get_config().executor)
 
 
 def _default_validate_api_key_header(request: Request):
@@ -70,6 +90,15 @@ def save_recordings(_: Annotated[bool, Depends(_default_validate_api_key_header)
     return Response(content="⚠️ Not saving recordings as not in record mode", status_code=400)
 
 
+def _get_streaming_latency_config(streaming_latency: ChatCompletionStreamingLatency) -> dict:
+    return {
+        "ttft_mean": streaming_latency.ttft_mean,
+        "ttft_std_dev": streaming_latency.ttft_std_dev,
+        "per_token_mean": streaming_latency.per_token_mean,
+        "per_token_std_dev": streaming_latency.per_token_std_dev,
+    }
+
+
 @app.get("/++/config")
 def config_get(_: Annotated[bool, Depends(_default_validate_api_key_header)]):
     # return a subset of the config as not all properties make sense (e.g. generator functions)
@@ -89,10 +118,21 @@ def config_get(_: Annotated[bool, Depends(_default_validate_api_key_header)]):
                 "mean": config.latency.open_ai_chat_completions.mean,
                 "std_dev": config.latency.open_ai_chat_completions.std_dev,
             },
+            "open_ai_chat_completions_streaming": _get_streaming_latency_config(
+                config.latency.open_ai_chat_completions_streaming
+            ),
         },
         "openai_deployments": (
             {
-                name: {"tokens_per_minute": deployment.tokens_per_minute, "model": deployment.model}
+                name: {
+                    "tokens_per_minute": deployment.tokens_per_minute,
+                    "model": deployment.model,
+                    "streaming_latency": (
+                        _get_streaming_latency_config(deployment.streaming_latency)
+                        if deployment.streaming_latency
+                        else None
+                    ),
+                }
                 for name, deployment in config.openai_deployments.items()
             }
             if config.openai_deployments
@@ -118,6 +158,12 @@ def config_patch(config: dict, _: Annotated[bool, Depends(_default_validate_api_
             new_config.latency.open_ai_chat_completions = original_config.latency.open_ai_chat_completions.model_copy(
                 update=config["latency"]["open_ai_chat_completions"]
             )
+        if "open_ai_chat_completions_streaming" in config["latency"]:
+            new_config.latency.open_ai_chat_completions_streaming = (
+                original_config.latency.open_ai_chat_completions_streaming.model_copy(
+                    update=config["latency"]["open_ai_chat_completions_streaming"]
+                )
+            )
         if "open_ai_embeddings" in config["latency"]:
             new_config.latency.open_ai_embeddings = original_config.latency.open_ai_embeddings.model_copy(
                 update=config["latency"]["open_ai_embeddings"]
@@ -6,9 +6,16 @@ import os
 import sys
 
 from aoai_simulated_api.limiters import get_default_limiters
-from aoai_simulated_api.models import Config, OpenAIDeployment
+from aoai_simulated_api.models import (
+    ChatCompletionStreamingLatency,
+    Config,
+    OpenAIDeployment,
+    RequestMatchRule,
+    UpstreamEndpoint,
+)
 from aoai_simulated_api.record_replay.handler import get_default_forwarders
 from aoai_simulated_api.generator.manager import get_default_generators
+from aoai_simulated_api.generator.routing import get_route_index
 
 
 def get_config_from_env_vars(logger: logging.Logger) -> Config:
@@ -17,6 +24,8 @@ def get_config_from_env_vars(logger: logging.Logger) -> Config:
     """
     config = Config(generators=get_default_generators())
     config.recording.forwarders = get_default_forwarders()
+    config.recording.upstream_endpoints = _load_upstream_endpoints(logger)
+    config.recording.match_rules = _load_request_match_rules(logger)
     config.openai_deployments = _load_openai_deployments(logger)
 
     if not config.openai_deployments:
@@ -33,6 +42,10 @@ def initialize_config(config: Config):
     # load extension and invoke to update config (customise forwarders, generators, etc.)
     load_extension(config)
 
+    # compile the routes declared by the generators (including any added by the extension)
+    if config.generators:
+        get_route_index(config.generators)
+
 
 def _load_openai_deployments(logger: logging.Logger) -> dict[str, OpenAIDeployment]:
     openai_deployment_config_path = os.getenv("OPENAI_DEPLOYMENT_CONFIG_PATH")
@@ -57,10 +70,71 @@ def _load_openai_deployments(logger: logging.Logger) -> dict[str, OpenAIDeployme
             model=deployment["model"],
             tokens_per_minute=deployment["tokensPerMinute"],
             embedding_size=deployment.get("embeddingSize", 1536),
+            streaming_latency=_load_streaming_latency(deployment.get("streamingLatency")),
         )
     return deployments
 
 
+def _load_upstream_endpoints(logger: logging.Logger) -> list[UpstreamEndpoint]:
+    upstream_config_path = os.getenv("RECORDING_UPSTREAM_CONFIG_PATH")
+
+    if not upstream_config_path:
+        return []
+
+    if not os.path.isabs(upstream_config_path):
+        upstream_config_path = os.path.abspath(upstream_config_path)
+
+    if not os.path.exists(upstream_config_path):
+        logger.error("Upstream endpoint configuration file not found: %s", upstream_config_path)
+        return []
+
+    with open(upstream_config_path, encoding="utf-8") as f:
+        config_json = json.load(f)
+    return [
+        UpstreamEndpoint(name=endpoint_name, endpoint=endpoint["endpoint"], key=endpoint["key"])
+        for endpoint_name, endpoint in config_json.items()
+    ]
+
+
+def _load_request_match_rules(logger: logging.Logger) -> list[RequestMatchRule]:
+    match_rules_path = os.getenv("RECORDING_MATCH_RULES_PATH")
+
+    if not match_rules_path:
+        return []
+
+    if not os.path.isabs(match_rules_path):
+        match_rules_path = os.path.abspath(match_rules_path)
+
+    if not os.path.exists(match_rules_path):
+        logger.error("Request match rules file not found: %s", match_rules_path)
+        return []
+
+    with open(match_rules_path, encoding="utf-8") as f:
+        config_json = json.load(f)
+    return [RequestMatchRule(route=rule["route"], ignored_fields=rule["ignoredFields"]) for rule in config_json]
+
+
+def _load_streaming_latency(streaming_latency_config: dict | None) -> ChatCompletionStreamingLatency | None:
+    if not streaming_latency_config:
+        return None
+
+    # map from the config file property names to the settings field names
+    # unspecified values use the defaults (including LATENCY_OPENAI_CHAT_COMPLETIONS_STREAMING_* env vars)
+    property_names = {
+        "ttftMean": "ttft_mean",
+        "ttftStdDev": "ttft_std_dev",
+        "perTokenMean": "per_token_mean",
+        "perTokenStdDev": "per_token_std_dev",
+    }
+    fields = ChatCompletionStreamingLatency.model_fields
+    values = {
+        fields[field_name].alias: streaming_latency_config[property_name]
+        for property_name, field_name in property_names.items()
+        if property_name in streaming_latency_config
+    }
+    return ChatCompletionStreamingLatency(**values)
+
+
 def _default_openai_deployments() -> dict[str, OpenAIDeployment]:
     # Default set of OpenAI deployment configurations for when none are provided
     return {
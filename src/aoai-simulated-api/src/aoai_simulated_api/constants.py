@@ -33,6 +33,10 @@ SIMULATOR_KEY_OPENAI_MAX_TOKENS_REQUESTED = "X-OpenAI-Max-Tokens-Requested"
 SIMULATOR_KEY_OPENAI_MAX_TOKENS_EFFECTIVE = "X-OpenAI-Max-Tokens-Effective"
 
 
+# SIMULATOR_KEY_STREAMING_LATENCY_APPLIED is set to True by generators that apply latency while streaming
+# the response, so that LatencyGenerator doesn't add TARGET_DURATION_MS latency on top
+SIMULATOR_KEY_STREAMING_LATENCY_APPLIED = "Simulator-Streaming-Latency-Applied"
+
 # TARGET_DURATION_MS stores the target duration of the request in milliseconds
 # For recorded requests this will be the recorded duration
 # For generated requests this will be estimated based on the request type and response length
@@ -0,0 +1,115 @@
+"""
+Runs CPU-heavy work (e.g. tokenizing large prompts or generating embeddings) off the event loop.
+
+Generators run on the event loop, so a single large request would otherwise delay every other
+in-flight request on the worker (including streamed responses waiting to send their next chunk).
+Work that is larger than the configured min_offload_size is run in a thread pool (tiktoken and numpy
+release the GIL for the heavy lifting) or a process pool. Smaller work is run inline as the cost of
+handing off to the pool outweighs the benefit.
+"""
+
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import functools
+import importlib
+import logging
+import multiprocessing
+from typing import Awaitable, Callable, TypeVar
+
+from aoai_simulated_api.models import ExecutorConfig
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_executor_config = ExecutorConfig()
+_executor: Executor | None = None
+
+# functions decorated with offload, keyed by module and qualified name so that
+# process pool workers can look up the original (undecorated) function
+_offloaded_functions: dict[tuple[str, str], Callable] = {}
+
+
+def configure_executor(executor_config: ExecutorConfig):
+    """Sets the executor configuration, replacing any existing executor if the configuration has changed"""
+    global _executor_config, _executor  # pylint: disable=global-statement
+    if executor_config == _executor_config:
+        return
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+    _executor_config = executor_config
+
+
+def _get_executor() -> Executor:
+    global _executor  # pylint: disable=global-statement
+    if _executor is None:
+        if _executor_config.type == "process":
+            # use spawn rather than fork so that workers don't inherit the server's sockets and threads
+            _executor = ProcessPoolExecutor(
+                max_workers=_executor_config.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=_executor_config.max_workers, thread_name_prefix="aoai-simulator-executor"
+            )
+        logger.info("Created %s executor (max_workers=%s)", _executor_config.type, _executor_config.max_workers)
+    return _executor
+
+
+def should_offload(size: int) -> bool:
+    return _executor_config.type != "none" and size >= _executor_config.min_offload_size
+
+
+async def run_in_executor(func: Callable[..., T], *args, size: int, **kwargs) -> T:
+    """
+    Runs func(*args, **kwargs) in the executor if size is at least the configured min_offload_size,
+    otherwise runs it inline. With a process pool, func and its arguments must be picklable
+    (e.g. func must be a module-level function)
+    """
+    if not should_offload(size):
+        return func(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def offload(get_size: Callable[..., int]) -> Callable[[Callable[..., T]], Callable[..., Awaitable[T]]]:
+    """
+    Decorator to make a synchronous function awaitable and run it in the executor when
+    get_size (called with the same arguments as the function) is at least the configured min_offload_size.
+
+    For example:
+
+        @offload(get_size=lambda text: len(text))
+        def count_words(text: str) -> int:
+            return len(text.split())
+
+        word_count = await count_words(text)
+    """
+
+    def decorator(func: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+        key = (func.__module__, func.__qualname__)
+        _offloaded_functions[key] = func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs) -> T:
+            size = get_size(*args, **kwargs)
+            if not should_offload(size):
+                return func(*args, **kwargs)
+            if _executor_config.type == "process":
+                # the decorated function can't be pickled, so look it up by name in the worker process
+                return await run_in_executor(_invoke_offloaded_function, key, args, kwargs, size=size)
+            return await run_in_executor(func, *args, size=size, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _invoke_offloaded_function(key: tuple[str, str], args: tuple, kwargs: dict):
+    func = _offloaded_functions.get(key)
+    if func is None:
+        # importing the module registers its decorated functions
+        importlib.import_module(key[0])
+        func = _offloaded_functions[key]
+    return func(*args, **kwargs)
@@ -6,6 +6,7 @@ from fastapi import HTTPException, Response
 
 from aoai_simulated_api.models import RequestContext
 from .openai import azure_openai_embedding, azure_openai_completion, azure_openai_chat_completion
+from .routing import get_route_index
 
 logger = logging.getLogger(__name__)
 
@@ -21,8 +22,12 @@ def get_default_generators() -> list[Callable[[RequestContext], Response | Await
 async def invoke_generators(
     context: RequestContext, generators: list[Callable[[RequestContext], Response | Awaitable[Response] | None]]
 ):
-    for generator in generators:
+    route_index = get_route_index(generators)
+    request = context.request
+    for generator, path_params in route_index.get_candidates(request.method, request.url.path):
         try:
+            if path_params is not None:
+                context.path_params = path_params
             response = generator(context=context)
             if response is not None and inspect.isawaitable(response):
                 response = await response
@@ -1,4 +1,6 @@
 import asyncio
+import base64
+from dataclasses import dataclass
 import json
 import logging
 import time
@@ -6,6 +8,8 @@ import random
 from typing import Tuple
 
 import nanoid
+import numpy as np
+import orjson
 
 
 from fastapi import Response
@@ -13,7 +17,9 @@ from fastapi.responses import StreamingResponse
 
 from aoai_simulated_api import constants
 from aoai_simulated_api.auth import validate_api_key_header
-from aoai_simulated_api.models import RequestContext, OpenAIDeployment
+from aoai_simulated_api.executor import run_in_executor
+from aoai_simulated_api.metrics import simulator_metrics
+from aoai_simulated_api.models import ChatCompletionStreamingLatency, RequestContext, OpenAIDeployment
 from aoai_simulated_api.constants import (
     SIMULATOR_KEY_DEPLOYMENT_NAME,
     SIMULATOR_KEY_OPENAI_PROMPT_TOKENS,
@@ -24,11 +30,25 @@ from aoai_simulated_api.constants import (
     SIMULATOR_KEY_OPENAI_MAX_TOKENS_REQUESTED,
     SIMULATOR_KEY_OPENAI_MAX_TOKENS_EFFECTIVE,
 )
+from aoai_simulated_api.generator.openai_streaming import (
+    SSE_DONE_EVENT,
+    ChatCompletionChunkRenderer,
+    split_text_into_token_chunks,
+)
+from aoai_simulated_api.generator.response_pool import (
+    ResponseTemplate,
+    get_max_tokens_bucket,
+    placeholder,
+    response_pool,
+)
 from aoai_simulated_api.generator.openai_tokens import (
+    get_encoding_for_model,
     get_max_completion_tokens,
     num_tokens_from_string,
+    num_tokens_from_strings,
     num_tokens_from_messages,
 )
+from aoai_simulated_api.generator.routing import generator_route
 
 # This file contains a default implementation of the openai generators
 # You can configure your own generators by creating a generator_config.py file and setting the
@@ -93,6 +113,19 @@ def get_embedding_model_from_deployment_name(context: RequestContext, deployment
     return None
 
 
+def get_streaming_latency(context: RequestContext, deployment_name: str) -> ChatCompletionStreamingLatency:
+    """
+    Gets the streaming latency config for the deployment, falling back to the
+    latency.open_ai_chat_completions_streaming config if the deployment doesn't override it
+    """
+    deployments = context.config.openai_deployments
+    if deployments:
+        deployment = deployments.get(deployment_name)
+        if deployment and deployment.streaming_latency:
+            return deployment.streaming_latency
+    return context.config.latency.open_ai_chat_completions_streaming
+
+
 def get_model_name_from_deployment_name(context: RequestContext, deployment_name: str) -> str | None:
     """
     Gets the model name for the specified deployment.
@@ -153,13 +186,20 @@ async def calculate_latency(context: RequestContext, status_code: int):
             context.values[constants.TARGET_DURATION_MS] = target_duration_ms
 
 
-def create_embedding_content(index: int, embedding_size):
-    """Generates a random embedding"""
-    return {
-        "object": "embedding",
-        "index": index,
-        "embedding": [(random.random() - 0.5) * 4 for _ in range(embedding_size)],
-    }
+embedding_rng = np.random.default_rng()
+
+
+def generate_embeddings(count: int, embedding_size: int) -> np.ndarray:
+    """Generates a (count, embedding_size) matrix of random embeddings"""
+    embeddings = embedding_rng.random((count, embedding_size), dtype=np.float32)
+    embeddings -= 0.5
+    embeddings *= 4
+    return embeddings
+
+
+def model_supports_embedding_dimensions(model_name: str) -> bool:
+    # Only the text-embedding-3 and later models support the dimensions parameter
+    return model_name.startswith("text-embedding-3")
 
 
 def create_embeddings_response(
@@ -167,26 +207,67 @@ def create_embeddings_response(
     deployment_name: str,
     deployment: OpenAIDeployment,
     request_input: str | list,
+    encoding_format: str = "float",
+    dimensions: int | None = None,
 ):
-    embeddings = []
+    """
+    Creates a Response object for an embeddings request and sets context values for the rate-limiter etc.
+    encoding_format is "float" (JSON arrays of numbers) or "base64" (base64-encoded little-endian float32 values).
+    If dimensions is specified, embeddings of that size are generated instead of deployment.embedding_size
+    """
+    content, tokens = create_embeddings_content(
+        model_name=deployment.model,
+        request_input=request_input,
+        embedding_size=dimensions or deployment.embedding_size,
+        encoding_format=encoding_format,
+    )
+    return _create_embeddings_response_from_content(context, deployment_name, content, tokens)
+
+
+def create_embeddings_content(
+    model_name: str,
+    request_input: str | list,
+    embedding_size: int,
+    encoding_format: str = "float",
+) -> tuple[bytes, int]:
+    """
+    Creates the response body for an embeddings request.
+    Returns the body and the number of prompt tokens.
+    Doesn't depend on the request context so that it can be run in the executor
+    """
     if isinstance(request_input, str):
-        tokens = num_tokens_from_string(request_input, deployment.model)
-        embeddings.append(create_embedding_content(0, embedding_size=deployment.embedding_size))
+        request_input = [request_input]
+    tokens = sum(num_tokens_from_strings(request_input, model_name))
+
+    embeddings = generate_embeddings(len(request_input), embedding_size)
+
+    if encoding_format == "base64":
+        # float32 values are serialized as little-endian bytes as per the OpenAI API
+        embeddings = embeddings.astype("<f4", copy=False)
+        data = [
+            {"object": "embedding", "index": index, "embedding": base64.b64encode(embedding.tobytes()).decode("ascii")}
+            for index, embedding in enumerate(embeddings)
+        ]
     else:
-        tokens = 0
-        index = 0
-        for i in request_input:
-            tokens += num_tokens_from_string(i, deployment.model)
-            embeddings.append(create_embedding_content(index, embedding_size=deployment.embedding_size))
-            index += 1
+        data = [
+            {"object": "embedding", "index": index, "embedding": embedding}
+            for index, embedding in enumerate(embeddings)
+        ]
 
     response_data = {
         "object": "list",
-        "data": embeddings,
-        "model": deployment.model,
+        "data": data,
+        "model": model_name,
         "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
     }
 
+    # orjson serializes the numpy arrays in bulk
+    return orjson.dumps(response_data, option=orjson.OPT_SERIALIZE_NUMPY), tokens
+
+
+def _create_embeddings_response_from_content(
+    context: RequestContext, deployment_name: str, content: bytes, tokens: int
+) -> Response:
     # store values in the context for use by the rate-limiter etc
     context.values[SIMULATOR_KEY_LIMITER] = "openai"
     context.values[SIMULATOR_KEY_OPERATION_NAME] = "embeddings"
@@ -196,90 +277,13 @@ def create_embeddings_response(
 
     return Response(
         status_code=200,
-        content=json.dumps(response_data),
+        content=content,
         headers={
             "Content-Type": "application/json",
         },
     )
 
 
-def get_lorem_factor(max_tokens: int):
-    # Use a sliding factor for the number of words to generate based on the max_tokens
-    if max_tokens > 500:
-        return 0.72
-    if max_tokens > 100:
-        return 0.6
-    return 0.5
-
-
-class LoremReference:
-    """
-    Generating large amounts of lorem text can be slow, so we pre-generate a set of reference values.
-    These are then combined to generate the required amount of text for API requests
-    """
-
-    model_name: str
-    values: dict[int, list[str]]
-    token_sizes: list[int]
-
-    def __init__(self, model_name: str, reference_values: dict[int, list[str]]):
-        self.model_name = model_name
-        self.values = reference_values
-        self.token_sizes = sorted(reference_values.keys(), reverse=True)
-
-    def get_value_for_size(self, size: int) -> Tuple[str, int] | None:
-        for token_size in self.token_sizes:
-            if token_size <= size:
-                values = self.values[token_size]
-                value = random.choice(values)
-                return (value, token_size)
-        return None
-
-
-lorem_reference_values: dict[str, LoremReference] = {}
-
-
-def generate_lorem_reference_text_values(token_values: list[int], model_name: str):
-    value_count = 5  # number of reference values of each size to generate
-    values = {}
-    for max_tokens in token_values:
-        generated_texts = [raw_generate_lorem_text(max_tokens, model_name) for _ in range(value_count)]
-        values[max_tokens] = generated_texts
-
-    return LoremReference(model_name, values)
-
-
-def generate_lorem_text(max_tokens: int, model_name: str):
-    text = ""
-    target = max_tokens
-
-    if model_name not in lorem_reference_values:
-        logger.info("Generating lorem reference values for model %s...", model_name)
-        start_time = time.perf_counter()
-        token_sizes = [2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 4000]
-        lorem_reference_values[model_name] = generate_lorem_reference_text_values(token_sizes, model_name)
-        duration = time.perf_counter() - start_time
-        logger.info("Generated lorem reference values for model %s (took %ss)", model_name, duration)
-    reference_values = lorem_reference_values[model_name]
-
-    separator = ""
-    while target > 0:
-        value = reference_values.get_value_for_size(target)
-        if value is None:
-            break
-        new_text, size = value
-        text += separator + new_text
-        separator = " "
-        target -= size
-
-    while num_tokens_from_string(text, model_name) > max_tokens:
-        # remove last word
-        last_space = text.rfind(" ")
-        text = text[:last_space]
-
-    return text
-
-
 lorem_words = [
     "ullamco",
     "labore",
@@ -351,60 +355,169 @@ def raw_lorem_get_word(count: int = 1) -> str:
     return " ".join([random.choice(lorem_words) for _ in range(count)])
 
 
-def raw_generate_lorem_text(max_tokens: int, model_name: str) -> str:
-    # The simplest approach to generating the compltion would
-    # be to add a word at a time and count the tokens until we reach the limit
-    # For large max_token values that will be slow, so we
-    # estimate the number of words to generate based on the max_tokens
-    # and then measure the number of tokens in that text
-    # Then we repeat for the remaining token count
-    # (allowing for some degree of error as tokens don't exactly combine that way )
-    target = max_tokens
-    full_text = ""
-    sep = ""
-    while target > 5:
-        factor = get_lorem_factor(target)
-        init_word_count = int(factor * target)
-        # text = lorem.get_word(count=init_word_count)
-        text = raw_lorem_get_word(count=init_word_count)
-        used = num_tokens_from_string(text, model_name)
-        if used > target:
-            break
-        full_text += sep + text
-        sep = " "
-        target -= used
-        target -= 2  # allow for space and error margin in token count addition
-
-    # Now top up the text to the max_tokens
-    # by adding a word at a time
-    while True:
-        new_text = full_text + " " + raw_lorem_get_word()  # lorem.get_word()
-        if num_tokens_from_string(new_text, model_name) > max_tokens:
-            break
-        full_text = new_text
-
-    return full_text
+class LoremVocabulary:
+    """
+    The lorem words pre-tokenized with the encoding for a model.
 
+    Generated text is lorem words joined by single spaces. Each word starts with a letter, so the
+    tokenizer splits the text at the word boundaries and the token count for the text is the sum of
+    the token counts for the words. This allows text with an exact token count to be generated
+    without re-tokenizing it.
+    """
 
-def create_completion_response(
+    model_name: str
+    words: list[str]
+    first_word_token_counts: list[int]
+    word_token_counts: list[int]
+    max_word_token_count: int
+
+    def __init__(self, model_name: str, words: list[str]):
+        encoding = get_encoding_for_model(model_name)
+        self.model_name = model_name
+        self.words = words
+        # the first word has no leading space, subsequent words are preceded by a space
+        self.first_word_token_counts = [len(encoding.encode(word)) for word in words]
+        self.word_token_counts = [len(encoding.encode(" " + word)) for word in words]
+        self.max_word_token_count = max(self.word_token_counts)
+        self._word_indices = range(len(words))
+        # _first_word_candidates[n] / _word_candidates[n] are the indices of words with at most n tokens
+        self._first_word_candidates = self._get_candidates(self.first_word_token_counts)
+        self._word_candidates = self._get_candidates(self.word_token_counts)
+
+    @staticmethod
+    def _get_candidates(token_counts: list[int]) -> list[list[int]]:
+        return [
+            [index for index, token_count in enumerate(token_counts) if token_count <= size]
+            for size in range(max(token_counts) + 1)
+        ]
+
+    def generate(self, max_tokens: int) -> Tuple[str, int]:
+        """
+        Generates lorem text with max_tokens tokens (or fewer if max_tokens is less than the
+        size of the smallest word) and returns a tuple of the text and its token count
+        """
+        if max_tokens <= 0:
+            return ("", 0)
+
+        word_token_counts = self.word_token_counts
+        first_candidates = self._first_word_candidates[min(max_tokens, len(self._first_word_candidates) - 1)]
+        if not first_candidates:
+            return ("", 0)
+
+        first_index = random.choice(first_candidates)
+        indices = [first_index]
+        remaining = max_tokens - self.first_word_token_counts[first_index]
+
+        # Add words in batches that cannot exceed the remaining token count
+        while remaining >= self.max_word_token_count:
+            batch = random.choices(self._word_indices, k=remaining // self.max_word_token_count)
+            indices.extend(batch)
+            remaining -= sum(map(word_token_counts.__getitem__, batch))
+
+        # Then top up one word at a time with words that fit in the remaining token count
+        while remaining > 0:
+            candidates = self._word_candidates[remaining]
+            if not candidates:
+                break
+            index = random.choice(candidates)
+            indices.append(index)
+            remaining -= word_token_counts[index]
+
+        text = " ".join(map(self.words.__getitem__, indices))
+        return (text, max_tokens - remaining)
+
+
+lorem_vocabularies: dict[str, LoremVocabulary] = {}
+
+
+def get_lorem_vocabulary(model_name: str) -> LoremVocabulary:
+    vocabulary = lorem_vocabularies.get(model_name)
+    if vocabulary is None:
+        vocabulary = LoremVocabulary(model_name, lorem_words)
+        lorem_vocabularies[model_name] = vocabulary
+    return vocabulary
+
+
+def generate_lorem_text_with_token_count(max_tokens: int, model_name: str) -> Tuple[str, int]:
+    """
+    Generates lorem text with max_tokens tokens for the model and returns a tuple of the text and its token count
+    """
+    return get_lorem_vocabulary(model_name).generate(max_tokens)
+
+
+def generate_lorem_text(max_tokens: int, model_name: str) -> str:
+    text, _ = generate_lorem_text_with_token_count(max_tokens, model_name)
+    return text
+
+
+# approximate size of generated lorem text per token (used to decide whether to offload generation)
+lorem_bytes_per_token = 6
+
+
+@dataclass
+class LoremContent:
+    text: str
+    completion_tokens: int
+    # the text split into chunks for streaming (None when not streaming)
+    stream_chunks: list[str] | None = None
+
+
+def generate_lorem_content(max_tokens: int, model_name: str, tokens_per_chunk: int | None = None) -> LoremContent:
+    """
+    Generates lorem text with max_tokens tokens for the model.
+    If tokens_per_chunk is specified, the text is also split into chunks for streaming
+    """
+    text, completion_tokens = generate_lorem_text_with_token_count(max_tokens=max_tokens, model_name=model_name)
+    stream_chunks = None
+    if tokens_per_chunk is not None:
+        # always send at least one content chunk so that the role is included in the stream
+        stream_chunks = split_text_into_token_chunks(text, model_name, tokens_per_chunk) or [""]
+    return LoremContent(text=text, completion_tokens=completion_tokens, stream_chunks=stream_chunks)
+
+
+async def generate_lorem_content_in_executor(
+    max_tokens: int, model_name: str, tokens_per_chunk: int | None = None
+) -> LoremContent:
+    """Generates lorem content, running in the executor for larger max_tokens values"""
+    return await run_in_executor(
+        generate_lorem_content,
+        max_tokens,
+        model_name,
+        tokens_per_chunk,
+        size=max_tokens * lorem_bytes_per_token,
+    )
+
+
+def _set_token_context_values(
     context: RequestContext,
+    operation_name: str,
     deployment_name: str,
-    model_name: str,
     prompt_tokens: int,
-    max_tokens: int,
+    completion_tokens: int,
+    total_tokens: int,
 ):
-    """
-    Creates a Response object for a completion request and sets context values for the rate-limiter etc
-    """
-    text = generate_lorem_text(max_tokens=max_tokens, model_name=model_name)
+    # store values in the context for use by the rate-limiter etc
+    context.values[SIMULATOR_KEY_LIMITER] = "openai"
+    context.values[SIMULATOR_KEY_OPERATION_NAME] = operation_name
+    context.values[SIMULATOR_KEY_DEPLOYMENT_NAME] = deployment_name
+    context.values[SIMULATOR_KEY_OPENAI_PROMPT_TOKENS] = prompt_tokens
+    context.values[SIMULATOR_KEY_OPENAI_COMPLETION_TOKENS] = completion_tokens
+    context.values[SIMULATOR_KEY_OPENAI_TOTAL_TOKENS] = total_tokens
 
-    completion_tokens = num_tokens_from_string(text, model_name)
-    total_tokens = prompt_tokens + completion_tokens
 
-    response_body = {
-        "id": "cmpl-" + nanoid.non_secure_generate(size=29),
+def _create_completion_body(
+    completion_id: str,
+    created: int | str,
+    model_name: str,
+    text: str,
+    prompt_tokens: int | str,
+    completion_tokens: int,
+    total_tokens: int | str,
+) -> dict:
+    return {
+        "id": completion_id,
         "object": "text_completion",
-        "created": int(time.time()),
+        "created": created,
         "model": model_name,
         "choices": [
             {
@@ -421,16 +534,75 @@ def create_completion_response(
         },
     }
 
-    # store values in the context for use by the rate-limiter etc
-    context.values[SIMULATOR_KEY_LIMITER] = "openai"
-    context.values[SIMULATOR_KEY_OPERATION_NAME] = "completions"
-    context.values[SIMULATOR_KEY_DEPLOYMENT_NAME] = deployment_name
-    context.values[SIMULATOR_KEY_OPENAI_PROMPT_TOKENS] = prompt_tokens
-    context.values[SIMULATOR_KEY_OPENAI_COMPLETION_TOKENS] = completion_tokens
-    context.values[SIMULATOR_KEY_OPENAI_TOTAL_TOKENS] = total_tokens
+
+def _create_completion_template(model_name: str, max_tokens: int) -> ResponseTemplate:
+    text, completion_tokens = generate_lorem_text_with_token_count(max_tokens=max_tokens, model_name=model_name)
+    body = _create_completion_body(
+        completion_id=placeholder("id"),
+        created=placeholder("created"),
+        model_name=model_name,
+        text=text,
+        prompt_tokens=placeholder("prompt_tokens"),
+        completion_tokens=completion_tokens,
+        total_tokens=placeholder("total_tokens"),
+    )
+    return ResponseTemplate(body, completion_tokens)
+
+
+def create_completion_response(
+    context: RequestContext,
+    deployment_name: str,
+    model_name: str,
+    prompt_tokens: int,
+    max_tokens: int,
+    lorem_content: LoremContent | None = None,
+):
+    """
+    Creates a Response object for a completion request and sets context values for the rate-limiter etc
+    If lorem_content is specified (and the response pool is disabled), it is used instead of generating lorem text
+    """
+    completion_id = "cmpl-" + nanoid.non_secure_generate(size=29)
+    created = int(time.time())
+
+    pool_config = context.config.response_pool
+    if pool_config.size > 0:
+        bucket = get_max_tokens_bucket(max_tokens, pool_config.bucket_size)
+        template = response_pool.get_template(
+            key=("completion", model_name, bucket),
+            size=pool_config.size,
+            factory=lambda: _create_completion_template(model_name, bucket),
+        )
+        completion_tokens = template.completion_tokens
+        total_tokens = prompt_tokens + completion_tokens
+        content = template.render(
+            {
+                "id": completion_id,
+                "created": created,
+                "prompt_tokens": prompt_tokens,
+                "total_tokens": total_tokens,
+            }
+        )
+    else:
+        if lorem_content is None:
+            lorem_content = generate_lorem_content(max_tokens=max_tokens, model_name=model_name)
+        text = lorem_content.text
+        completion_tokens = lorem_content.completion_tokens
+        total_tokens = prompt_tokens + completion_tokens
+        response_body = _create_completion_body(
+            completion_id=completion_id,
+            created=created,
+            model_name=model_name,
+            text=text,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=total_tokens,
+        )
+        content = json.dumps(response_body)
+
+    _set_token_context_values(context, "completions", deployment_name, prompt_tokens, completion_tokens, total_tokens)
 
     return Response(
-        content=json.dumps(response_body),
+        content=content,
         headers={
             "Content-Type": "application/json",
         },
@@ -446,14 +618,34 @@ def create_lorem_chat_completion_response(
     max_tokens: int,
     prompt_messages: list,
     finish_reason: str = "length",
+    prompt_tokens: int | None = None,
+    lorem_content: LoremContent | None = None,
 ):
     """
     Creates a Response object for a chat completion request by generating
     lorem ipsum text and sets context values for the rate-limiter etc.
-    Handles streaming vs non-streaming
+    Handles streaming vs non-streaming.
+    If prompt_tokens is not specified, it is calculated by tokenizing prompt_messages.
+    If lorem_content is specified (and the response pool isn't used), it is used instead of generating lorem text
     """
 
-    text = generate_lorem_text(max_tokens=max_tokens, model_name=model_name)
+    pool_config = context.config.response_pool
+    if pool_config.size > 0 and not streaming:
+        return _create_pooled_chat_completion_response(
+            context=context,
+            deployment_name=deployment_name,
+            model_name=model_name,
+            max_tokens=max_tokens,
+            prompt_messages=prompt_messages,
+            finish_reason=finish_reason,
+            prompt_tokens=prompt_tokens,
+        )
+
+    if lorem_content is None:
+        tokens_per_chunk = context.config.streaming.tokens_per_chunk if streaming else None
+        lorem_content = generate_lorem_content(
+            max_tokens=max_tokens, model_name=model_name, tokens_per_chunk=tokens_per_chunk
+        )
 
     return create_chat_completion_response(
         context=context,
@@ -461,8 +653,11 @@ def create_lorem_chat_completion_response(
         model_name=model_name,
         streaming=streaming,
         prompt_messages=prompt_messages,
-        generated_content=text,
+        generated_content=lorem_content.text,
         finish_reason=finish_reason,
+        completion_tokens=lorem_content.completion_tokens,
+        prompt_tokens=prompt_tokens,
+        stream_chunks=lorem_content.stream_chunks,
     )
 
 
@@ -474,106 +669,100 @@ def create_chat_completion_response(
     prompt_messages: list,
     generated_content: str,
     finish_reason: str = "length",
+    completion_tokens: int | None = None,
+    prompt_tokens: int | None = None,
+    stream_chunks: list[str] | None = None,
 ):
     """
     Creates a Response object for a chat completion request and sets context values for the rate-limiter etc.
-    Handles streaming vs non-streaming
+    Handles streaming vs non-streaming.
+    If completion_tokens/prompt_tokens are not specified, they are calculated by tokenizing
+    generated_content/prompt_messages.
+    If stream_chunks is not specified, generated_content is split into chunks for streaming
     """
 
-    prompt_tokens = num_tokens_from_messages(prompt_messages, model_name)
+    if prompt_tokens is None:
+        prompt_tokens = num_tokens_from_messages(prompt_messages, model_name)
 
     text = "".join(generated_content)
-    completion_tokens = num_tokens_from_string(text, model_name)
+    if completion_tokens is None:
+        completion_tokens = num_tokens_from_string(text, model_name)
     total_tokens = prompt_tokens + completion_tokens
 
-    # store values in the context for use by the rate-limiter etc
-    context.values[SIMULATOR_KEY_LIMITER] = "openai"
-    context.values[SIMULATOR_KEY_OPERATION_NAME] = "chat-completions"
-    context.values[SIMULATOR_KEY_DEPLOYMENT_NAME] = deployment_name
-    context.values[SIMULATOR_KEY_OPENAI_PROMPT_TOKENS] = prompt_tokens
-    context.values[SIMULATOR_KEY_OPENAI_COMPLETION_TOKENS] = completion_tokens
-    context.values[SIMULATOR_KEY_OPENAI_TOTAL_TOKENS] = total_tokens
+    _set_token_context_values(
+        context, "chat-completions", deployment_name, prompt_tokens, completion_tokens, total_tokens
+    )
 
     if streaming:
-
-        async def send_words():
-            space = ""
-            role = "assistant"
-            for word in generated_content.split(" "):
-                chunk_string = json.dumps(
-                    {
-                        "id": "chatcmpl-" + nanoid.non_secure_generate(size=29),
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model_name": model_name,
-                        "system_fingerprint": None,
-                        "choices": [
-                            {
-                                "delta": {
-                                    "content": space + word,
-                                    "function_call": None,
-                                    "role": role,
-                                    "tool_calls": None,
-                                    "finish_reason": None,
-                                    "index": 0,
-                                    "logprobs": None,
-                                    "content_filter_results": {
-                                        "hate": {"filtered": False, "severity": "safe"},
-                                        "self_harm": {"filtered": False, "severity": "safe"},
-                                        "sexual": {"filtered": False, "severity": "safe"},
-                                        "violence": {"filtered": False, "severity": "safe"},
-                                    },
-                                },
-                            },
-                        ],
-                    }
-                )
-                role = None
-
-                yield "data: " + chunk_string + "\n"
-                yield "\n"
-                await asyncio.sleep(0.05)
-                space = " "
-
-            chunk_string = json.dumps(
-                {
-                    "id": "chatcmpl-" + nanoid.non_secure_generate(size=29),
-                    "object": "chat.completion.chunk",
-                    "created": int(time.time()),
-                    "model_name": model_name,
-                    "system_fingerprint": None,
-                    "choices": [
-                        {
-                            "delta": {
-                                "content": None,
-                                "function_call": None,
-                                "role": None,
-                                "tool_calls": None,
-                                "finish_reason": finish_reason,
-                                "index": 0,
-                                "logprobs": None,
-                                "content_filter_results": {
-                                    "hate": {"filtered": False, "severity": "safe"},
-                                    "self_harm": {"filtered": False, "severity": "safe"},
-                                    "sexual": {"filtered": False, "severity": "safe"},
-                                    "violence": {"filtered": False, "severity": "safe"},
-                                },
-                            },
-                        },
-                    ],
-                }
+        renderer = ChatCompletionChunkRenderer(model_name=model_name, finish_reason=finish_reason)
+        chunks = stream_chunks
+        if chunks is None:
+            # always send at least one content chunk so that the role is included in the stream
+            chunks = split_text_into_token_chunks(text, model_name, context.config.streaming.tokens_per_chunk) or [""]
+
+        latency = get_streaming_latency(context, deployment_name)
+        tokens_per_chunk = context.config.streaming.tokens_per_chunk
+        start_time = context.start_time
+
+        async def send_chunks():
+            # Sleep until absolute target times so that time spent generating/sending doesn't accumulate
+            target_time = start_time + latency.get_ttft_value() / 1000
+            is_first = True
+            for chunk in chunks:
+                delay = target_time - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield renderer.render_content_event(chunk, is_first)
+                if is_first:
+                    is_first = False
+                    simulator_metrics.histogram_latency_ttft.record(
+                        time.perf_counter() - start_time, attributes={"deployment": deployment_name}
+                    )
+                target_time += latency.get_per_token_value() * tokens_per_chunk / 1000
+
+            yield renderer.render_finish_event()
+            yield SSE_DONE_EVENT
+            simulator_metrics.histogram_latency_stream.record(
+                time.perf_counter() - start_time, attributes={"deployment": deployment_name}
             )
 
-            yield "data: " + chunk_string + "\n"
-            yield "\n"
-            yield "[DONE]"
+        context.values[constants.SIMULATOR_KEY_STREAMING_LATENCY_APPLIED] = True
+        return StreamingResponse(content=send_chunks(), media_type="text/event-stream")
+
+    response_body = _create_chat_completion_body(
+        completion_id="chatcmpl-" + nanoid.non_secure_generate(size=29),
+        created=int(time.time()),
+        model_name=model_name,
+        text=text,
+        finish_reason=finish_reason,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=total_tokens,
+    )
+
+    return Response(
+        content=json.dumps(response_body),
+        headers={
+            "Content-Type": "application/json",
+        },
+        status_code=200,
+    )
 
-        return StreamingResponse(content=send_words())
 
-    response_body = {
-        "id": "chatcmpl-" + nanoid.non_secure_generate(size=29),
+def _create_chat_completion_body(
+    completion_id: str,
+    created: int | str,
+    model_name: str,
+    text: str,
+    finish_reason: str,
+    prompt_tokens: int | str,
+    completion_tokens: int,
+    total_tokens: int | str,
+) -> dict:
+    return {
+        "id": completion_id,
         "object": "chat.completion",
-        "created": int(time.time()),
+        "created": created,
         "model": model_name,
         "prompt_filter_results": [
             {
@@ -609,8 +798,57 @@ def create_chat_completion_response(
         },
     }
 
+
+def _create_chat_completion_template(model_name: str, max_tokens: int, finish_reason: str) -> ResponseTemplate:
+    text, completion_tokens = generate_lorem_text_with_token_count(max_tokens=max_tokens, model_name=model_name)
+    body = _create_chat_completion_body(
+        completion_id=placeholder("id"),
+        created=placeholder("created"),
+        model_name=model_name,
+        text=text,
+        finish_reason=finish_reason,
+        prompt_tokens=placeholder("prompt_tokens"),
+        completion_tokens=completion_tokens,
+        total_tokens=placeholder("total_tokens"),
+    )
+    return ResponseTemplate(body, completion_tokens)
+
+
+def _create_pooled_chat_completion_response(
+    context: RequestContext,
+    deployment_name: str,
+    model_name: str,
+    max_tokens: int,
+    prompt_messages: list,
+    finish_reason: str,
+    prompt_tokens: int | None,
+):
+    pool_config = context.config.response_pool
+    bucket = get_max_tokens_bucket(max_tokens, pool_config.bucket_size)
+    template = response_pool.get_template(
+        key=("chat", model_name, bucket, finish_reason),
+        size=pool_config.size,
+        factory=lambda: _create_chat_completion_template(model_name, bucket, finish_reason),
+    )
+
+    if prompt_tokens is None:
+        prompt_tokens = num_tokens_from_messages(prompt_messages, model_name)
+    completion_tokens = template.completion_tokens
+    total_tokens = prompt_tokens + completion_tokens
+    _set_token_context_values(
+        context, "chat-completions", deployment_name, prompt_tokens, completion_tokens, total_tokens
+    )
+
+    content = template.render(
+        {
+            "id": "chatcmpl-" + nanoid.non_secure_generate(size=29),
+            "created": int(time.time()),
+            "prompt_tokens": prompt_tokens,
+            "total_tokens": total_tokens,
+        }
+    )
     return Response(
-        content=json.dumps(response_body),
+        content=content,
         headers={
             "Content-Type": "application/json",
         },
@@ -618,22 +856,26 @@ def create_chat_completion_response(
     )
 
 
+def _create_bad_request_response(message: str) -> Response:
+    return Response(
+        status_code=400,
+        content=json.dumps({"error": {"code": "400", "message": message}}),
+        headers={
+            "Content-Type": "application/json",
+        },
+    )
+
+
 def _validate_api_key_header(context: RequestContext):
     request = context.request
     validate_api_key_header(request=request, header_name="api-key", allowed_key_value=context.config.simulator_api_key)
 
 
+@generator_route(path="/openai/deployments/{deployment}/embeddings", methods=["POST"])
 async def azure_openai_embedding(context: RequestContext) -> Response | None:
-    request = context.request
-    is_match, path_params = context.is_route_match(
-        request=request, path="/openai/deployments/{deployment}/embeddings", methods=["POST"]
-    )
-    if not is_match:
-        return None
-
     _validate_api_key_header(context)
-    deployment_name = path_params["deployment"]
-    request_body = await request.json()
+    deployment_name = context.path_params["deployment"]
+    request_body = await context.get_request_json()
     model = get_embedding_model_from_deployment_name(context, deployment_name)
 
     if model is None:
@@ -646,12 +888,34 @@ async def azure_openai_embedding(context: RequestContext) -> Response | None:
         )
     request_input = request_body["input"]
 
-    response = create_embeddings_response(
-        context=context,
-        deployment_name=deployment_name,
-        deployment=model,
+    encoding_format = request_body.get("encoding_format") or "float"
+    if encoding_format not in ("float", "base64"):
+        return _create_bad_request_response(
+            f"Invalid value for 'encoding_format': '{encoding_format}'. Supported values are 'float' and 'base64'."
+        )
+
+    dimensions = request_body.get("dimensions")
+    if dimensions is not None:
+        if not model_supports_embedding_dimensions(model.model):
+            return _create_bad_request_response("This model does not support specifying dimensions.")
+        if not isinstance(dimensions, int) or dimensions < 1 or dimensions > model.embedding_size:
+            return _create_bad_request_response(
+                f"Invalid value for 'dimensions': {dimensions}. Must be between 1 and {model.embedding_size}."
+            )
+
+    embedding_size = dimensions or model.embedding_size
+    input_count = 1 if isinstance(request_input, str) else len(request_input)
+    request_body_size = len(await context.get_request_body())
+    content, tokens = await run_in_executor(
+        create_embeddings_content,
+        model_name=model.model,
         request_input=request_input,
+        embedding_size=embedding_size,
+        encoding_format=encoding_format,
+        # tokenizing the input and generating/serializing the embeddings (4 bytes per value)
+        size=request_body_size + input_count * embedding_size * 4,
     )
+    response = _create_embeddings_response_from_content(context, deployment_name, content, tokens)
 
     # calculate a simulated latency and store in context.values
     # needs to be called after the response has been created
@@ -660,17 +924,11 @@ async def azure_openai_embedding(context: RequestContext) -> Response | None:
     return response
 
 
+@generator_route(path="/openai/deployments/{deployment}/completions", methods=["POST"])
 async def azure_openai_completion(context: RequestContext) -> Response | None:
-    request = context.request
-    is_match, path_params = context.is_route_match(
-        request=request, path="/openai/deployments/{deployment}/completions", methods=["POST"]
-    )
-    if not is_match:
-        return None
-
     _validate_api_key_header(context)
 
-    deployment_name = path_params["deployment"]
+    deployment_name = context.path_params["deployment"]
     model_name = get_model_name_from_deployment_name(context, deployment_name)
     if model_name is None:
         return Response(
@@ -680,20 +938,28 @@ async def azure_openai_completion(context: RequestContext) -> Response | None:
                 "Content-Type": "application/json",
             },
         )
-    request_body = await request.json()
-    prompt_tokens = num_tokens_from_string(request_body["prompt"], model_name)
+    request_body = await context.get_request_json()
+    request_body_size = len(await context.get_request_body())
+    prompt_tokens = await run_in_executor(
+        num_tokens_from_string, request_body["prompt"], model_name, size=request_body_size
+    )
 
     requested_max_tokens, max_tokens = get_max_completion_tokens(request_body, model_name, prompt_tokens=prompt_tokens)
 
     context.values[SIMULATOR_KEY_OPENAI_MAX_TOKENS_REQUESTED] = requested_max_tokens
     context.values[SIMULATOR_KEY_OPENAI_MAX_TOKENS_EFFECTIVE] = max_tokens
 
+    lorem_content = None
+    if context.config.response_pool.size == 0:
+        lorem_content = await generate_lorem_content_in_executor(max_tokens=max_tokens, model_name=model_name)
+
     response = create_completion_response(
         context=context,
         deployment_name=deployment_name,
         model_name=model_name,
         prompt_tokens=prompt_tokens,
         max_tokens=max_tokens,
+        lorem_content=lorem_content,
     )
 
     # calculate a simulated latency and store in context.values
@@ -703,18 +969,12 @@ async def azure_openai_completion(context: RequestContext) -> Response | None:
     return response
 
 
+@generator_route(path="/openai/deployments/{deployment}/chat/completions", methods=["POST"])
 async def azure_openai_chat_completion(context: RequestContext) -> Response | None:
-    request = context.request
-    is_match, path_params = context.is_route_match(
-        request=request, path="/openai/deployments/{deployment}/chat/completions", methods=["POST"]
-    )
-    if not is_match:
-        return None
-
     _validate_api_key_header(context)
 
-    request_body = await request.json()
-    deployment_name = path_params["deployment"]
+    request_body = await context.get_request_json()
+    deployment_name = context.path_params["deployment"]
     model_name = get_model_name_from_deployment_name(context, deployment_name)
     if model_name is None:
         return Response(
@@ -725,7 +985,8 @@ async def azure_openai_chat_completion(context: RequestContext) -> Response | No
             },
         )
     messages = request_body["messages"]
-    prompt_tokens = num_tokens_from_messages(messages, model_name)
+    request_body_size = len(await context.get_request_body())
+    prompt_tokens = await run_in_executor(num_tokens_from_messages, messages, model_name, size=request_body_size)
 
     requested_max_tokens, max_tokens = get_max_completion_tokens(request_body, model_name, prompt_tokens=prompt_tokens)
 
@@ -734,6 +995,14 @@ async def azure_openai_chat_completion(context: RequestContext) -> Response | No
 
     streaming = request_body.get("stream", False)
 
+    lorem_content = None
+    if streaming or context.config.response_pool.size == 0:
+        lorem_content = await generate_lorem_content_in_executor(
+            max_tokens=max_tokens,
+            model_name=model_name,
+            tokens_per_chunk=context.config.streaming.tokens_per_chunk if streaming else None,
+        )
+
     response = create_lorem_chat_completion_response(
         context=context,
         deployment_name=deployment_name,
@@ -741,10 +1010,14 @@ async def azure_openai_chat_completion(context: RequestContext) -> Response | No
         streaming=streaming,
         max_tokens=max_tokens,
         prompt_messages=messages,
+        prompt_tokens=prompt_tokens,
+        lorem_content=lorem_content,
     )
 
     # calculate a simulated latency and store in context.values
     # needs to be called after the response has been created
-    await calculate_latency(context, 200)
+    # (streamed responses apply their latency while streaming)
+    if not streaming:
+        await calculate_latency(context, 200)
 
     return response
@@ -0,0 +1,118 @@
+"""
+Server-sent event (SSE) rendering for streamed chat completions.
+
+The chunk envelope for a stream is rendered once (with a single id for the stream, as the
+OpenAI service does) and each event only splices in the JSON-escaped content.
+"""
+
+import time
+
+import nanoid
+
+from aoai_simulated_api.generator.openai_tokens import get_encoding_for_model
+from aoai_simulated_api.generator.response_pool import ResponseTemplate, placeholder
+
+SSE_DONE_EVENT = b"data: [DONE]\n\n"
+
+
+def _create_chat_completion_chunk_body(
+    stream_id: str,
+    created: int,
+    model_name: str,
+    content: str | None,
+    role: str | None,
+    finish_reason: str | None,
+) -> dict:
+    return {
+        "id": stream_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model_name": model_name,
+        "system_fingerprint": None,
+        "choices": [
+            {
+                "delta": {
+                    "content": content,
+                    "function_call": None,
+                    "role": role,
+                    "tool_calls": None,
+                    "finish_reason": finish_reason,
+                    "index": 0,
+                    "logprobs": None,
+                    "content_filter_results": {
+                        "hate": {"filtered": False, "severity": "safe"},
+                        "self_harm": {"filtered": False, "severity": "safe"},
+                        "sexual": {"filtered": False, "severity": "safe"},
+                        "violence": {"filtered": False, "severity": "safe"},
+                    },
+                },
+            },
+        ],
+    }
+
+
+class ChatCompletionChunkRenderer:
+    """
+    Renders the SSE events for a single chat completion stream
+    """
+
+    _first_content_template: ResponseTemplate
+    _content_template: ResponseTemplate
+    _finish_event: bytes
+
+    def __init__(self, model_name: str, finish_reason: str):
+        stream_id = "chatcmpl-" + nanoid.non_secure_generate(size=29)
+        created = int(time.time())
+        # The first chunk includes the role, subsequent chunks only include content
+        self._first_content_template = ResponseTemplate(
+            _create_chat_completion_chunk_body(
+                stream_id, created, model_name, content=placeholder("content"), role="assistant", finish_reason=None
+            )
+        )
+        self._content_template = ResponseTemplate(
+            _create_chat_completion_chunk_body(
+                stream_id, created, model_name, content=placeholder("content"), role=None, finish_reason=None
+            )
+        )
+        self._finish_event = _to_event(
+            ResponseTemplate(
+                _create_chat_completion_chunk_body(
+                    stream_id, created, model_name, content=None, role=None, finish_reason=finish_reason
+                )
+            ).render({})
+        )
+
+    def render_content_event(self, content: str, is_first: bool) -> bytes:
+        template = self._first_content_template if is_first else self._content_template
+        return _to_event(template.render({"content": content}))
+
+    def render_finish_event(self) -> bytes:
+        return self._finish_event
+
+
+def _to_event(data: bytes) -> bytes:
+    return b"data: " + data + b"\n\n"
+
+
+def split_text_into_token_chunks(text: str, model_name: str, tokens_per_chunk: int) -> list[str]:
+    """
+    Splits text into chunks of tokens_per_chunk tokens.
+    Where a chunk boundary falls within a multi-byte character, the chunk is extended to the end of the character
+    """
+    if not text:
+        return []
+    encoding = get_encoding_for_model(model_name)
+    tokens = encoding.encode(text)
+    chunks = []
+    pending = b""
+    for start in range(0, len(tokens), tokens_per_chunk):
+        pending += encoding.decode_bytes(tokens[start : start + tokens_per_chunk])
+        try:
+            chunks.append(pending.decode("utf-8"))
+            pending = b""
+        except UnicodeDecodeError:
+            # partial character - carry over to the next chunk
+            continue
+    if pending:
+        chunks.append(pending.decode("utf-8", errors="replace"))
+    return chunks
@@ -2,6 +2,8 @@ import logging
 from typing import Tuple
 import tiktoken
 
+from aoai_simulated_api.generator.tokenizer import count_tokens, count_tokens_batch
+
 logger = logging.getLogger(__name__)
 
 # For details on the token counting, see https://cookbook.openai.com/examples/how_to_count_tokens_with_tiktoken
@@ -9,6 +11,9 @@ logger = logging.getLogger(__name__)
 
 warnings = {}
 
+# tiktoken.encoding_for_model resolves model name prefixes on each call, so cache the result per model
+encodings: dict[str, tiktoken.Encoding] = {}
+
 
 def _warn_once(warning_key: str, message: str):
     if warning_key not in warnings:
@@ -35,26 +40,33 @@ def get_max_completion_tokens(request_body, model_name: str, prompt_tokens: int)
     return requested_max_tokens, max_tokens
 
 
+def get_encoding_for_model(model: str) -> tiktoken.Encoding:
+    """Returns the tiktoken encoding for a model, falling back to cl100k_base for unknown models."""
+    encoding = encodings.get(model)
+    if encoding is None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _warn_once(model, f"Warning: model ({model}) not found. Using cl100k_base encoding.")
+            encoding = tiktoken.get_encoding("cl100k_base")
+        encodings[model] = encoding
+    return encoding
+
+
 def num_tokens_from_string(string: str, model: str) -> int:
     """Returns the number of tokens in a text string."""
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        _warn_once(model, f"Warning: model ({model}) not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
+    encoding = get_encoding_for_model(model)
+    return count_tokens(encoding, string)
+
 
+def num_tokens_from_strings(strings: list[str], model: str) -> list[int]:
+    """Returns the number of tokens in each of a list of text strings."""
+    encoding = get_encoding_for_model(model)
+    return count_tokens_batch(encoding, strings)
 
 
 def num_tokens_from_messages(messages, model):
     """Return the number of tokens used by a list of messages."""
-    # pylint: disable-next=global-statement
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        _warn_once(model, f"Warning: model ({model}) not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
     if model in {
         "gpt-3.5-turbo-0613",
         "gpt-3.5-turbo-16k-0613",
@@ -84,11 +96,12 @@ def num_tokens_from_messages(messages, model):
             + "See https://github.com/openai/openai-python/blob/main/chatml.md for information "
             + " on how messages are converted to tokens."
         )
+    encoding = get_encoding_for_model(model)
     num_tokens = 0
     for message in messages:
         num_tokens += tokens_per_message
         for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
+            num_tokens += count_tokens(encoding, value)
             if key == "name":
                 num_tokens += tokens_per_name
     num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
@@ -0,0 +1,124 @@
+"""
+A pool of pre-generated response bodies for generate mode.
+
+Generating a response body involves generating lorem text, counting tokens and serializing the
+response. Load tests generally only need valid responses of a given size, so the pool keeps a
+set of pre-rendered bodies per key (e.g. model and max_tokens) and only the per-request values
+(id, created timestamp, usage) are spliced in for each request.
+"""
+
+import asyncio
+import logging
+import re
+from typing import Callable
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+_placeholder_regex = re.compile(rb'"__pool_(\w+)__"')
+
+
+def placeholder(name: str) -> str:
+    """Returns the placeholder to use in a template body for the named per-request value"""
+    return f"__pool_{name}__"
+
+
+class ResponseTemplate:
+    """
+    A pre-rendered response body with placeholders for per-request values
+    """
+
+    completion_tokens: int
+    _literals: list[bytes]
+    _fields: list[str]
+
+    def __init__(self, body: dict, completion_tokens: int = 0):
+        self.completion_tokens = completion_tokens
+        # split into alternating literal and placeholder name segments
+        segments = _placeholder_regex.split(orjson.dumps(body))
+        self._literals = segments[0::2]
+        self._fields = [field.decode("ascii") for field in segments[1::2]]
+
+    def render(self, values: dict[str, any]) -> bytes:
+        parts = [self._literals[0]]
+        for field, literal in zip(self._fields, self._literals[1:]):
+            parts.append(orjson.dumps(values[field]))
+            parts.append(literal)
+        return b"".join(parts)
+
+
+class ResponsePool:
+    """
+    Holds up to `size` templates per key. Templates are created on first use of a key and
+    a background task then fills the pool for the key. Requests rotate through the templates for a key.
+    """
+
+    _templates: dict[tuple, list[ResponseTemplate]]
+    _factories: dict[tuple, Callable[[], ResponseTemplate]]
+    _next_index: dict[tuple, int]
+    _size: int
+    _fill_task: asyncio.Task | None
+
+    def __init__(self):
+        self._templates = {}
+        self._factories = {}
+        self._next_index = {}
+        self._size = 0
+        self._fill_task = None
+
+    def get_template(self, key: tuple, size: int, factory: Callable[[], ResponseTemplate]) -> ResponseTemplate:
+        self._size = size
+        templates = self._templates.get(key)
+        if not templates:
+            template = factory()
+            self._templates[key] = [template]
+            self._factories[key] = factory
+            self._next_index[key] = 0
+            self._ensure_fill_task()
+            return template
+
+        index = self._next_index[key]
+        self._next_index[key] = (index + 1) % len(templates)
+        if len(templates) < self._size:
+            self._ensure_fill_task()
+        return templates[index % len(templates)]
+
+    def clear(self):
+        self._templates.clear()
+        self._factories.clear()
+        self._next_index.clear()
+
+    def _ensure_fill_task(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no event loop (e.g. called synchronously) - the pool will be filled on a later request
+            return
+        if self._fill_task is not None and not self._fill_task.done() and self._fill_task.get_loop() is loop:
+            return
+        self._fill_task = loop.create_task(self._fill())
+
+    async def _fill(self):
+        while True:
+            key = next((key for key, templates in self._templates.items() if len(templates) < self._size), None)
+            if key is None:
+                return
+            try:
+                self._templates[key].append(self._factories[key]())
+            # pylint: disable-next=broad-exception-caught
+            except Exception as e:
+                logger.error("Error generating pooled response for %s", key, exc_info=e)
+                return
+            # yield to allow requests to be processed between generating templates
+            await asyncio.sleep(0)
+
+
+def get_max_tokens_bucket(max_tokens: int, bucket_size: int) -> int:
+    """Rounds max_tokens down to a multiple of bucket_size (values below bucket_size are unchanged)"""
+    if max_tokens < bucket_size:
+        return max_tokens
+    return max_tokens - max_tokens % bucket_size
+
+
+response_pool = ResponsePool()
@@ -0,0 +1,162 @@
+"""
+Route-based dispatch for generators.
+
+Generators can declare the route they handle using the `generator_route` decorator. The declared routes are
+compiled once into a `GeneratorRouteIndex`, which uses a tree of path segments to find the candidate generators
+for a request rather than invoking every generator in turn to check whether it matches.
+
+Generators that don't declare a route are always invoked (in their position in the generator list) and
+match the request themselves (e.g. using `RequestContext.is_route_match`).
+"""
+
+from typing import Awaitable, Callable
+
+from fastapi import Response
+from starlette.routing import Match, Route
+
+from aoai_simulated_api.models import RequestContext
+
+Generator = Callable[[RequestContext], Response | Awaitable[Response] | None]
+
+
+class GeneratorRoute:
+    """
+    The route declared by a generator (compiled once when the generator is declared)
+    """
+
+    path: str
+    methods: list[str]
+    _route: Route
+
+    def __init__(self, path: str, methods: list[str]):
+        self.path = path
+        self.methods = methods
+        self._route = Route(path=path, methods=methods, endpoint=_endpoint)
+
+    def match(self, method: str, path: str) -> dict | None:
+        """Returns the path parameters if the route matches, otherwise None"""
+        match, scopes = self._route.matches({"type": "http", "method": method, "path": path})
+        if match != Match.FULL:
+            return None
+        return scopes["path_params"]
+
+
+def generator_route(path: str, methods: list[str]) -> Callable[[Generator], Generator]:
+    """
+    Decorator to declare the route that a generator handles.
+    The generator is only invoked for requests that match the route and the
+    path parameters for the match are available via `RequestContext.path_params`
+    """
+
+    def decorator(generator: Generator) -> Generator:
+        generator.generator_route = GeneratorRoute(path=path, methods=methods)
+        return generator
+
+    return decorator
+
+
+def get_generator_route(generator: Generator) -> GeneratorRoute | None:
+    return getattr(generator, "generator_route", None)
+
+
+class _RouteNode:
+    __slots__ = ("literal_children", "parameter_child", "generator_indices")
+
+    literal_children: dict[str, "_RouteNode"]
+    parameter_child: "_RouteNode | None"
+    generator_indices: list[int]
+
+    def __init__(self):
+        self.literal_children = {}
+        self.parameter_child = None
+        self.generator_indices = []
+
+
+class GeneratorRouteIndex:
+    """
+    An index of the routes declared by a list of generators.
+
+    Declared routes are stored in a tree keyed by path segment, with segments that contain a path parameter
+    sharing a single parameter node. Looking up a request path walks the tree once to find the candidate
+    routes, and only the candidates are matched against the request.
+    """
+
+    generators: tuple[Generator, ...]
+    _routes: list[GeneratorRoute | None]
+    _root: _RouteNode
+    _unindexed_indices: list[int]
+
+    def __init__(self, generators: list[Generator]):
+        self.generators = tuple(generators)
+        self._routes = [get_generator_route(generator) for generator in self.generators]
+        self._root = _RouteNode()
+        # generators without a declared route are always candidates
+        self._unindexed_indices = []
+
+        for index, route in enumerate(self._routes):
+            if route is None or ":path}" in route.path:
+                # path convertors can span multiple segments so can't be indexed by segment
+                self._unindexed_indices.append(index)
+                continue
+            node = self._root
+            for segment in route.path.split("/"):
+                if "{" in segment:
+                    if node.parameter_child is None:
+                        node.parameter_child = _RouteNode()
+                    node = node.parameter_child
+                else:
+                    node = node.literal_children.setdefault(segment, _RouteNode())
+            node.generator_indices.append(index)
+
+    def get_candidates(self, method: str, path: str) -> list[tuple[Generator, dict | None]]:
+        """
+        Returns the generators to invoke for a request in the order they were registered.
+        Each generator is paired with the path parameters for its declared route, or None for
+        generators that don't declare a route
+        """
+        indices = list(self._unindexed_indices)
+        self._collect_indices(self._root, path.split("/"), 0, indices)
+        if len(indices) > len(self._unindexed_indices):
+            indices.sort()
+
+        candidates = []
+        for index in indices:
+            route = self._routes[index]
+            if route is None:
+                candidates.append((self.generators[index], None))
+                continue
+            path_params = route.match(method, path)
+            if path_params is not None:
+                candidates.append((self.generators[index], path_params))
+        return candidates
+
+    def _collect_indices(self, node: _RouteNode, segments: list[str], position: int, indices: list[int]):
+        if position == len(segments):
+            indices.extend(node.generator_indices)
+            return
+        segment = segments[position]
+        literal_child = node.literal_children.get(segment)
+        if literal_child is not None:
+            self._collect_indices(literal_child, segments, position + 1, indices)
+        if node.parameter_child is not None and segment:
+            self._collect_indices(node.parameter_child, segments, position + 1, indices)
+
+
+_route_index: GeneratorRouteIndex | None = None
+
+
+def get_route_index(generators: list[Generator]) -> GeneratorRouteIndex:
+    """
+    Returns the route index for the generators.
+    The index is rebuilt if the generators have changed since it was last built (e.g. by an extension)
+    """
+    global _route_index  # pylint: disable=global-statement
+    route_index = _route_index
+    if route_index is None or route_index.generators != tuple(generators):
+        route_index = GeneratorRouteIndex(generators)
+        _route_index = route_index
+    return route_index
+
+
+def _endpoint():
+    pass
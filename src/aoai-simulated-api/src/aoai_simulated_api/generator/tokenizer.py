@@ -0,0 +1,121 @@
+"""
+Token counting with memoized results for repeated content.
+
+Requests often repeat the same large content (e.g. the system prompt in a RAG application),
+so token counts for larger strings are cached in a bounded LRU keyed by a hash of the content.
+"""
+
+from collections import OrderedDict
+import hashlib
+import logging
+import threading
+
+import tiktoken
+
+from aoai_simulated_api.metrics import simulator_metrics
+
+logger = logging.getLogger(__name__)
+
+# Strings shorter than this are cheaper to encode than to look up, so are not cached
+min_cached_length = 256
+
+# Number of texts that need encoding before using encode_batch
+# (encode_batch starts a thread pool per call which costs more than it saves for small batches)
+min_batch_encode_count = 8
+
+
+class TokenCountCache:
+    """
+    A bounded LRU cache of token counts keyed by the encoding name and a digest of the text.
+    The cache is thread-safe as token counting can be run in the executor
+    """
+
+    _max_size: int
+    _values: OrderedDict[tuple[str, bytes], int]
+    _lock: threading.Lock
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(encoding: tiktoken.Encoding, text: str) -> tuple[str, bytes]:
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        return (encoding.name, digest)
+
+    def get(self, key: tuple[str, bytes]) -> int | None:
+        with self._lock:
+            token_count = self._values.get(key)
+            if token_count is not None:
+                self._values.move_to_end(key)
+        if token_count is None:
+            simulator_metrics.counter_tokenizer_cache.add(1, {"result": "miss"})
+            return None
+        simulator_metrics.counter_tokenizer_cache.add(1, {"result": "hit"})
+        return token_count
+
+    def set(self, key: tuple[str, bytes], token_count: int):
+        with self._lock:
+            self._values[key] = token_count
+            self._values.move_to_end(key)
+            while len(self._values) > self._max_size:
+                self._values.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+token_count_cache = TokenCountCache(max_size=4096)
+
+
+def count_tokens(encoding: tiktoken.Encoding, text: str) -> int:
+    """Returns the number of tokens in text, using the cache for larger strings"""
+    if len(text) < min_cached_length:
+        return len(encoding.encode(text))
+
+    key = TokenCountCache.get_key(encoding, text)
+    token_count = token_count_cache.get(key)
+    if token_count is None:
+        token_count = len(encoding.encode(text))
+        token_count_cache.set(key, token_count)
+    return token_count
+
+
+def count_tokens_batch(encoding: tiktoken.Encoding, texts: list[str]) -> list[int]:
+    """
+    Returns the number of tokens in each of the texts.
+    Cached values are used where available and the remaining texts are encoded together
+    """
+    token_counts: list[int | None] = [None] * len(texts)
+    uncached_indices = []
+    uncached_keys = []
+    for index, text in enumerate(texts):
+        if len(text) < min_cached_length:
+            uncached_indices.append(index)
+            uncached_keys.append(None)
+            continue
+        key = TokenCountCache.get_key(encoding, text)
+        token_count = token_count_cache.get(key)
+        if token_count is None:
+            uncached_indices.append(index)
+            uncached_keys.append(key)
+        else:
+            token_counts[index] = token_count
+
+    if len(uncached_indices) >= min_batch_encode_count:
+        encoded = encoding.encode_batch([texts[index] for index in uncached_indices])
+        uncached_token_counts = [len(tokens) for tokens in encoded]
+    else:
+        uncached_token_counts = [len(encoding.encode(texts[index])) for index in uncached_indices]
+
+    for index, key, token_count in zip(uncached_indices, uncached_keys, uncached_token_counts):
+        token_counts[index] = token_count
+        if key is not None:
+            token_count_cache.set(key, token_count)
+
+    return token_counts
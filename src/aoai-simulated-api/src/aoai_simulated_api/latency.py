@@ -11,6 +11,8 @@ class LatencyGenerator:
     """
     LatencyGenerator is a context manager that adds simulated latency to the response.
     The latency added is based on the context.values[TARGET_DURATION_MS] value.
+    No latency is added for responses from generators that apply latency while streaming
+    (indicated by context.values[SIMULATOR_KEY_STREAMING_LATENCY_APPLIED]).
     Additionaly, the generator emits metrics for the response (base latency and added latency).
     """
 
@@ -49,7 +51,9 @@ class LatencyGenerator:
         rate_limit_tokens = self.__context.values.get(constants.SIMULATOR_KEY_OPENAI_RATE_LIMIT_TOKENS, 0)
 
         status_code = self.__response.status_code
-        if status_code < 300:
+        # the built-in streamed responses apply their latency as they are streamed
+        streaming_latency_applied = self.__context.values.get(constants.SIMULATOR_KEY_STREAMING_LATENCY_APPLIED, False)
+        if status_code < 300 and not streaming_latency_applied:
             target_duration_ms = self.__context.values.get(constants.TARGET_DURATION_MS, None)
             if target_duration_ms:
                 target_duration_s = target_duration_ms / 1000
@@ -1,8 +1,13 @@
+from abc import ABC, abstractmethod
+import bisect
 from dataclasses import dataclass
 import inspect
 import json
 import logging
 import math
+import mmap
+import os
+import struct
 import time
 from typing import Awaitable, Callable
 
@@ -10,7 +15,7 @@ from fastapi import Response
 
 from aoai_simulated_api import constants
 from aoai_simulated_api.metrics import simulator_metrics
-from aoai_simulated_api.models import Config, RequestContext
+from aoai_simulated_api.models import Config, LimiterStoreConfig, RequestContext
 
 logger = logging.getLogger(__name__)
 
@@ -38,7 +43,7 @@ deployment_warnings_issues: dict[str, bool] = {}
 async def determine_token_cost(context: RequestContext):
     # Check whether the request has set max_tokens
     # If so, use that as the rate-limiting token value
-    request_body = await context.request.json()
+    request_body = await context.get_request_json()
     max_tokens = request_body.get("max_tokens")
     if max_tokens:
         token_cost = max_tokens
@@ -57,7 +62,6 @@ async def determine_token_cost(context: RequestContext):
         elif "/completions" in context.request.url.path:
             token_cost = 16
         elif "/embeddings" in context.request.url.path:
-            request_body = await context.request.json()
             request_input = request_body.get("input")
             if request_input is None:
                 logger.warning("openai_limiter: input not found in request body for embedding request")
@@ -77,8 +81,10 @@ async def determine_token_cost(context: RequestContext):
     return token_cost
 
 
-def create_openai_limiter(deployments: dict[str, int]) -> Callable[[RequestContext, Response], Response | None]:
-    return create_openai_sliding_window_limiter(deployments)
+def create_openai_limiter(
+    deployments: dict[str, int], store_config: LimiterStoreConfig | None = None
+) -> Callable[[RequestContext, Response], Response | None]:
+    return create_openai_sliding_window_limiter(deployments, store_config)
 
 
 @dataclass
@@ -96,24 +102,119 @@ class WindowAddResult:
     retry_reason: str | None  # "tokens" or "requests"
 
 
-class SlidingWindow:
+class RateLimitWindow(ABC):
     """
-    Represents a time window for rate-limiting
+    Base class for the rate-limiting windows created by a LimiterStore.
+    Holds the limits and determines the result for a request from the window counts
     """
 
-    _requests: list[WindowEntry]
     _requests_per_10_seconds: int
     _tokens_per_minute: int
 
     def __init__(self, requests_per_10_seconds: int, tokens_per_minute: int):
         self._requests_per_10_seconds = requests_per_10_seconds
         self._tokens_per_minute = tokens_per_minute
+
+    @abstractmethod
+    async def add_request_async(self, token_cost: int, timestamp: float = -1) -> WindowAddResult:
+        """
+        Add a request to the window
+        """
+
+    @abstractmethod
+    def _latest_timestamp(self) -> float:
+        pass
+
+    def _get_add_result(
+        self,
+        token_cost: int,
+        timestamp: float,
+        request_count_in_10s: int,
+        token_count_in_60s: int,
+        requests_full_time: float,
+        tokens_full_time: float,
+    ) -> WindowAddResult:
+        """
+        Determine whether a request can be added to the window (and the retry-after if not)
+        from the window counts for the request
+        """
+
+        # If requests_full_duration is less than 10 then we need less than 10 seconds of history
+        # to exceed the requests_per_10_seconds limit, i.e. we already used the limit for the current 10s window
+        # If tokens_full_duration is less than 60 then we need less than 60 seconds of history
+        # to exceed the tokens_per_minute limit, i.e. we already used the limit for the current 60s window
+        # if requests_full_duration < 10 or tokens_full_duration < 60:
+        if token_count_in_60s > self._tokens_per_minute or request_count_in_10s > self._requests_per_10_seconds:
+
+            # Edge case where we've hit the max tokens and the current request is for max_tokens
+            # but haven't hit the request limit
+            # in this case, we wait until the last saved request is out of the window
+            if (
+                token_cost == self._tokens_per_minute
+                and requests_full_time == -math.inf
+                and tokens_full_time == -math.inf
+            ):
+                tokens_full_time = self._latest_timestamp()
+
+            # calculate the duration to have a full request count
+            requests_full_duration = timestamp - requests_full_time
+            # calculate the duration to have a full token count
+            tokens_full_duration = timestamp - tokens_full_time
+
+            time_to_reset_requests = 10 - requests_full_duration
+            time_to_reset_tokens = 60 - tokens_full_duration
+
+            if time_to_reset_requests > time_to_reset_tokens:
+                reason = "requests"
+                retry_after = math.ceil(time_to_reset_requests)
+                if time_to_reset_requests <= 0:
+                    raise ValueError("time_to_reset_requests should be greater than 0")
+            else:
+                reason = "tokens"
+                retry_after = math.ceil(time_to_reset_tokens)
+                if time_to_reset_tokens <= 0:
+                    raise ValueError("time_to_reset_tokens should be greater than 0")
+
+            return WindowAddResult(
+                success=False,
+                retry_after=retry_after,
+                retry_reason=reason,
+                remaining_tokens=None,
+                remaining_requests=None,
+            )
+
+        # token_count_in_60s += token_cost
+        # request_count_in_10s += 1
+        return WindowAddResult(
+            success=True,
+            retry_after=None,
+            retry_reason=None,
+            remaining_tokens=self._tokens_per_minute - token_count_in_60s,
+            remaining_requests=self._requests_per_10_seconds - request_count_in_10s,
+        )
+
+
+class SlidingWindow(RateLimitWindow):
+    """
+    Represents a time window for rate-limiting
+    """
+
+    _requests: list[WindowEntry]
+
+    def __init__(self, requests_per_10_seconds: int, tokens_per_minute: int):
+        super().__init__(requests_per_10_seconds=requests_per_10_seconds, tokens_per_minute=tokens_per_minute)
         self._requests = []
 
     def _purge(self, cut_off: float):
         while len(self._requests) > 0 and self._requests[0].timestamp <= cut_off:
             self._requests.pop(0)
 
+    def _latest_timestamp(self) -> float:
+        return self._requests[-1].timestamp
+
+    def _append(self, timestamp: float, token_cost: int):
+        self._requests.append(WindowEntry(timestamp, token_cost))
+
     def _calculate_window_counts_for_request(self, token_cost: int, timestamp: float) -> tuple[int, int, float, float]:
 
         # Iterate the the list in reverse order
@@ -169,79 +270,515 @@ class SlidingWindow:
             self._calculate_window_counts_for_request(token_cost=token_cost, timestamp=timestamp)
         )
 
-        # If requests_full_duration is less than 10 then we need less than 10 seconds of history
-        # to exceed the requests_per_10_seconds limit, i.e. we already used the limit for the current 10s window
-        # If tokens_full_duration is less than 60 then we need less than 60 seconds of history
-        # to exceed the tokens_per_minute limit, i.e. we already used the limit for the current 60s window
-        # if requests_full_duration < 10 or tokens_full_duration < 60:
-        if token_count_in_60s > self._tokens_per_minute or request_count_in_10s > self._requests_per_10_seconds:
+        result = self._get_add_result(
+            token_cost, timestamp, request_count_in_10s, token_count_in_60s, requests_full_time, tokens_full_time
+        )
+        if result.success:
+            # We have enough capacity to add the request
+            self._append(timestamp, token_cost)
+        return result
 
-            # Edge case where we've hit the max tokens and the current request is for max_tokens
-            # but haven't hit the request limit
-            # in this case, we wait until the last saved request is out of the window
-            if (
-                token_cost == self._tokens_per_minute
-                and requests_full_time == -math.inf
-                and tokens_full_time == -math.inf
-            ):
-                tokens_full_time = self._requests[-1].timestamp
+    async def add_request_async(self, token_cost: int, timestamp: float = -1) -> WindowAddResult:
+        return self.add_request(token_cost=token_cost, timestamp=timestamp)
 
-            # calculate the duration to have a full request count
-            requests_full_duration = timestamp - requests_full_time
-            # calculate the duration to have a full token count
-            tokens_full_duration = timestamp - tokens_full_time
 
-            time_to_reset_requests = 10 - requests_full_duration
-            time_to_reset_tokens = 60 - tokens_full_duration
+class IndexedSlidingWindow(SlidingWindow):
+    """
+    Sliding window with the same semantics as SlidingWindow, but with per-request cost that
+    doesn't grow with the number of entries in the window.
 
-            if time_to_reset_requests > time_to_reset_tokens:
-                reason = "requests"
-                retry_after = math.ceil(time_to_reset_requests)
-                if time_to_reset_requests <= 0:
-                    raise ValueError("time_to_reset_requests should be greater than 0")
+    Entries are stored in parallel timestamp/token offset lists (token offsets are running totals
+    of the tokens for all preceding entries) with a head index marking the start of the window.
+    This allows the window counts and retry times to be found with binary searches rather than
+    walking the window, and purged entries are dropped in batches rather than with list.pop(0).
+
+    Assumes that requests are added in timestamp order (as is the case when using time.time())
+    """
+
+    _timestamps: list[float]
+    _token_offsets: list[int]
+    _total_tokens: int
+    _head: int
+
+    # Only compact the lists once there are at least this many purged entries
+    # (and they make up at least half of the list)
+    _compact_threshold = 1024
+
+    def __init__(self, requests_per_10_seconds: int, tokens_per_minute: int):
+        super().__init__(requests_per_10_seconds=requests_per_10_seconds, tokens_per_minute=tokens_per_minute)
+        self._timestamps = []
+        self._token_offsets = []
+        self._total_tokens = 0
+        self._head = 0
+
+    def _purge(self, cut_off: float):
+        head = self._head
+        timestamps = self._timestamps
+        count = len(timestamps)
+        while head < count and timestamps[head] <= cut_off:
+            head += 1
+
+        if head >= self._compact_threshold and head * 2 >= count:
+            del timestamps[:head]
+            del self._token_offsets[:head]
+            head = 0
+        self._head = head
+
+    def _latest_timestamp(self) -> float:
+        return self._timestamps[-1]
+
+    def _append(self, timestamp: float, token_cost: int):
+        self._timestamps.append(timestamp)
+        self._token_offsets.append(self._total_tokens)
+        self._total_tokens += token_cost
+
+    def _calculate_window_counts_for_request(self, token_cost: int, timestamp: float) -> tuple[int, int, float, float]:
+        timestamps = self._timestamps
+        head = self._head
+        count = len(timestamps)
+
+        # requests in the last 10 seconds (including this request)
+        request_count_in_10s = 1 + count - bisect.bisect_right(timestamps, timestamp - 10, lo=head)
+
+        # tokens in the last 60 seconds (including this request)
+        # all entries are in the last 60s as we purged any that are older
+        window_tokens = self._total_tokens - self._token_offsets[head] if head < count else 0
+        token_count_in_60s = token_cost + window_tokens
+
+        # The window is full for requests at the requests_per_10_seconds-th most recent entry
+        # (or the most recent entry if there is no request allowance)
+        requests_needed = max(math.floor(self._requests_per_10_seconds), 1)
+        requests_full_time = timestamps[count - requests_needed] if count - head >= requests_needed else -math.inf
+
+        # The window is full for tokens at the most recent entry where the tokens for the
+        # entries from that point onwards plus this request exceed tokens_per_minute.
+        # I.e. the last entry whose token offset is less than total_tokens - (tokens_per_minute - token_cost)
+        tokens_full_time = -math.inf
+        if head < count:
+            full_offset = self._total_tokens - (self._tokens_per_minute - token_cost)
+            full_index = bisect.bisect_left(self._token_offsets, full_offset, lo=head, hi=count) - 1
+            if full_index >= head:
+                tokens_full_time = timestamps[full_index]
+
+        return request_count_in_10s, token_count_in_60s, requests_full_time, tokens_full_time
+
+
+class SharedMemorySlidingWindow(IndexedSlidingWindow):
+    """
+    Sliding window whose state is held in a memory-mapped file so that it can be shared
+    by multiple worker processes on a node (e.g. when running gunicorn with multiple workers).
+
+    The file holds a header followed by ring buffers of entry timestamps and token offsets.
+    Positions in the ring buffers are absolute sequence numbers (modulo the capacity) so the
+    binary searches work in the same way as for IndexedSlidingWindow.
+    Each add_request call takes an exclusive lock (flock) on the window file, so each
+    deployment is locked independently.
+
+    flock locks belong to the open file description, which is shared with child processes on fork.
+    The file is re-opened in each process (e.g. gunicorn workers forked after the config is loaded
+    with --preload) so that the lock excludes the other processes.
+    """
+
+    # magic, version, capacity, head, tail, total_tokens
+    _header_format = "<4sIqqqq"
+    _header_size = 64
+    # head, tail, total_tokens are updated on each request
+    _state_format = "<qqq"
+    _state_offset = 16
+
+    _tail: int
+    _magic = b"AOSW"
+    _version = 1
+
+    def __init__(self, path: str, requests_per_10_seconds: int, tokens_per_minute: int):
+        # pylint: disable-next=import-outside-toplevel
+        import fcntl  # only available on POSIX platforms
+
+        super().__init__(requests_per_10_seconds=requests_per_10_seconds, tokens_per_minute=tokens_per_minute)
+        self._fcntl = fcntl
+        self._path = path
+
+        # At most requests_per_10_seconds requests are added in any 10s period
+        # so the window can hold at most 6 * requests_per_10_seconds entries
+        self._capacity = 6 * max(math.ceil(requests_per_10_seconds), 1) + 1
+        file_size = self._header_size + self._capacity * 16
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._pid = os.getpid()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != file_size:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, file_size)
+            self._mmap = mmap.mmap(self._fd, file_size)
+            magic, version, capacity, _, _, _ = struct.unpack_from(self._header_format, self._mmap, 0)
+            if magic != self._magic or version != self._version or capacity != self._capacity:
+                struct.pack_into(
+                    self._header_format, self._mmap, 0, self._magic, self._version, self._capacity, 0, 0, 0
+                )
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        timestamps_end = self._header_size + self._capacity * 8
+        self._ring_timestamps = memoryview(self._mmap)[self._header_size : timestamps_end].cast("d")
+        self._ring_token_offsets = memoryview(self._mmap)[timestamps_end:].cast("q")
+
+    def _ensure_process_fd(self):
+        if self._pid == os.getpid():
+            return
+        # forked from the process that opened the file - get a separate open file description to lock
+        # (the memory map is shared so doesn't need re-creating)
+        os.close(self._fd)
+        self._fd = os.open(self._path, os.O_RDWR)
+        self._pid = os.getpid()
+
+    def add_request(self, token_cost: int, timestamp: float = -1) -> WindowAddResult:
+        self._ensure_process_fd()
+        self._fcntl.flock(self._fd, self._fcntl.LOCK_EX)
+        try:
+            self._head, self._tail, self._total_tokens = struct.unpack_from(
+                self._state_format, self._mmap, self._state_offset
+            )
+            result = super().add_request(token_cost=token_cost, timestamp=timestamp)
+            struct.pack_into(
+                self._state_format, self._mmap, self._state_offset, self._head, self._tail, self._total_tokens
+            )
+            return result
+        finally:
+            self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+
+    def _purge(self, cut_off: float):
+        timestamps = self._ring_timestamps
+        capacity = self._capacity
+        head = self._head
+        tail = self._tail
+        while head < tail and timestamps[head % capacity] <= cut_off:
+            head += 1
+        self._head = head
+
+    def _latest_timestamp(self) -> float:
+        return self._ring_timestamps[(self._tail - 1) % self._capacity]
+
+    def _append(self, timestamp: float, token_cost: int):
+        if self._tail - self._head >= self._capacity:
+            # shouldn't happen given how the capacity is sized, but avoid overwriting live entries
+            self._head += 1
+        index = self._tail % self._capacity
+        self._ring_timestamps[index] = timestamp
+        self._ring_token_offsets[index] = self._total_tokens
+        self._tail += 1
+        self._total_tokens += token_cost
+
+    def _calculate_window_counts_for_request(self, token_cost: int, timestamp: float) -> tuple[int, int, float, float]:
+        timestamps = self._ring_timestamps
+        token_offsets = self._ring_token_offsets
+        capacity = self._capacity
+        head = self._head
+        tail = self._tail
+
+        # requests in the last 10 seconds (including this request)
+        # i.e. the entries after the last entry with timestamp <= timestamp - 10
+        cut_off = timestamp - 10
+        lo, hi = head, tail
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if timestamps[mid % capacity] <= cut_off:
+                lo = mid + 1
             else:
-                reason = "tokens"
-                retry_after = math.ceil(time_to_reset_tokens)
-                if time_to_reset_tokens <= 0:
-                    raise ValueError("time_to_reset_tokens should be greater than 0")
+                hi = mid
+        request_count_in_10s = 1 + tail - lo
 
-            return WindowAddResult(
-                success=False,
-                retry_after=retry_after,
-                retry_reason=reason,
-                remaining_tokens=None,
-                remaining_requests=None,
+        # tokens in the last 60 seconds (including this request)
+        window_tokens = self._total_tokens - token_offsets[head % capacity] if head < tail else 0
+        token_count_in_60s = token_cost + window_tokens
+
+        requests_needed = max(math.floor(self._requests_per_10_seconds), 1)
+        requests_full_time = (
+            timestamps[(tail - requests_needed) % capacity] if tail - head >= requests_needed else -math.inf
+        )
+
+        tokens_full_time = -math.inf
+        if head < tail:
+            full_offset = self._total_tokens - (self._tokens_per_minute - token_cost)
+            lo, hi = head, tail
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if token_offsets[mid % capacity] < full_offset:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            full_index = lo - 1
+            if full_index >= head:
+                tokens_full_time = timestamps[full_index % capacity]
+
+        return request_count_in_10s, token_count_in_60s, requests_full_time, tokens_full_time
+
+
+# Lua script to check and add a request to a sliding window in a single atomic operation on a Redis server
+# Mirrors IndexedSlidingWindow, using sorted sets (with zero-padded sequence numbers as members)
+# in place of the timestamp and token offset lists
+#   KEYS[1]: entry timestamps (score = timestamp)
+#   KEYS[2]: entry token offsets (score = total tokens for the preceding entries)
+#   KEYS[3]: window state hash (seq, total_tokens)
+#   ARGV: token_cost, timestamp (empty to use the server time), requests_per_10_seconds, tokens_per_minute,
+#         requests_needed, ttl_ms
+# Returns: success, request_count_in_10s, token_count_in_60s, requests_full_time, tokens_full_time, latest_timestamp,
+#          timestamp (the time used for the request)
+# (times are returned as strings as Lua numbers are converted to integers in Redis replies)
+#
+# The token offsets rely on entries being added in timestamp order. Using the server time (rather than the time
+# on each simulator instance) and never adding an entry before the latest entry keeps them in order
+# when callers' clocks differ.
+_redis_add_request_script = """
+local function fmt(value)
+    return string.format("%.17g", value)
+end
+
+local token_cost = tonumber(ARGV[1])
+local timestamp
+if ARGV[2] == "" then
+    local server_time = redis.call("TIME")
+    timestamp = tonumber(server_time[1]) + tonumber(server_time[2]) / 1000000
+else
+    timestamp = tonumber(ARGV[2])
+end
+local requests_per_10_seconds = tonumber(ARGV[3])
+local tokens_per_minute = tonumber(ARGV[4])
+local requests_needed = tonumber(ARGV[5])
+local ttl_ms = tonumber(ARGV[6])
+
+local latest_entry = redis.call("ZRANGE", KEYS[1], -1, -1, "WITHSCORES")
+if #latest_entry > 0 and tonumber(latest_entry[2]) > timestamp then
+    timestamp = tonumber(latest_entry[2])
+end
+
+-- remove items older than a minute (from both sets by member)
+local purged = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", fmt(timestamp - 60))
+for i = 1, #purged, 1000 do
+    local batch = {unpack(purged, i, math.min(i + 999, #purged))}
+    redis.call("ZREM", KEYS[1], unpack(batch))
+    redis.call("ZREM", KEYS[2], unpack(batch))
+end
+
+local entry_count = redis.call("ZCARD", KEYS[1])
+local total_tokens = tonumber(redis.call("HGET", KEYS[3], "total_tokens") or "0")
+
+local request_count_in_10s = 1 + redis.call("ZCOUNT", KEYS[1], "(" .. fmt(timestamp - 10), "+inf")
+local token_count_in_60s = token_cost
+local requests_full_time = "-inf"
+local tokens_full_time = "-inf"
+local latest_timestamp = "-inf"
+if entry_count > 0 then
+    local oldest_entry = redis.call("ZRANGE", KEYS[2], 0, 0, "WITHSCORES")
+    token_count_in_60s = token_cost + total_tokens - tonumber(oldest_entry[2])
+    latest_timestamp = redis.call("ZRANGE", KEYS[1], -1, -1, "WITHSCORES")[2]
+
+    if entry_count >= requests_needed then
+        requests_full_time = redis.call("ZRANGE", KEYS[1], -requests_needed, -requests_needed, "WITHSCORES")[2]
+    end
+
+    local full_offset = total_tokens - (tokens_per_minute - token_cost)
+    local full_entry = redis.call("ZREVRANGEBYSCORE", KEYS[2], "(" .. fmt(full_offset), "-inf", "LIMIT", 0, 1)
+    if #full_entry > 0 then
+        tokens_full_time = redis.call("ZSCORE", KEYS[1], full_entry[1])
+    end
+end
+
+local success = 0
+if token_count_in_60s <= tokens_per_minute and request_count_in_10s <= requests_per_10_seconds then
+    success = 1
+    local member = string.format("%016d", redis.call("HINCRBY", KEYS[3], "seq", 1))
+    redis.call("ZADD", KEYS[1], fmt(timestamp), member)
+    redis.call("ZADD", KEYS[2], fmt(total_tokens), member)
+    redis.call("HINCRBY", KEYS[3], "total_tokens", token_cost)
+end
+
+for i = 1, 3 do
+    redis.call("PEXPIRE", KEYS[i], ttl_ms)
+end
+
+return {
+    success, request_count_in_10s, token_count_in_60s, requests_full_time, tokens_full_time, latest_timestamp,
+    fmt(timestamp)
+}
+"""
+
+
+class RedisSlidingWindow(RateLimitWindow):
+    """
+    Sliding window whose state is held on a Redis-compatible server so that it can be shared
+    by multiple simulator instances (e.g. replicas behind a load balancer).
+
+    Each add_request_async call is a single script invocation on the server (EVALSHA) which
+    purges, checks, and adds the request atomically.
+    Requests are timestamped using the server time unless a timestamp is specified.
+    """
+
+    # Keep the window keys for a little longer than the window
+    _ttl_ms = 61_000
+
+    def __init__(self, client, key: str, requests_per_10_seconds: int, tokens_per_minute: int):
+        super().__init__(requests_per_10_seconds=requests_per_10_seconds, tokens_per_minute=tokens_per_minute)
+        self._keys = [f"{key}:timestamps", f"{key}:token-offsets", f"{key}:state"]
+        self._script = client.register_script(_redis_add_request_script)
+        self._script_latest_timestamp = -math.inf
+
+    async def add_request_async(self, token_cost: int, timestamp: float = -1) -> WindowAddResult:
+        requests_needed = max(math.floor(self._requests_per_10_seconds), 1)
+        (
+            _,
+            request_count_in_10s,
+            token_count_in_60s,
+            requests_full_time,
+            tokens_full_time,
+            latest_timestamp,
+            request_timestamp,
+        ) = await self._script(
+            keys=self._keys,
+            args=[
+                int(token_cost),
+                "" if timestamp == -1 else repr(timestamp),
+                self._requests_per_10_seconds,
+                self._tokens_per_minute,
+                requests_needed,
+                self._ttl_ms,
+            ],
+        )
+        self._script_latest_timestamp = float(latest_timestamp)
+
+        # The script applies the same checks as _get_add_result to determine whether to add the request
+        return self._get_add_result(
+            token_cost,
+            float(request_timestamp),
+            request_count_in_10s,
+            token_count_in_60s,
+            float(requests_full_time),
+            float(tokens_full_time),
+        )
+
+    def _latest_timestamp(self) -> float:
+        return self._script_latest_timestamp
+
+
+class LimiterStore(ABC):
+    """
+    Creates the sliding windows used by the built-in rate limiters.
+    The store determines where the window state is held.
+    """
+
+    @abstractmethod
+    def create_window(self, name: str, requests_per_10_seconds: int, tokens_per_minute: int) -> RateLimitWindow:
+        pass
+
+
+class MemoryLimiterStore(LimiterStore):
+    """
+    Holds window state in the worker process
+    """
+
+    def create_window(self, name: str, requests_per_10_seconds: int, tokens_per_minute: int) -> RateLimitWindow:
+        return IndexedSlidingWindow(
+            requests_per_10_seconds=requests_per_10_seconds, tokens_per_minute=tokens_per_minute
+        )
+
+
+class SharedMemoryLimiterStore(LimiterStore):
+    """
+    Holds window state in memory-mapped files shared by the worker processes on a node
+    """
+
+    def __init__(self, shared_memory_dir: str):
+        self._shared_memory_dir = shared_memory_dir
+
+    def create_window(self, name: str, requests_per_10_seconds: int, tokens_per_minute: int) -> RateLimitWindow:
+        # include the limits in the file name so that workers with different limits
+        # (e.g. after a config change) don't share (and resize) the same file
+        file_name = f"{_sanitize_file_name(name)}-{requests_per_10_seconds}-{tokens_per_minute}.window"
+        path = os.path.join(self._shared_memory_dir, file_name)
+        # re-use windows when the limiters are re-created (e.g. PATCH /++/config)
+        # rather than opening (and mapping) the file again
+        window = _shared_memory_windows.get(path)
+        if window is None:
+            window = SharedMemorySlidingWindow(
+                path=path,
+                requests_per_10_seconds=requests_per_10_seconds,
+                tokens_per_minute=tokens_per_minute,
             )
+            _shared_memory_windows[path] = window
+        return window
 
-        # We have enough capacity to add the request
-        self._requests.append(WindowEntry(timestamp, token_cost))
-        # token_count_in_60s += token_cost
-        # request_count_in_10s += 1
-        return WindowAddResult(
-            success=True,
-            retry_after=None,
-            retry_reason=None,
-            remaining_tokens=self._tokens_per_minute - token_count_in_60s,
-            remaining_requests=self._requests_per_10_seconds - request_count_in_10s,
+
+class RedisLimiterStore(LimiterStore):
+    """
+    Holds window state on a Redis-compatible server shared by multiple simulator instances
+    """
+
+    def __init__(self, client, key_prefix: str):
+        self._client = client
+        self._key_prefix = key_prefix
+
+    def create_window(self, name: str, requests_per_10_seconds: int, tokens_per_minute: int) -> RateLimitWindow:
+        # include the limits in the key so that instances with different limits don't share state
+        # and use a hash tag so that all keys for a window are in the same slot when using Redis Cluster
+        key = f"{self._key_prefix}:{{{name}-{requests_per_10_seconds}-{tokens_per_minute}}}"
+        return RedisSlidingWindow(
+            client=self._client,
+            key=key,
+            requests_per_10_seconds=requests_per_10_seconds,
+            tokens_per_minute=tokens_per_minute,
         )
 
 
+_shared_memory_windows: dict[str, SharedMemorySlidingWindow] = {}
+_redis_clients: dict[str, any] = {}
+
+
+def create_limiter_store(store_config: LimiterStoreConfig | None) -> LimiterStore:
+    """
+    Create the limiter store for the configured store type
+    """
+    store_type = store_config.type if store_config else "memory"
+    if store_type == "shared-memory":
+        return SharedMemoryLimiterStore(store_config.shared_memory_dir)
+    if store_type == "redis":
+        # pylint: disable-next=import-outside-toplevel
+        import redis.asyncio  # only required when using the redis store
+
+        # re-use clients when the limiters are re-created (e.g. PATCH /++/config)
+        client = _redis_clients.get(store_config.redis_url)
+        if client is None:
+            client = redis.asyncio.from_url(store_config.redis_url)
+            _redis_clients[store_config.redis_url] = client
+        return RedisLimiterStore(client, key_prefix=store_config.redis_key_prefix)
+    return MemoryLimiterStore()
+
+
+def _sanitize_file_name(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+
+
 def create_openai_sliding_window_limiter(
-    deployments: dict[str, int]
+    deployments: dict[str, int], store_config: LimiterStoreConfig | None = None
 ) -> Callable[[RequestContext, Response], Response | None]:
 
     @dataclass
     class OpenAISlidingWindowLimit:
         deployment: str
-        window: SlidingWindow
+        window: RateLimitWindow
 
     deployment_limits: dict[str, OpenAISlidingWindowLimit] = {}
+    store = create_limiter_store(store_config)
 
     for deployment, tokens_per_minute in deployments.items():
         requests_per_10s = math.ceil(tokens_per_minute / 1000)  # 1/6 * (6 * TPM / 1000)
         deployment_limits[deployment] = OpenAISlidingWindowLimit(
             deployment=deployment,
-            window=SlidingWindow(requests_per_10_seconds=requests_per_10s, tokens_per_minute=tokens_per_minute),
+            window=store.create_window(
+                name=deployment,
+                requests_per_10_seconds=requests_per_10s,
+                tokens_per_minute=tokens_per_minute,
+            ),
         )
 
     async def limiter(context: RequestContext, response: Response) -> Awaitable[Response]:
@@ -258,7 +795,7 @@ def create_openai_sliding_window_limiter(
                 deployment_warnings_issues[deployment_name] = True
             return response
 
-        window_result = limits.window.add_request(token_cost=token_cost)
+        window_result = await limits.window.add_request_async(token_cost=token_cost)
         if not window_result.success:
             cost = token_cost if window_result.retry_reason == "tokens" else 1
             simulator_metrics.histogram_rate_limit.record(
@@ -307,5 +844,5 @@ def get_default_limiters(config: Config):
     # whether the request should be allowed
     # Limiter returns Response object if request should be blocked or None otherwise
     return {
-        "openai": create_openai_limiter(openai_deployment_limits),
+        "openai": create_openai_limiter(openai_deployment_limits, config.limiter_store),
     }
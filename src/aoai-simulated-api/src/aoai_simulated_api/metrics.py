@@ -6,10 +6,17 @@ from opentelemetry import metrics
 class SimulatorMetrics:
     histogram_latency_base: metrics.Histogram
     histogram_latency_full: metrics.Histogram
+    histogram_latency_ttft: metrics.Histogram
+    histogram_latency_stream: metrics.Histogram
     histogram_tokens_used: metrics.Histogram
     histogram_tokens_requested: metrics.Histogram
     histogram_tokens_rate_limit: metrics.Histogram
     histogram_rate_limit: metrics.Histogram
+    counter_tokenizer_cache: metrics.Counter
+    counter_recording_cache: metrics.Counter
+    counter_recording_cache_evictions: metrics.Counter
+    updown_counter_recording_cache_size: metrics.UpDownCounter
+    counter_replay_similarity_match: metrics.Counter
 
 
 def _get_simulator_metrics() -> SimulatorMetrics:
@@ -27,6 +34,18 @@ def _get_simulator_metrics() -> SimulatorMetrics:
             description="Full latency of handling the request (including simulated latency)",
             unit="seconds",
         ),
+        # dimensions: deployment
+        histogram_latency_ttft=meter.create_histogram(
+            name="aoai-simulator.latency.ttft",
+            description="Time to the first token for streamed responses (including simulated latency)",
+            unit="seconds",
+        ),
+        # dimensions: deployment
+        histogram_latency_stream=meter.create_histogram(
+            name="aoai-simulator.latency.stream",
+            description="Full duration of streamed responses (including simulated latency)",
+            unit="seconds",
+        ),
         # dimensions: deployment, token_type
         histogram_tokens_used=meter.create_histogram(
             name="aoai-simulator.tokens.used",
@@ -51,6 +70,34 @@ def _get_simulator_metrics() -> SimulatorMetrics:
             description="Number of requests that were rate-limited",
             unit="requests",
         ),
+        # dimensions: result
+        counter_tokenizer_cache=meter.create_counter(
+            name="aoai-simulator.tokenizer.cache",
+            description="Number of lookups in the token count cache",
+            unit="lookups",
+        ),
+        # dimensions: result
+        counter_recording_cache=meter.create_counter(
+            name="aoai-simulator.recordings.cache",
+            description="Number of lookups in the loaded recordings cache",
+            unit="lookups",
+        ),
+        counter_recording_cache_evictions=meter.create_counter(
+            name="aoai-simulator.recordings.cache.evictions",
+            description="Number of recordings evicted from the loaded recordings cache",
+            unit="recordings",
+        ),
+        updown_counter_recording_cache_size=meter.create_up_down_counter(
+            name="aoai-simulator.recordings.cache.size",
+            description="Approximate size of the recordings in the loaded recordings cache",
+            unit="bytes",
+        ),
+        # dimensions: result
+        counter_replay_similarity_match=meter.create_counter(
+            name="aoai-simulator.recordings.similarity_match",
+            description="Number of replay misses looked up in the recording similarity index",
+            unit="requests",
+        ),
     )
 
 
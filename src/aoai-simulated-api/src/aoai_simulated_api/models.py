@@ -1,26 +1,37 @@
 from dataclasses import dataclass
 import random
+import time
 from typing import Annotated, Awaitable, Callable
 
 # from aoai_simulated_api.pipeline import RequestContext
 from fastapi import Request, Response
+import httpx
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from requests import Response as requests_Response
 from starlette.routing import Route, Match
 
 import nanoid
+import orjson
 
 
 class RequestContext:
     _config: "Config"
     _request: Request
     _values: dict[str, any]
+    _start_time: float
+    _body: bytes | None
+    _json: any
+    _path_params: dict[str, any]
 
     def __init__(self, config: "Config", request: Request):
         self._config = config
         self._request = request
         self._values = {}
+        self._start_time = time.perf_counter()
+        self._body = None
+        self._json = _not_parsed
+        self._path_params = {}
 
     @property
     def config(self) -> "Config":
@@ -34,6 +45,42 @@ class RequestContext:
     def values(self) -> dict[str, any]:
         return self._values
 
+    @property
+    def start_time(self) -> float:
+        """The time.perf_counter() value when the request started processing"""
+        return self._start_time
+
+    @property
+    def path_params(self) -> dict[str, any]:
+        """The path parameters for generators that declare their route with the generator_route decorator"""
+        return self._path_params
+
+    @path_params.setter
+    def path_params(self, value: dict[str, any]):
+        self._path_params = value
+
+    async def get_request_body(self) -> bytes:
+        """
+        Returns the raw request body.
+        The body is read on first use and the same bytes are returned for subsequent calls.
+        """
+        if self._body is None:
+            self._body = await self._request.body()
+        return self._body
+
+    async def get_request_json(self) -> any:
+        """
+        Returns the request body parsed as JSON.
+        The body is parsed on first use and the same value is returned for subsequent calls
+        so that generators, limiters and record/replay can share a single parse of large requests.
+        Callers should treat the returned value as read-only.
+        """
+        if self._json is _not_parsed:
+            body = await self.get_request_body()
+            # orjson.JSONDecodeError is a subclass of json.JSONDecodeError
+            self._json = orjson.loads(body)
+        return self._json
+
     def _strip_path_query(self, path: str) -> str:
         query_start = path.find("?")
         if query_start != -1:
@@ -53,7 +100,12 @@ class RequestContext:
                 and a dictionary of path parameters if the match is successful.
         """
 
-        route = Route(path=path, methods=methods, endpoint=_endpoint)
+        route_key = (path, tuple(methods))
+        route = _routes.get(route_key)
+        if route is None:
+            # compile the route once per path/methods rather than on each call
+            route = Route(path=path, methods=methods, endpoint=_endpoint)
+            _routes[route_key] = route
         path_to_match = self._strip_path_query(request.url.path)
         match, scopes = route.matches({"type": "http", "method": request.method, "path": path_to_match})
         if match != Match.FULL:
@@ -61,13 +113,59 @@ class RequestContext:
         return (True, scopes["path_params"])
 
 
+@dataclass
+class UpstreamEndpoint:
+    """An Azure OpenAI endpoint that requests are forwarded to in record mode"""
+
+    name: str
+    endpoint: str
+    key: str
+
+
+@dataclass
+class RequestMatchRule:
+    """Additional fields to ignore when matching requests for a route (e.g. /openai/deployments/{deployment}/...)"""
+
+    route: str
+    ignored_fields: list[str]
+
+
 class RecordingConfig(BaseSettings):
     model_config = SettingsConfigDict(extra="ignore")
 
     dir: str = Field(default=".recording", alias="RECORDING_DIR")
     autosave: bool = Field(default=True, alias="RECORDING_AUTOSAVE")
+    format: str = Field(default="yaml", alias="RECORDING_FORMAT", pattern="^(yaml|jsonl)$")
+    stream_timing_scale: float = Field(default=1.0, alias="RECORDING_STREAM_TIMING_SCALE", ge=0)
+    cache_max_bytes: int = Field(default=0, alias="RECORDING_CACHE_MAX_BYTES", ge=0)
+    match_mode: str = Field(default="exact", alias="RECORDING_MATCH_MODE", pattern="^(exact|canonical-json)$")
+    # comma-separated list of fields to ignore in canonical-json match mode (see record_replay/matching.py)
+    match_ignored_fields: str = Field(default="user", alias="RECORDING_MATCH_IGNORED_FIELDS")
+    # loaded from RECORDING_MATCH_RULES_PATH (see config_loader)
+    match_rules: list[RequestMatchRule] = []
+    # nearest-match fallback for replay misses (see record_replay/similarity.py)
+    similarity_match: bool = Field(default=False, alias="RECORDING_SIMILARITY_MATCH")
+    similarity_threshold: float = Field(default=0.8, alias="RECORDING_SIMILARITY_THRESHOLD", gt=0, le=1)
+    preload: bool = Field(default=False, alias="RECORDING_PRELOAD")
+    preload_max_workers: int | None = Field(default=None, alias="RECORDING_PRELOAD_MAX_WORKERS", ge=1)
     aoai_api_key: str | None = Field(default=None, alias="AZURE_OPENAI_KEY")
     aoai_api_endpoint: str | None = Field(default=None, alias="AZURE_OPENAI_ENDPOINT")
+    forwarder_timeout: float = Field(default=30, alias="RECORDING_FORWARDER_TIMEOUT", gt=0)
+    forwarder_connect_timeout: float = Field(default=10, alias="RECORDING_FORWARDER_CONNECT_TIMEOUT", gt=0)
+    forwarder_max_connections: int = Field(default=100, alias="RECORDING_FORWARDER_MAX_CONNECTIONS", ge=1)
+    forwarder_max_keepalive_connections: int = Field(
+        default=20, alias="RECORDING_FORWARDER_MAX_KEEPALIVE_CONNECTIONS", ge=0
+    )
+    forwarder_http2: bool = Field(default=False, alias="RECORDING_FORWARDER_HTTP2")
+    upstream_max_concurrency: int = Field(default=32, alias="RECORDING_UPSTREAM_MAX_CONCURRENCY", ge=1)
+    upstream_max_retries: int = Field(default=10, alias="RECORDING_UPSTREAM_MAX_RETRIES", ge=0)
+    upstream_routing: str = Field(
+        default="least-outstanding",
+        alias="RECORDING_UPSTREAM_ROUTING",
+        pattern="^(least-outstanding|remaining-tokens)$",
+    )
+    # loaded from RECORDING_UPSTREAM_CONFIG_PATH (see config_loader)
+    upstream_endpoints: list[UpstreamEndpoint] = []
     forwarders: (
         list[
             Callable[
@@ -76,6 +174,8 @@ class RecordingConfig(BaseSettings):
                 | Awaitable[Response]
                 | requests_Response
                 | Awaitable[requests_Response]
+                | httpx.Response
+                | Awaitable[httpx.Response]
                 | dict
                 | Awaitable[dict]
                 | None,
@@ -84,6 +184,76 @@ class RecordingConfig(BaseSettings):
         | None
     ) = []
 
+    def get_upstream_endpoints(self) -> list[UpstreamEndpoint]:
+        """
+        Returns the endpoints to forward Azure OpenAI requests to:
+        upstream_endpoints if set, otherwise AZURE_OPENAI_ENDPOINT/AZURE_OPENAI_KEY
+        """
+        if self.upstream_endpoints:
+            return self.upstream_endpoints
+        if self.aoai_api_endpoint and self.aoai_api_key:
+            return [UpstreamEndpoint(name="default", endpoint=self.aoai_api_endpoint, key=self.aoai_api_key)]
+        return []
+
+
+class LimiterStoreConfig(BaseSettings):
+    """
+    Defines where the state for the built-in rate limiters is stored
+
+    type: "memory" keeps state in the worker process, "shared-memory" shares state between
+          the worker processes on a node using memory-mapped files in shared_memory_dir,
+          "redis" shares state between simulator instances using the Redis server at redis_url
+    """
+
+    model_config = SettingsConfigDict(extra="ignore")
+
+    type: str = Field(default="memory", alias="LIMITER_STORE_TYPE", pattern="^(memory|shared-memory|redis)$")
+    shared_memory_dir: str = Field(default="/dev/shm/aoai-simulated-api", alias="LIMITER_SHARED_MEMORY_DIR")
+    redis_url: str = Field(default="redis://localhost:6379/0", alias="LIMITER_REDIS_URL")
+    redis_key_prefix: str = Field(default="aoai-simulated-api", alias="LIMITER_REDIS_KEY_PREFIX")
+
+
+class ResponsePoolConfig(BaseSettings):
+    """
+    Defines the pool of pre-generated responses for OpenAI completions and (non-streaming) chat completions
+
+    size: the number of distinct responses to pre-generate for each model/max_tokens combination (0 disables the pool)
+    bucket_size: max_tokens values are rounded down to a multiple of bucket_size so that requests share pooled responses
+    """
+
+    model_config = SettingsConfigDict(extra="ignore")
+
+    size: int = Field(default=0, alias="GENERATOR_RESPONSE_POOL_SIZE", ge=0)
+    bucket_size: int = Field(default=16, alias="GENERATOR_RESPONSE_POOL_BUCKET_SIZE", ge=1)
+
+
+class StreamingConfig(BaseSettings):
+    """
+    Defines how generated chat completions are streamed
+
+    tokens_per_chunk: the number of tokens of content to include in each streamed chunk
+    """
+
+    model_config = SettingsConfigDict(extra="ignore")
+
+    tokens_per_chunk: int = Field(default=1, alias="GENERATOR_STREAM_TOKENS_PER_CHUNK", ge=1)
+
+
+class ExecutorConfig(BaseSettings):
+    """
+    Defines the executor used to run CPU-heavy work (e.g. tokenizing large prompts) off the event loop
+
+    type: "thread" uses a thread pool, "process" uses a process pool and "none" runs all work inline
+    max_workers: the maximum number of workers in the pool (defaults to the concurrent.futures default)
+    min_offload_size: work smaller than this (approximately the number of bytes processed) is run inline
+    """
+
+    model_config = SettingsConfigDict(extra="ignore")
+
+    type: str = Field(default="thread", alias="EXECUTOR_TYPE", pattern="^(none|thread|process)$")
+    max_workers: int | None = Field(default=None, alias="EXECUTOR_MAX_WORKERS", ge=1)
+    min_offload_size: int = Field(default=65536, alias="EXECUTOR_MIN_OFFLOAD_SIZE", ge=0)
+
 
 class CompletionLatency(BaseSettings):
     mean: float = Field(default=15, alias="LATENCY_OPENAI_COMPLETIONS_MEAN")
@@ -109,6 +279,19 @@ class EmbeddingLatency(BaseSettings):
         return random.normalvariate(self.mean, self.std_dev)
 
 
+class ChatCompletionStreamingLatency(BaseSettings):
+    ttft_mean: float = Field(default=500, alias="LATENCY_OPENAI_CHAT_COMPLETIONS_STREAMING_TTFT_MEAN")
+    ttft_std_dev: float = Field(default=100, alias="LATENCY_OPENAI_CHAT_COMPLETIONS_STREAMING_TTFT_STD_DEV")
+    per_token_mean: float = Field(default=19, alias="LATENCY_OPENAI_CHAT_COMPLETIONS_STREAMING_PER_TOKEN_MEAN")
+    per_token_std_dev: float = Field(default=6, alias="LATENCY_OPENAI_CHAT_COMPLETIONS_STREAMING_PER_TOKEN_STD_DEV")
+
+    def get_ttft_value(self) -> float:
+        return max(random.normalvariate(self.ttft_mean, self.ttft_std_dev), 0)
+
+    def get_per_token_value(self) -> float:
+        return max(random.normalvariate(self.per_token_mean, self.per_token_std_dev), 0)
+
+
 class LatencyConfig(BaseSettings):
     """
     Defines the latency for different types of requests
@@ -116,10 +299,13 @@ class LatencyConfig(BaseSettings):
     open_ai_embeddings: the latency for OpenAI embeddings - mean is mean request duration in milliseconds
     open_ai_completions: the latency for OpenAI completions - mean is the number of milliseconds per token
     open_ai_chat_completions: the latency for OpenAI chat completions - mean is the number of milliseconds per token
+    open_ai_chat_completions_streaming: the latency for streamed OpenAI chat completions - ttft is the time to the
+        first token in milliseconds and per_token is the number of milliseconds per subsequent token
     """
 
     open_ai_completions: CompletionLatency = Field(default=CompletionLatency())
     open_ai_chat_completions: ChatCompletionLatency = Field(default=ChatCompletionLatency())
+    open_ai_chat_completions_streaming: ChatCompletionStreamingLatency = Field(default=ChatCompletionStreamingLatency())
     open_ai_embeddings: EmbeddingLatency = Field(default=EmbeddingLatency())
 
 
@@ -139,6 +325,10 @@ class Config(PatchableConfig):
 
     generators: list[Callable[[RequestContext], Response | Awaitable[Response] | None]] = None
     limiters: dict[str, Callable[[RequestContext, Response], Response | None]] = {}
+    limiter_store: LimiterStoreConfig = Field(default=LimiterStoreConfig())
+    response_pool: ResponsePoolConfig = Field(default=ResponsePoolConfig())
+    streaming: StreamingConfig = Field(default=StreamingConfig())
+    executor: ExecutorConfig = Field(default=ExecutorConfig())
     extension_path: Annotated[str | None, Field(default=None, alias="EXTENSION_PATH")]
 
 
@@ -148,6 +338,15 @@ class OpenAIDeployment:
     model: str
     tokens_per_minute: int = 0
     embedding_size: int = 0
+    # overrides the latency.open_ai_chat_completions_streaming config for this deployment
+    streaming_latency: ChatCompletionStreamingLatency | None = None
+
+
+# sentinel to distinguish an unparsed body from a body that parsed to None
+_not_parsed = object()
+
+_routes: dict[tuple[str, tuple[str, ...]], Route] = {}
+
 
 # re-using Starlette's Route class to define a route
 # endpoint to pass to Route
@@ -0,0 +1,164 @@
+"""
+Admission control for forwarding requests to a rate-limited upstream API in record mode.
+
+Forwarding requests as fast as they arrive to an upstream with limited capacity (e.g. an Azure OpenAI deployment
+with a low tokens-per-minute limit) mostly results in 429 responses, which aren't recorded. The admission
+controller limits the number of concurrent forwarded requests for each deployment and adapts the limit using
+AIMD (additive increase, multiplicative decrease): the limit is halved when the upstream responds with a 429
+and increased by (approximately) one for each limit's worth of successful responses. After a 429, requests
+for the deployment are held until the retry-after period has passed.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+import logging
+import time
+from typing import AsyncIterator, Mapping
+import weakref
+
+from aoai_simulated_api.models import RecordingConfig
+
+logger = logging.getLogger(__name__)
+
+# used when a 429 response doesn't include a retry-after value
+_default_retry_after_s = 1.0
+
+
+def get_retry_after_seconds(headers: Mapping[str, str]) -> float | None:
+    """Returns the retry-after value from the response headers in seconds (or None if not set)"""
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            # HTTP-date values aren't used by Azure OpenAI
+            pass
+    return None
+
+
+def _get_int_header(headers: Mapping[str, str], name: str) -> int | None:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+class _DeploymentAdmission:
+    limit: float
+    in_flight: int
+    blocked_until: float
+    condition: asyncio.Condition
+
+    def __init__(self, limit: int):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.condition = asyncio.Condition()
+
+
+class UpstreamAdmissionController:
+    """
+    Limits the number of concurrent forwarded requests for each deployment (see module docstring).
+    Requests that can't be admitted wait in a queue rather than failing
+    """
+
+    max_concurrency: int
+    _deployments: dict[str, _DeploymentAdmission]
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._deployments = {}
+
+    def _get_deployment(self, deployment_name: str) -> _DeploymentAdmission:
+        deployment = self._deployments.get(deployment_name)
+        if deployment is None:
+            deployment = _DeploymentAdmission(self.max_concurrency)
+            self._deployments[deployment_name] = deployment
+        return deployment
+
+    def get_limit(self, deployment_name: str) -> int:
+        return int(self._get_deployment(deployment_name).limit)
+
+    @asynccontextmanager
+    async def admit(self, deployment_name: str) -> AsyncIterator[None]:
+        """Waits until a request for the deployment can be forwarded and holds a slot until the context exits"""
+        deployment = self._get_deployment(deployment_name)
+        async with deployment.condition:
+            while True:
+                blocked_for = deployment.blocked_until - time.monotonic()
+                if blocked_for > 0:
+                    try:
+                        await asyncio.wait_for(deployment.condition.wait(), timeout=blocked_for)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if deployment.in_flight < int(deployment.limit):
+                    break
+                await deployment.condition.wait()
+            deployment.in_flight += 1
+        try:
+            yield
+        finally:
+            async with deployment.condition:
+                deployment.in_flight -= 1
+                deployment.condition.notify_all()
+
+    def record_response(self, deployment_name: str, status_code: int, headers: Mapping[str, str]):
+        """Updates the limit for the deployment based on an upstream response"""
+        deployment = self._get_deployment(deployment_name)
+        now = time.monotonic()
+        if status_code == 429:
+            if now >= deployment.blocked_until:
+                # only decrease once for the requests that were in flight when the limit was hit
+                deployment.limit = max(1.0, deployment.limit / 2)
+                logger.info(
+                    "📉 Upstream rate-limited deployment %s - reducing concurrency to %s",
+                    deployment_name,
+                    int(deployment.limit),
+                )
+            retry_after = get_retry_after_seconds(headers)
+            if retry_after is None:
+                retry_after = _default_retry_after_s
+            deployment.blocked_until = max(deployment.blocked_until, now + retry_after)
+            return
+
+        if status_code >= 300:
+            return
+        remaining_requests = _get_int_header(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _get_int_header(headers, "x-ratelimit-remaining-tokens")
+        if remaining_requests == 0 or remaining_tokens == 0:
+            # at the upstream limit - don't increase concurrency
+            return
+        deployment.limit = min(float(self.max_concurrency), deployment.limit + 1 / deployment.limit)
+
+
+# asyncio.Condition is bound to the event loop it is used on, so controllers are per event loop
+# (this is a single controller in the simulator, but the tests run the simulator in multiple event loops)
+_admission_controllers: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, UpstreamAdmissionController] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_admission_controller(recording_config: RecordingConfig) -> UpstreamAdmissionController:
+    """
+    Returns the shared admission controller for forwarding requests.
+    Must be called from the event loop that the controller will be used on
+    """
+    loop = asyncio.get_running_loop()
+    admission_controller = _admission_controllers.get(loop)
+    if (
+        admission_controller is None
+        or admission_controller.max_concurrency != recording_config.upstream_max_concurrency
+    ):
+        admission_controller = UpstreamAdmissionController(recording_config.upstream_max_concurrency)
+        _admission_controllers[loop] = admission_controller
+    return admission_controller
@@ -1,20 +1,35 @@
+import asyncio
+from collections.abc import MutableMapping
 import inspect
 import logging
 import time
 from typing import Awaitable, Callable
 
 import fastapi
+import httpx
+import orjson
 import requests
 
 from aoai_simulated_api import constants
+from aoai_simulated_api.metrics import simulator_metrics
 from aoai_simulated_api.models import RequestContext
 from aoai_simulated_api.record_replay.openai import forward_to_azure_openai
-from aoai_simulated_api.record_replay.models import RecordedResponse, get_request_hash, hash_request_parts
-from aoai_simulated_api.record_replay.persistence import YamlRecordingPersister
+from aoai_simulated_api.record_replay.matching import RequestMatcher
+from aoai_simulated_api.record_replay.models import RecordedResponse, hash_request_parts
+from aoai_simulated_api.record_replay.persistence import RecordingPersister
+from aoai_simulated_api.record_replay.preload import get_max_rss_mb, preload_recordings
+from aoai_simulated_api.record_replay.recording_cache import RecordingCache
+from aoai_simulated_api.record_replay.replay import LoadedRecording, RenderedResponse
+from aoai_simulated_api.record_replay.similarity import get_prompt_text
+from aoai_simulated_api.record_replay.streaming import (
+    EVENT_STREAM_CONTENT_TYPE,
+    create_replay_streaming_response,
+    split_event_stream,
+)
 
 logger = logging.getLogger(__name__)
 
-text_content_types = ["application/json", "application/text"]
+text_content_types = ["application/json", "application/text", EVENT_STREAM_CONTENT_TYPE]
 
 
 def get_default_forwarders() -> list[
@@ -24,6 +39,8 @@ def get_default_forwarders() -> list[
         | Awaitable[fastapi.Response]
         | requests.Response
         | Awaitable[requests.Response]
+        | httpx.Response
+        | Awaitable[httpx.Response]
         | dict
         | Awaitable[dict]
         | None,
@@ -31,11 +48,15 @@ def get_default_forwarders() -> list[
 ]:
     # Return a list of functions to call when recording and no matching saved request is found
     #
-    # If the function returns a Response object (from FastAPI or requests package)
+    # If the function returns a Response object (from FastAPI, httpx or requests package)
     # it will be used as the response for the request
     #
     # If the function returns a dict then it should have a "response" property
-    # with the response and a "persist" property that is True/False to indicate whether to persist the response
+    # with the response and a "persist" property that is True/False to indicate whether to persist the response.
+    # For streamed (SSE) responses, the dict can include a "stream_event_offsets_ms" property with the
+    # offset of each event (see streaming.read_event_stream) to replay the stream with the original timing.
+    # The dict can also include a "duration_ms" property to override the recorded duration
+    # (e.g. to exclude time spent waiting to forward the request)
     #
     # If the function returns None, the next function in the list will be called
     return [
@@ -44,9 +65,17 @@ def get_default_forwarders() -> list[
 
 
 class ForwardedResponse:
-    def __init__(self, response: fastapi.Response, persist_response: bool):
+    def __init__(
+        self,
+        response: fastapi.Response,
+        persist_response: bool,
+        stream_event_offsets_ms: list[int] | None = None,
+        duration_ms: int | None = None,
+    ):
         self._response = response
         self._persist_response = persist_response
+        self._stream_event_offsets_ms = stream_event_offsets_ms
+        self._duration_ms = duration_ms
 
     @property
     def response(self) -> fastapi.Response:
@@ -56,10 +85,19 @@ class ForwardedResponse:
     def persist_response(self) -> bool:
         return self._persist_response
 
+    @property
+    def stream_event_offsets_ms(self) -> list[int] | None:
+        return self._stream_event_offsets_ms
+
+    @property
+    def duration_ms(self) -> int | None:
+        return self._duration_ms
+
 
 class RecordReplayHandler:
 
-    _recordings: dict[str, dict[int, RecordedResponse]]
+    _recordings: RecordingCache
+    _in_flight_requests: dict[tuple[str, int], asyncio.Future[tuple[RecordedResponse, dict[str, str]] | None]]
     _forwarders: list[
         Callable[
             [RequestContext],
@@ -67,6 +105,8 @@ class RecordReplayHandler:
             | Awaitable[fastapi.Response]
             | requests.Response
             | Awaitable[requests.Response]
+            | httpx.Response
+            | Awaitable[httpx.Response]
             | dict
             | Awaitable[dict]
             | None,
@@ -76,7 +116,7 @@ class RecordReplayHandler:
     def __init__(
         self,
         simulator_mode: str,
-        persister: YamlRecordingPersister,
+        persister: RecordingPersister,
         forwarders: list[
             Callable[
                 [RequestContext],
@@ -84,59 +124,156 @@ class RecordReplayHandler:
                 | Awaitable[fastapi.Response]
                 | requests.Response
                 | Awaitable[requests.Response]
+                | httpx.Response
+                | Awaitable[httpx.Response]
                 | dict
                 | Awaitable[dict]
                 | None,
             ]
         ],
         autosave: bool,
+        stream_timing_scale: float = 1.0,
+        cache_max_bytes: int = 0,
+        request_matcher: RequestMatcher | None = None,
+        similarity_threshold: float | None = None,
     ):
         self._simulator_mode = simulator_mode
         self._persister = persister
         self._forwarders = forwarders
         self._autosave = autosave
+        self._stream_timing_scale = stream_timing_scale
+        self._request_matcher = request_matcher or RequestMatcher()
+        # misses in replay mode are served by the most similar recorded request if set (see similarity.py)
+        self._similarity_threshold = similarity_threshold if simulator_mode == "replay" else None
 
         # recordings keyed by URL, within a recording, requests are keyed by hash of request values
-        self._recordings = {}
+        self._recordings = RecordingCache(cache_max_bytes, on_evict=self._on_recording_evicted)
+        # requests that are being forwarded in record mode, keyed by URL and hash of request values
+        self._in_flight_requests = {}
+
+    async def _get_recording_for_url(self, url: str) -> LoadedRecording | None:
+        return self._load_recording(url, expect_recording_file=self._simulator_mode == "replay")
 
-    async def _get_recording_for_url(self, url: str) -> dict[int, RecordedResponse] | None:
+    def _load_recording(self, url: str, expect_recording_file: bool) -> LoadedRecording | None:
         recording = self._recordings.get(url)
         if recording:
             return recording
 
-        expect_recording_file = self._simulator_mode == "replay"
-        recording = self._persister.load_recording_for_url(url, expect_recording_file)
-        if not recording:
+        persisted_recording = self._persister.load_recording_for_url(url, expect_recording_file)
+        if not persisted_recording:
             return None
 
-        self._recordings[url] = recording
+        recording = self._create_loaded_recording(persisted_recording)
+        self._recordings.set(url, recording)
         return recording
 
+    def _create_loaded_recording(self, recording: MutableMapping[int, RecordedResponse]) -> LoadedRecording:
+        return LoadedRecording(
+            recording,
+            self._request_matcher.get_recording_key_function(),
+            similarity_threshold=self._similarity_threshold,
+        )
+
+    def preload(self, max_workers: int | None):
+        """Loads all recordings in the recording directory (see preload.py)"""
+        for url, recording in preload_recordings(self._persister, max_workers):
+            self._recordings.set(url, self._create_loaded_recording(recording))
+        logger.info(
+            "📼 Loaded recordings: %s (approximately %.1f MB)",
+            len(self._recordings),
+            self._recordings.resident_bytes / 1024 / 1024,
+        )
+        max_rss_mb = get_max_rss_mb()
+        if max_rss_mb is not None:
+            logger.info("📼 Process peak memory usage: %.1f MB", max_rss_mb)
+
+    def _on_recording_evicted(self, url: str, recording: LoadedRecording):
+        if recording.modified and not self._autosave:
+            # the recording is re-loaded from the file when next used, so save the recorded responses
+            self._persister.save_recording(url, recording)
+
     async def handle_request(self, context: RequestContext) -> fastapi.Response | None:
         request = context.request
         url = request.url.path
         recording = await self._get_recording_for_url(url)
+        # the request key is computed once per request
+        request_key = None
         if recording:
-            request_hash = await get_request_hash(request)
-            response_info = recording.get(request_hash)
-            if response_info:
-                headers = {k: v[0] for k, v in response_info.headers.items()}
-                for key, value in response_info.context_values.items():
-                    context.values[key] = value
-                context.values[constants.TARGET_DURATION_MS] = response_info.duration_ms
-                return fastapi.Response(
-                    content=response_info.body, status_code=response_info.status_code, headers=headers
-                )
+            request_key = await self._request_matcher.get_request_key(context)
+            rendered_response = recording.get_rendered_response(request_key)
+            if rendered_response:
+                return rendered_response.create_response(context, self._stream_timing_scale)
             logger.debug("No recorded response found for request %s %s", request.method, url)
+            if recording.similarity_index is not None:
+                rendered_response = await self._get_similar_rendered_response(context, recording)
+                if rendered_response:
+                    return rendered_response.create_response(context, self._stream_timing_scale)
         else:
             logger.debug("No recording found for URL: %s", url)
 
         if self._simulator_mode == "record":
-            return await self._record_request(context)
+            if request_key is None:
+                request_key = await self._request_matcher.get_request_key(context)
+            return await self._record_request(context, request_key)
 
         return None
 
-    async def _record_request(self, context: RequestContext) -> fastapi.Response:
+    @staticmethod
+    async def _get_similar_rendered_response(
+        context: RequestContext, recording: LoadedRecording
+    ) -> RenderedResponse | None:
+        try:
+            prompt_text = get_prompt_text(await context.get_request_json())
+        except orjson.JSONDecodeError:
+            prompt_text = None
+        match = recording.similarity_index.find(prompt_text) if prompt_text else None
+        if match is None:
+            simulator_metrics.counter_replay_similarity_match.add(1, {"result": "miss"})
+            return None
+        request_key, similarity = match
+        simulator_metrics.counter_replay_similarity_match.add(1, {"result": "hit"})
+        logger.debug(
+            "Using recorded response for the most similar request (similarity %.2f) for %s %s",
+            similarity,
+            context.request.method,
+            context.request.url.path,
+        )
+        return recording.get_rendered_response(request_key)
+
+    async def _record_request(self, context: RequestContext, request_key: int) -> fastapi.Response:
+        # Identical requests that arrive while a request is being forwarded (e.g. at the start of a load test)
+        # wait for the forwarded response rather than each being forwarded
+        in_flight_key = (context.request.url.path, request_key)
+        in_flight_request = self._in_flight_requests.get(in_flight_key)
+        if in_flight_request is not None:
+            forwarded = await asyncio.shield(in_flight_request)
+            if forwarded is None:
+                # forwarding failed for the other request, so forward this request
+                return await self._record_request(context, request_key)
+            recorded_response, headers = forwarded
+            logger.debug("Using in-flight response for %s %s", context.request.method, context.request.url)
+            for key, value in recorded_response.context_values.items():
+                context.values[key] = value
+            # this request has already waited for the response
+            context.values[constants.TARGET_DURATION_MS] = 0
+            return self._create_response(context, recorded_response, headers, timing_scale=0)
+
+        in_flight_request = asyncio.get_running_loop().create_future()
+        self._in_flight_requests[in_flight_key] = in_flight_request
+        try:
+            recorded_response, headers = await self._forward_and_record_request(context, request_key)
+            in_flight_request.set_result((recorded_response, headers))
+        finally:
+            del self._in_flight_requests[in_flight_key]
+            if not in_flight_request.done():
+                in_flight_request.set_result(None)
+
+        # the events for streamed responses have already been received, so are sent without further delay
+        return self._create_response(context, recorded_response, headers, timing_scale=1.0)
+
+    async def _forward_and_record_request(
+        self, context: RequestContext, request_key: int
+    ) -> tuple[RecordedResponse, dict[str, str]]:
         request = context.request
 
         # Forward the response and capture the request duration
@@ -150,16 +287,32 @@ class RecordReplayHandler:
             )
         elapsed_time = end_time - start_time
         elapsed_time_ms = int(elapsed_time * 1000)
+        if forwarded_response.duration_ms is not None:
+            elapsed_time_ms = forwarded_response.duration_ms
 
         recorded_response = await self.get_recorded_response(context, forwarded_response, elapsed_time_ms)
         if forwarded_response.persist_response:
-            self.store_recorded_response(request, recorded_response)
+            self.store_recorded_response(request, recorded_response, request_key)
 
         context.values[constants.TARGET_DURATION_MS] = elapsed_time_ms
+        # use original headers in returned content
+        return recorded_response, dict(forwarded_response.response.headers)
+
+    @staticmethod
+    def _create_response(
+        context: RequestContext, recorded_response: RecordedResponse, headers: dict[str, str], timing_scale: float
+    ) -> fastapi.Response:
+        if recorded_response.stream_event_offsets_ms is not None:
+            return create_replay_streaming_response(
+                context,
+                events=split_event_stream(recorded_response.body),
+                event_offsets_ms=recorded_response.stream_event_offsets_ms,
+                timing_scale=timing_scale,
+                status_code=recorded_response.status_code,
+                headers=headers,
+            )
         return fastapi.Response(
-            content=recorded_response.body,
-            status_code=recorded_response.status_code,
-            headers=forwarded_response.response.headers,  # use original headers in returned content
+            content=recorded_response.body, status_code=recorded_response.status_code, headers=headers
         )
 
     async def get_recorded_response(
@@ -167,7 +320,7 @@ class RecordReplayHandler:
     ):
         response = forwarded_response.response
         request = context.request
-        request_body = await request.body()
+        request_body = await context.get_request_body()
         body = response.body
         # limit the request headers we persist - avoid persisting secrets and keep recording size low
         allowed_request_headers = ["content-type", "accept"]
@@ -197,21 +350,32 @@ class RecordReplayHandler:
                 "body": request_body,
             },
             duration_ms=elapsed_time_ms,
+            stream_event_offsets_ms=forwarded_response.stream_event_offsets_ms,
         )
 
         return recorded_response
 
-    def store_recorded_response(self, request: fastapi.Request, recorded_response: RecordedResponse):
+    def store_recorded_response(
+        self, request: fastapi.Request, recorded_response: RecordedResponse, request_key: int | None = None
+    ):
+        """
+        Stores the recorded response in the recording for the request URL.
+        request_key is the key for matching the request (see matching.RequestMatcher) if already computed
+        """
         logger.info("📝 Storing recording for %s %s", request.method, request.url)
-        recording = self._recordings.get(request.url.path)
+        # the recording may have been evicted from the cache since the request was matched
+        recording = self._load_recording(request.url.path, expect_recording_file=False)
         if not recording:
-            recording = {}
-            self._recordings[request.url.path] = recording
-        recording[recorded_response.request_hash] = recorded_response
+            recording = LoadedRecording({})
+        if request_key is None:
+            request_key = self._request_matcher.get_recorded_request_key(recorded_response)
+        recording[request_key] = recorded_response
+        # update the cached size of the recording
+        self._recordings.set(request.url.path, recording)
 
         if self._autosave:
-            # Save the recording to disk
-            self._persister.save_recording(request.url.path, recording)
+            # Save the recorded response to disk
+            self._persister.append_recorded_response(request.url.path, recorded_response, recording)
 
     def save_recordings(self):
         for url, recording in self._recordings.items():
@@ -224,16 +388,28 @@ class RecordReplayHandler:
                 response = await response
             if response is not None:
                 persist_response = True
+                stream_event_offsets_ms = None
+                duration_ms = None
                 # unwrap dictionary response
                 if isinstance(response, dict):
                     original_response = response
                     response = original_response["response"]
                     persist_response = original_response.get("persist", persist_response)
+                    stream_event_offsets_ms = original_response.get("stream_event_offsets_ms")
+                    duration_ms = original_response.get("duration_ms")
 
                 # normalize response to FastAPI Response
                 if isinstance(response, fastapi.Response):
                     # Already a FastAPI response
                     pass
+                elif isinstance(response, httpx.Response):
+                    # convert httpx response to FastAPI response
+                    headers = dict(response.headers)
+                    # httpx has already decoded the content
+                    headers.pop("content-encoding", None)
+                    response = fastapi.Response(
+                        content=response.content, status_code=response.status_code, headers=headers
+                    )
                 elif isinstance(response, requests.Response):
                     # convert requests response to FastAPI response
                     response = fastapi.Response(
@@ -248,6 +424,11 @@ class RecordReplayHandler:
                     del response.headers["Content-Length"]
 
                 # wrap and return
-                return ForwardedResponse(response=response, persist_response=persist_response)
+                return ForwardedResponse(
+                    response=response,
+                    persist_response=persist_response,
+                    stream_event_offsets_ms=stream_event_offsets_ms,
+                    duration_ms=duration_ms,
+                )
 
         return None
@@ -0,0 +1,70 @@
+"""
+A shared HTTP client for forwarders.
+
+Forwarding requests with a blocking HTTP client (e.g. requests) blocks the event loop (and so every other
+request on the worker) for the duration of the upstream call, and creating a new connection for each request
+adds a TLS handshake to every forwarded request. Forwarders should instead use the pooled async client from
+get_http_client, which keeps connections to the upstream services alive between requests.
+"""
+
+import asyncio
+import logging
+import weakref
+
+import httpx
+
+from aoai_simulated_api.models import RecordingConfig
+
+logger = logging.getLogger(__name__)
+
+# httpx.AsyncClient connections are bound to the event loop they were created on, so clients are per event loop
+# (this is a single client in the simulator, but the tests run the simulator in multiple event loops)
+_http_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, tuple[tuple, httpx.AsyncClient]] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_client_settings(recording_config: RecordingConfig) -> tuple:
+    return (
+        recording_config.forwarder_timeout,
+        recording_config.forwarder_connect_timeout,
+        recording_config.forwarder_max_connections,
+        recording_config.forwarder_max_keepalive_connections,
+        recording_config.forwarder_http2,
+    )
+
+
+def _create_http_client(recording_config: RecordingConfig) -> httpx.AsyncClient:
+    timeout = httpx.Timeout(recording_config.forwarder_timeout, connect=recording_config.forwarder_connect_timeout)
+    limits = httpx.Limits(
+        max_connections=recording_config.forwarder_max_connections,
+        max_keepalive_connections=recording_config.forwarder_max_keepalive_connections,
+    )
+    http2 = recording_config.forwarder_http2
+    if http2:
+        try:
+            import h2  # pylint: disable=import-outside-toplevel,unused-import
+        except ImportError:
+            logger.warning("⚠️ HTTP/2 requested for forwarding but the h2 package isn't installed - using HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(timeout=timeout, limits=limits, http2=http2)
+
+
+def get_http_client(recording_config: RecordingConfig) -> httpx.AsyncClient:
+    """
+    Returns the shared HTTP client for forwarding requests, using the forwarder settings from recording_config.
+    Must be called from the event loop that the client will be used on
+    """
+    loop = asyncio.get_running_loop()
+    settings = _get_client_settings(recording_config)
+    cached = _http_clients.get(loop)
+    if cached is not None:
+        cached_settings, http_client = cached
+        if cached_settings == settings:
+            return http_client
+        # the settings have changed. In-flight requests may still be using the existing client
+        # so it isn't closed here (its connections are closed when it is garbage collected)
+
+    http_client = _create_http_client(recording_config)
+    _http_clients[loop] = (settings, http_client)
+    return http_client
@@ -0,0 +1,146 @@
+"""
+Matching incoming requests to recorded requests.
+
+In the default (exact) match mode, requests are matched using a hash of the method, path and raw body, so any
+difference in the body (e.g. key order, whitespace or a random `user` value added by a client) is a miss.
+In canonical-json mode, JSON request bodies are normalized before hashing: the ignored fields are removed and
+the JSON is re-serialized with sorted keys and without whitespace. Recorded requests are re-keyed with the same
+normalization when the recording is loaded (the persisted request hash is always the exact hash).
+
+Ignored fields are dotted paths into the request body (e.g. `metadata.request_id`), where `*` matches any
+item in a list or any key in an object (e.g. `messages.*.name`).
+"""
+
+from collections.abc import Callable
+
+from fastapi.datastructures import URL
+import orjson
+from starlette.routing import Match, Route
+
+from aoai_simulated_api.models import RecordingConfig, RequestContext, RequestMatchRule
+from aoai_simulated_api.record_replay.models import RecordedResponse, hash_request_parts
+
+
+def _endpoint():
+    pass
+
+
+def _parse_field_paths(fields: list[str]) -> list[tuple[str, ...]]:
+    return [tuple(field.split(".")) for field in fields if field]
+
+
+def remove_fields(value: any, field_path: tuple[str, ...]) -> any:
+    """
+    Returns value with the field at field_path removed.
+    value isn't modified: objects/lists along the path are copied
+    """
+    if not field_path:
+        return value
+    name, remaining_path = field_path[0], field_path[1:]
+    if isinstance(value, dict):
+        if name == "*":
+            keys = list(value.keys())
+        elif name in value:
+            keys = [name]
+        else:
+            return value
+        updated = dict(value)
+        for key in keys:
+            if remaining_path:
+                updated[key] = remove_fields(value[key], remaining_path)
+            else:
+                del updated[key]
+        return updated
+    if isinstance(value, list) and name == "*" and remaining_path:
+        return [remove_fields(item, remaining_path) for item in value]
+    return value
+
+
+class _CompiledRule:
+    _route: Route
+    field_paths: list[tuple[str, ...]]
+
+    def __init__(self, rule: RequestMatchRule):
+        self._route = Route(path=rule.route, endpoint=_endpoint)
+        self.field_paths = _parse_field_paths(rule.ignored_fields)
+
+    def matches(self, method: str, path: str) -> bool:
+        match, _ = self._route.matches({"type": "http", "method": method, "path": path})
+        # rules apply to all methods (a PARTIAL match is a path match with a different method)
+        return match != Match.NONE
+
+
+class RequestMatcher:
+    """Computes the key used to match requests to recorded requests (see module docstring)"""
+
+    mode: str
+    _field_paths: list[tuple[str, ...]]
+    _rules: list[_CompiledRule]
+    # field paths for each path (the rules are only evaluated once per path)
+    _path_field_paths: dict[tuple[str, str], list[tuple[str, ...]]]
+
+    def __init__(
+        self, mode: str = "exact", ignored_fields: list[str] | None = None, rules: list[RequestMatchRule] | None = None
+    ):
+        if mode not in ("exact", "canonical-json"):
+            raise ValueError(f"Unknown request match mode: {mode}")
+        self.mode = mode
+        self._field_paths = _parse_field_paths(ignored_fields or [])
+        self._rules = [_CompiledRule(rule) for rule in rules or []]
+        self._path_field_paths = {}
+
+    @property
+    def is_exact(self) -> bool:
+        return self.mode == "exact"
+
+    def _get_field_paths(self, method: str, path: str) -> list[tuple[str, ...]]:
+        key = (method, path)
+        field_paths = self._path_field_paths.get(key)
+        if field_paths is None:
+            field_paths = list(self._field_paths)
+            for rule in self._rules:
+                if rule.matches(method, path):
+                    field_paths += rule.field_paths
+            self._path_field_paths[key] = field_paths
+        return field_paths
+
+    def _get_canonical_key(self, method: str, path: str, body: str | bytes | None, body_json: any) -> int:
+        if isinstance(body_json, dict):
+            for field_path in self._get_field_paths(method, path):
+                body_json = remove_fields(body_json, field_path)
+        if body_json is not None:
+            body = orjson.dumps(body_json, option=orjson.OPT_SORT_KEYS)
+        return hash_request_parts(method, path, body)
+
+    async def get_request_key(self, context: RequestContext) -> int:
+        """Returns the key for the request (computed once per request by the record/replay handler)"""
+        request = context.request
+        body = await context.get_request_body()
+        if self.is_exact:
+            return hash_request_parts(request.method, request.url.path, body)
+        try:
+            body_json = await context.get_request_json() if body else None
+        except orjson.JSONDecodeError:
+            body_json = None
+        return self._get_canonical_key(request.method, request.url.path, body, body_json)
+
+    def get_recorded_request_key(self, recorded_response: RecordedResponse) -> int:
+        """Returns the key for a recorded request"""
+        if self.is_exact:
+            return recorded_response.request_hash
+        request = recorded_response.full_request
+        body = request.get("body")
+        try:
+            body_json = orjson.loads(body) if body else None
+        except orjson.JSONDecodeError:
+            body_json = None
+        return self._get_canonical_key(request["method"], URL(request["uri"]).path, body, body_json)
+
+    @staticmethod
+    def from_recording_config(recording_config: RecordingConfig) -> "RequestMatcher":
+        ignored_fields = [field.strip() for field in recording_config.match_ignored_fields.split(",")]
+        return RequestMatcher(recording_config.match_mode, ignored_fields, recording_config.match_rules)
+
+    def get_recording_key_function(self) -> Callable[[RecordedResponse], int] | None:
+        """Returns the function to re-key loaded recordings with (or None if recordings don't need re-keying)"""
+        return None if self.is_exact else self.get_recorded_request_key
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
-from fastapi import Request
+import hashlib
+from aoai_simulated_api.models import RequestContext
 
 
 @dataclass
@@ -13,14 +14,27 @@ class RecordedResponse:
     # full_request currently here for compatibility with VCR serialization format
     # it _is_ handy for human inspection to have the URL/body etc. in the recording
     full_request: dict
+    # for streamed (SSE) responses, the offset (in milliseconds from the start of the request)
+    # at which each event in the body was received
+    stream_event_offsets_ms: list[int] | None = None
 
 
-def hash_request_parts(method: str, url: str, body: bytes):
-    # Potential future optimisation would be to look for incremental hashing function in Python
-    body_hash = hash(body)
-    return hash(method + "|" + url + "|" + str(body_hash))
+def hash_request_parts(method: str, url: str, body: str | bytes | None) -> int:
+    """
+    Returns a stable hash of the request parts (i.e. the same value in every process)
+    so that it can be persisted with the recording
+    """
+    if body is None:
+        body = b""
+    elif isinstance(body, str):
+        body = body.encode("utf-8")
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(method.encode("utf-8") + b"|" + url.encode("utf-8") + b"|")
+    digest.update(body)
+    return int.from_bytes(digest.digest(), "little")
 
 
-async def get_request_hash(request: Request):
-    body = await request.body()
+async def get_request_hash(context: RequestContext):
+    request = context.request
+    body = await context.get_request_body()
     return hash_request_parts(request.method, request.url.path, body)
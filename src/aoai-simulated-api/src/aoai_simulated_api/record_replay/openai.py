@@ -1,8 +1,14 @@
 import json
 import logging
-import requests
+import time
+
+import httpx
 
 from aoai_simulated_api.models import RequestContext
+from aoai_simulated_api.record_replay.admission import get_admission_controller
+from aoai_simulated_api.record_replay.http_client import get_http_client
+from aoai_simulated_api.record_replay.streaming import is_event_stream, read_event_stream, split_event_stream
+from aoai_simulated_api.record_replay.upstream import get_upstream_pool
 from aoai_simulated_api.constants import (
     SIMULATOR_KEY_DEPLOYMENT_NAME,
     SIMULATOR_KEY_OPENAI_PROMPT_TOKENS,
@@ -25,21 +31,24 @@ def _validate_endpoint_config(context: RequestContext):
     # pylint: disable-next=global-statement
     global config_validated
 
-    aoai_api_endpoint = context.config.recording.aoai_api_endpoint
-    aoai_api_key = context.config.recording.aoai_api_key
+    upstream_endpoints = context.config.recording.get_upstream_endpoints()
 
     config_validated = True  # only show the message once
 
-    if aoai_api_key and aoai_api_endpoint:
+    if upstream_endpoints:
         logger.info("🚀 Initialized Azure OpenAI forwarder with the following settings:")
-        logger.info("🔑 API endpoint: %s", aoai_api_endpoint)
-        masked_api_key = aoai_api_key[:4] + "..." + aoai_api_key[-4:]
-        logger.info("🔑 API key: %s", masked_api_key)
+        for upstream_endpoint in upstream_endpoints:
+            logger.info("🔑 API endpoint (%s): %s", upstream_endpoint.name, upstream_endpoint.endpoint)
+            masked_api_key = upstream_endpoint.key[:4] + "..." + upstream_endpoint.key[-4:]
+            logger.info("🔑 API key (%s): %s", upstream_endpoint.name, masked_api_key)
+        if len(upstream_endpoints) > 1:
+            logger.info("🔀 Routing: %s", context.config.recording.upstream_routing)
 
     else:
         logger.warning(
             "Got a request that looked like an openai request, but missing some or all of the "
-            + "required environment variables for forwarding: AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY"
+            + "required environment variables for forwarding: AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY "
+            + "(or RECORDING_UPSTREAM_CONFIG_PATH)"
         )
 
 
@@ -71,20 +80,62 @@ def _get_deployment_name_from_url(url: str) -> str | None:
     return None
 
 
-def _get_token_usage_from_response(body: str) -> int | None:
+def _get_usage_tuple(usage: dict) -> tuple[int, int, int]:
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    total_tokens = usage.get("total_tokens")
+    return prompt_tokens, completion_tokens, total_tokens
+
+
+def _get_token_usage_from_response(body: str) -> tuple[int, int, int] | None:
     try:
         response_json = json.loads(body)
         usage = response_json.get("usage")
         if usage is not None:
-            prompt_tokens = usage.get("prompt_tokens")
-            completion_tokens = usage.get("completion_tokens")
-            total_tokens = usage.get("total_tokens")
-            return prompt_tokens, completion_tokens, total_tokens
+            return _get_usage_tuple(usage)
     except json.JSONDecodeError as e:
         logger.error("Error getting token usage: %s", e)
     return None
 
 
+def _get_token_usage_from_event_stream(body: bytes) -> tuple[int, int, int] | None:
+    # usage is only included in streamed responses when requested (stream_options.include_usage)
+    for event in reversed(split_event_stream(body)):
+        data = event.strip().removeprefix(b"data:").strip()
+        if not data.startswith(b"{"):
+            continue
+        try:
+            usage = json.loads(data).get("usage")
+        except json.JSONDecodeError:
+            continue
+        if usage is not None:
+            return _get_usage_tuple(usage)
+    return None
+
+
+async def _send_upstream_request(
+    http_client: httpx.AsyncClient, method: str, url: str, headers: dict[str, str], body: bytes, send_time: float
+) -> tuple[httpx.Response, list[int] | None]:
+    upstream_request = http_client.build_request(method, url, headers=headers, content=body)
+    upstream_response = await http_client.send(upstream_request, stream=True)
+    try:
+        if is_event_stream(upstream_response.headers.get("content-type")):
+            # capture the timing of the events in the stream for replay
+            response_body, stream_event_offsets_ms = await read_event_stream(upstream_response, send_time)
+            # the body has already been decoded so drop the content-encoding
+            response_headers = [
+                (k, v) for k, v in upstream_response.headers.multi_items() if k.lower() != "content-encoding"
+            ]
+            response = httpx.Response(
+                status_code=upstream_response.status_code, headers=response_headers, content=response_body
+            )
+            return response, stream_event_offsets_ms
+        await upstream_response.aread()
+        return upstream_response, None
+    finally:
+        await upstream_response.aclose()
+
+
 async def forward_to_azure_openai(context: RequestContext) -> dict:
     request = context.request
     if not request.url.path.startswith("/openai/"):
@@ -95,32 +146,50 @@ async def forward_to_azure_openai(context: RequestContext) -> dict:
         # Only initialize once, and only if we need to
         _validate_endpoint_config(context)
 
-    aoai_api_endpoint = context.config.recording.aoai_api_endpoint
-    aoai_api_key = context.config.recording.aoai_api_key
-
-    if aoai_api_key is None or aoai_api_endpoint is None:
+    upstream_pool = get_upstream_pool(context.config.recording)
+    if upstream_pool is None:
         return None
 
-    url = aoai_api_endpoint
-    if url.endswith("/"):
-        url = url[:-1]
-    url += request.url.path + "?" + request.url.query
-
     # Copy most headers, but override auth
     fwd_headers = {
         k: v for k, v in request.headers.items() if k.lower() not in ["content-length", "host", "authorization"]
     }
-    fwd_headers["api-key"] = aoai_api_key
 
-    body = await request.body()
+    body = await context.get_request_body()
 
-    response = requests.request(
-        request.method,
-        url,
-        headers=fwd_headers,
-        data=body,
-        timeout=30,
-    )
+    deployment_name = _get_deployment_name_from_url(request.url.path)
+    # endpoint health and admission are tracked per deployment
+    upstream_deployment_name = deployment_name or ""
+    http_client = get_http_client(context.config.recording)
+    admission_controller = get_admission_controller(context.config.recording)
+    max_retries = context.config.recording.upstream_max_retries
+    retry_count = 0
+    while True:
+        with upstream_pool.acquire(upstream_deployment_name) as endpoint:
+            url = endpoint.endpoint.removesuffix("/") + request.url.path + "?" + request.url.query
+            fwd_headers["api-key"] = endpoint.key
+            # limit the concurrent requests to the deployment to avoid being rate-limited by the upstream
+            admission_key = endpoint.name + "/" + upstream_deployment_name
+            async with admission_controller.admit(admission_key):
+                send_time = time.perf_counter()
+                try:
+                    response, stream_event_offsets_ms = await _send_upstream_request(
+                        http_client, request.method, url, fwd_headers, body, send_time
+                    )
+                except httpx.TransportError as e:
+                    upstream_pool.record_failure(endpoint, upstream_deployment_name)
+                    if retry_count >= max_retries or len(upstream_pool.endpoints) == 1:
+                        raise
+                    retry_count += 1
+                    logger.info("⏳ Error forwarding request to %s (%s) - retry %s", endpoint.name, e, retry_count)
+                    continue
+                duration_ms = int((time.perf_counter() - send_time) * 1000)
+                admission_controller.record_response(admission_key, response.status_code, response.headers)
+            upstream_pool.record_response(endpoint, upstream_deployment_name, response.status_code, response.headers)
+        if response.status_code != 429 or retry_count >= max_retries:
+            break
+        retry_count += 1
+        logger.info("⏳ Upstream rate-limited request for %s - retry %s", admission_key, retry_count)
 
     for header in aoai_response_headers_to_remove:
         if response.headers.get(header):
@@ -132,12 +201,22 @@ async def forward_to_azure_openai(context: RequestContext) -> dict:
         return {"response": response, "persist_response": False}
 
     # store values in the context for use by the rate-limiter etc
-    deployment_name = _get_deployment_name_from_url(request.url.path)
-    prompt_tokens, completion_tokens, total_tokens = _get_token_usage_from_response(response.text)
+    if stream_event_offsets_ms is None:
+        token_usage = _get_token_usage_from_response(response.text)
+    else:
+        token_usage = _get_token_usage_from_event_stream(response.content)
     context.values[SIMULATOR_KEY_LIMITER] = "openai"
     context.values[SIMULATOR_KEY_DEPLOYMENT_NAME] = deployment_name
-    context.values[SIMULATOR_KEY_OPENAI_PROMPT_TOKENS] = prompt_tokens
-    context.values[SIMULATOR_KEY_OPENAI_COMPLETION_TOKENS] = completion_tokens
-    context.values[SIMULATOR_KEY_OPENAI_TOTAL_TOKENS] = total_tokens
-
-    return {"response": response, "persist_response": True}
+    if token_usage is not None:
+        prompt_tokens, completion_tokens, total_tokens = token_usage
+        context.values[SIMULATOR_KEY_OPENAI_PROMPT_TOKENS] = prompt_tokens
+        context.values[SIMULATOR_KEY_OPENAI_COMPLETION_TOKENS] = completion_tokens
+        context.values[SIMULATOR_KEY_OPENAI_TOTAL_TOKENS] = total_tokens
+
+    return {
+        "response": response,
+        "persist_response": True,
+        "stream_event_offsets_ms": stream_event_offsets_ms,
+        # exclude time spent waiting for admission from the recorded duration
+        "duration_ms": duration_ms,
+    }
@@ -1,38 +1,129 @@
+from abc import ABC, abstractmethod
+import base64
+from collections.abc import Iterable, Mapping, MutableMapping
+import glob
 import logging
+import mmap
 import os
 from fastapi.datastructures import URL
+import orjson
 import yaml
 
 from .models import RecordedResponse, hash_request_parts
+from .recording_index import (
+    IndexedRecording,
+    IndexEntry,
+    append_index_entry,
+    create_index_file,
+    get_index_file_path,
+    index_lines,
+    read_index_file,
+)
 
 logger = logging.getLogger(__name__)
 
 
-class YamlRecordingPersister:
+def _get_interaction(recorded_response: RecordedResponse) -> dict:
+    response = {
+        "status": {"code": recorded_response.status_code},
+        "headers": recorded_response.headers,
+        "body": {"string": recorded_response.body},
+        "duration_ms": recorded_response.duration_ms,
+    }
+    if recorded_response.stream_event_offsets_ms is not None:
+        response["stream_event_offsets_ms"] = recorded_response.stream_event_offsets_ms
+    return {
+        "request": recorded_response.full_request,
+        "response": response,
+        "context_values": recorded_response.context_values,
+        "request_hash": recorded_response.request_hash,
+    }
+
+
+def _get_request_hash(request: dict) -> int:
+    return hash_request_parts(
+        request["method"],
+        # parse URL to get path without host for matching against incoming request
+        URL(request["uri"]).path,
+        request["body"],
+    )
+
+
+def _get_interaction_request_hash(interaction: dict) -> int:
+    # recordings saved before request hashes were persisted don't include the hash
+    request_hash = interaction.get("request_hash")
+    if request_hash is None:
+        request_hash = _get_request_hash(interaction["request"])
+    return request_hash
+
+
+def _get_recorded_response(interaction: dict, request_hash: int | None = None) -> RecordedResponse:
+    request = interaction["request"]
+    response = interaction["response"]
+    if request_hash is None:
+        request_hash = _get_interaction_request_hash(interaction)
+    context_values = interaction.get("context_values", {})
+    return RecordedResponse(
+        request_hash=request_hash,
+        status_code=response["status"]["code"],
+        headers=response["headers"],
+        body=response["body"]["string"],
+        context_values=context_values,
+        full_request=request,
+        duration_ms=response.get("duration_ms", 0),  # didn't exist in earlier recordings so default to 0
+        stream_event_offsets_ms=response.get("stream_event_offsets_ms"),
+    )
+
+
+class RecordingPersister(ABC):
+    """
+    Base class for persisting recordings. A recording file is stored in recording_dir for each URL path
+    """
+
+    file_extension: str
+
     def __init__(self, recording_dir: str):
         self._recording_dir = recording_dir
 
-    def save_recording(self, url: str, recording: dict[int, RecordedResponse]):
-        interactions = []
-        for recorded_response in recording.values():
-            interaction = {
-                "request": recorded_response.full_request,
-                "response": {
-                    "status": {"code": recorded_response.status_code},
-                    "headers": recorded_response.headers,
-                    "body": {"string": recorded_response.body},
-                    "duration_ms": recorded_response.duration_ms,
-                },
-                "context_values": recorded_response.context_values,
-            }
-            interactions.append(interaction)
-        recording_data = {"interactions": interactions, "version": 1}
+    @property
+    def recording_dir(self) -> str:
+        return self._recording_dir
 
-        recording_path = self.get_recording_file_path(url)
-        self.ensure_recording_dir_exists()
-        with open(recording_path, "w", encoding="utf-8") as f:
-            yaml.dump(recording_data, stream=f, Dumper=yaml.CDumper)
-        logger.info("💾 Recording saved to %s", recording_path)
+    @abstractmethod
+    def save_recording(self, url: str, recording: Mapping[int, RecordedResponse]):
+        """Saves the full recording for the URL, replacing any existing recording file"""
+
+    def append_recorded_response(
+        self,
+        url: str,
+        recorded_response: RecordedResponse,  # pylint: disable=unused-argument
+        recording: Mapping[int, RecordedResponse],
+    ):
+        """
+        Persists a newly recorded response (used when autosave is enabled).
+        recording is the full recording for the URL (including recorded_response).
+        The default implementation saves the full recording
+        """
+        self.save_recording(url, recording)
+
+    def load_recording_for_url(
+        self, url: str, expect_recording_file: bool
+    ) -> MutableMapping[int, RecordedResponse] | None:
+        """Loads the recording for the URL, returning None if there is no recording file"""
+        recording_file_path = self.get_recording_file_path(url)
+        if not os.path.exists(recording_file_path):
+            if expect_recording_file:
+                logger.warning("No recording file found at %s", recording_file_path)
+            return None
+        return self.load_recording_file(recording_file_path)
+
+    @abstractmethod
+    def load_recording_file(self, recording_file_path: str) -> MutableMapping[int, RecordedResponse]:
+        """Loads the recording from a recording file"""
+
+    def get_recording_file_paths(self) -> list[str]:
+        """Returns the paths of the recording files in the recording directory"""
+        return sorted(glob.glob(os.path.join(self._recording_dir, "*" + self.file_extension)))
 
     def ensure_recording_dir_exists(self):
         if not os.path.exists(self._recording_dir):
@@ -42,39 +133,183 @@ class YamlRecordingPersister:
         query_start = url.find("?")
         if query_start != -1:
             url = url[:query_start]
-        recording_file_name = url.strip("/").replace("/", "_") + ".yaml"
+        recording_file_name = url.strip("/").replace("/", "_") + self.file_extension
         recording_file_path = os.path.join(self._recording_dir, recording_file_name)
         return recording_file_path
 
-    def load_recording_for_url(self, url: str, expect_recording_file: bool):
-        recording_file_path = self.get_recording_file_path(url)
-        if not os.path.exists(recording_file_path):
-            if expect_recording_file:
-                logger.warning("No recording file found at %s", recording_file_path)
-            return None
 
+class YamlRecordingPersister(RecordingPersister):
+    """
+    Stores each recording as a YAML file (compatible with the VCR serialization format).
+    Each save rewrites the whole file
+    """
+
+    file_extension = ".yaml"
+
+    def save_recording(self, url: str, recording: Mapping[int, RecordedResponse]):
+        interactions = [_get_interaction(recorded_response) for recorded_response in recording.values()]
+        recording_data = {"interactions": interactions, "version": 1}
+
+        recording_path = self.get_recording_file_path(url)
+        self.ensure_recording_dir_exists()
+        with open(recording_path, "w", encoding="utf-8") as f:
+            yaml.dump(recording_data, stream=f, Dumper=yaml.CDumper)
+        logger.info("💾 Recording saved to %s", recording_path)
+
+    def load_recording_file(self, recording_file_path: str):
         with open(recording_file_path, "r", encoding="utf-8") as f:
             recording_data = yaml.load(f, Loader=yaml.CLoader)
-            interactions = recording_data["interactions"]
-            recording = {}
-            for interaction in interactions:
-                request = interaction["request"]
-                response = interaction["response"]
-                uri_string = request["uri"]
-                request_hash = hash_request_parts(
-                    request["method"],
-                    # parse URL to get path without host for matching against incoming request
-                    URL(uri_string).path,
-                    request["body"],
-                )
-                context_values = interaction.get("context_values", {})
-                recording[request_hash] = RecordedResponse(
-                    request_hash=request_hash,
-                    status_code=response["status"]["code"],
-                    headers=response["headers"],
-                    body=response["body"]["string"],
-                    context_values=context_values,
-                    full_request=request,
-                    duration_ms=response.get("duration_ms", 0),  # didn't exist in earlier recordings so default to 0
-                )
-            return recording
+        recording = {}
+        for interaction in recording_data["interactions"]:
+            recorded_response = _get_recorded_response(interaction)
+            recording[recorded_response.request_hash] = recorded_response
+        return recording
+
+
+def _encode_body(body: str | bytes | None) -> dict:
+    # JSON can't represent bytes, so binary bodies are stored as base64
+    if isinstance(body, bytes):
+        return {"base64": base64.b64encode(body).decode("ascii")}
+    return {"string": body}
+
+
+def _decode_body(body: dict) -> str | bytes | None:
+    if "base64" in body:
+        return base64.b64decode(body["base64"])
+    return body["string"]
+
+
+def _serialize_jsonl_interaction(recorded_response: RecordedResponse) -> bytes:
+    interaction = _get_interaction(recorded_response)
+    interaction["request"] = {**interaction["request"], "body": _encode_body(recorded_response.full_request["body"])}
+    interaction["response"]["body"] = _encode_body(recorded_response.body)
+    return orjson.dumps(interaction, option=orjson.OPT_APPEND_NEWLINE)
+
+
+def _get_jsonl_interaction_request_hash(interaction: dict) -> int:
+    if "request_hash" not in interaction:
+        interaction["request"]["body"] = _decode_body(interaction["request"]["body"])
+    return _get_interaction_request_hash(interaction)
+
+
+def _deserialize_jsonl_interaction(line: bytes, request_hash: int | None = None) -> RecordedResponse:
+    interaction = orjson.loads(line)
+    interaction["request"]["body"] = _decode_body(interaction["request"]["body"])
+    interaction["response"]["body"] = {"string": _decode_body(interaction["response"]["body"])}
+    return _get_recorded_response(interaction, request_hash)
+
+
+def _write_jsonl_recording_file(recording_path: str, recorded_responses: Iterable[RecordedResponse]):
+    index_entries = []
+    # write to a temporary file and replace so that a partially written file is never loaded
+    temp_path = recording_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        offset = 0
+        for recorded_response in recorded_responses:
+            line = _serialize_jsonl_interaction(recorded_response)
+            f.write(line)
+            index_entries.append(IndexEntry(recorded_response.request_hash, offset, len(line)))
+            offset += len(line)
+    os.replace(temp_path, recording_path)
+    create_index_file(get_index_file_path(recording_path), index_entries)
+
+
+class JsonlRecordingPersister(RecordingPersister):
+    """
+    Stores each recording as a JSON Lines file with one interaction per line,
+    along with an index file (see recording_index.py).
+
+    When autosave is enabled, each new recorded response is appended to the file as a single line
+    (rather than rewriting the whole recording). Saving the recording compacts the file, dropping
+    any interactions that have been superseded by a later line for the same request.
+
+    Loading a recording memory-maps the file and reads the index. Interactions are only decoded when
+    they are matched, so the cost of loading a recording doesn't depend on the size of the recording file.
+    """
+
+    file_extension = ".jsonl"
+
+    def save_recording(self, url: str, recording: Mapping[int, RecordedResponse]):
+        recording_path = self.get_recording_file_path(url)
+        self.ensure_recording_dir_exists()
+        _write_jsonl_recording_file(recording_path, recording.values())
+        logger.info("💾 Recording saved to %s", recording_path)
+
+    def append_recorded_response(
+        self,
+        url: str,
+        recorded_response: RecordedResponse,
+        recording: Mapping[int, RecordedResponse],  # pylint: disable=unused-argument
+    ):
+        recording_path = self.get_recording_file_path(url)
+        self.ensure_recording_dir_exists()
+        line = _serialize_jsonl_interaction(recorded_response)
+        with open(recording_path, "ab") as f:
+            offset = f.tell()
+            f.write(line)
+
+        entry = IndexEntry(recorded_response.request_hash, offset, len(line))
+        index_path = get_index_file_path(recording_path)
+        if offset == 0:
+            create_index_file(index_path, [entry])
+        elif os.path.exists(index_path):
+            append_index_entry(index_path, entry)
+        logger.debug("💾 Recorded response appended to %s", recording_path)
+
+    def load_recording_file(self, recording_file_path: str):
+        with open(recording_file_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return IndexedRecording(None, {}, _deserialize_jsonl_interaction)
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        index_path = get_index_file_path(recording_file_path)
+        index_entries = read_index_file(index_path, data)
+        if index_entries is None or not index_entries or index_entries[-1].end < len(data):
+            # index any lines that aren't in the index (e.g. the index is missing or a previous
+            # run was stopped between appending a response and updating the index)
+            index_entries = index_entries or []
+            indexed_end = index_entries[-1].end if index_entries else 0
+            index_entries += index_lines(data, indexed_end, recording_file_path, _get_jsonl_interaction_request_hash)
+            try:
+                create_index_file(index_path, index_entries)
+            except OSError as e:
+                # e.g. the recording directory is read-only
+                logger.warning("Unable to write index file %s: %s", index_path, e)
+
+        # later lines replace earlier lines for the same request
+        entries = {entry.request_hash: entry for entry in index_entries}
+        return IndexedRecording(data, entries, _deserialize_jsonl_interaction)
+
+
+_persister_types: dict[str, type[RecordingPersister]] = {
+    "yaml": YamlRecordingPersister,
+    "jsonl": JsonlRecordingPersister,
+}
+
+
+def create_recording_persister(recording_format: str, recording_dir: str) -> RecordingPersister:
+    """Creates the persister for the recording format (i.e. the RECORDING_FORMAT config value)"""
+    persister_type = _persister_types.get(recording_format)
+    if persister_type is None:
+        raise ValueError(f"Unknown recording format: {recording_format}")
+    return persister_type(recording_dir)
+
+
+def convert_yaml_recordings(recording_dir: str) -> list[str]:
+    """
+    Converts the YAML recording files in recording_dir to JSON Lines recording files
+    (alongside the YAML files) and returns the paths of the converted files
+    """
+    converted_paths = []
+    for yaml_path in YamlRecordingPersister(recording_dir).get_recording_file_paths():
+        with open(yaml_path, "r", encoding="utf-8") as f:
+            recording_data = yaml.load(f, Loader=yaml.CLoader)
+        jsonl_path = (
+            yaml_path.removesuffix(YamlRecordingPersister.file_extension) + JsonlRecordingPersister.file_extension
+        )
+        _write_jsonl_recording_file(
+            jsonl_path, (_get_recorded_response(interaction) for interaction in recording_data["interactions"])
+        )
+        logger.info("💾 Converted %s to %s", yaml_path, jsonl_path)
+        converted_paths.append(jsonl_path)
+    return converted_paths
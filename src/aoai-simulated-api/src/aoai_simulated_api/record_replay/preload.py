@@ -0,0 +1,99 @@
+"""
+Preloading recordings at startup.
+
+By default, a recording is loaded when it is first used, so the first request for each URL waits for the recording
+file to be parsed (which can take seconds for large YAML recordings). With RECORDING_PRELOAD enabled, the recording
+files in the recording directory are loaded before the simulator starts handling requests. The files are parsed
+in a process pool so that parsing isn't limited to a single core.
+"""
+
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+import sys
+import time
+
+from fastapi.datastructures import URL
+
+from aoai_simulated_api.record_replay.models import RecordedResponse
+from aoai_simulated_api.record_replay.persistence import RecordingPersister
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def get_max_rss_mb() -> float | None:
+    """Returns the peak resident set size of the process in MB (or None if not available on the platform)"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return max_rss / 1024 / 1024 if sys.platform == "darwin" else max_rss / 1024
+
+
+def _get_recording_url(recording: MutableMapping[int, RecordedResponse]) -> str | None:
+    # recording file names can't be mapped back to URLs (e.g. "_" in deployment names),
+    # so use the URL of a recorded request
+    for recorded_response in recording.values():
+        return URL(recorded_response.full_request["uri"]).path
+    return None
+
+
+def _load_recording_file(
+    persister_type: type[RecordingPersister], recording_dir: str, recording_file_path: str
+) -> tuple[str | None, MutableMapping[int, RecordedResponse] | None]:
+    # runs in a worker process
+    recording = persister_type(recording_dir).load_recording_file(recording_file_path)
+    url = _get_recording_url(recording)
+    if not isinstance(recording, dict):
+        # e.g. IndexedRecording memory-maps the recording file, so can't be returned to the main process.
+        # Loading the recording in the worker creates/updates the index so loading it in the main process is fast
+        return url, None
+    return url, recording
+
+
+def preload_recordings(
+    persister: RecordingPersister, max_workers: int | None
+) -> list[tuple[str, MutableMapping[int, RecordedResponse]]]:
+    """
+    Loads the recording files in the recording directory in a process pool
+    and returns the URL and recording for each file
+    """
+    recording_file_paths = persister.get_recording_file_paths()
+    if not recording_file_paths:
+        return []
+
+    start_time = time.perf_counter()
+    persister_type = type(persister)
+    # use spawn rather than fork so that workers don't inherit the server's sockets and threads
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        results = list(
+            executor.map(
+                _load_recording_file,
+                [persister_type] * len(recording_file_paths),
+                [persister.recording_dir] * len(recording_file_paths),
+                recording_file_paths,
+            )
+        )
+
+    recordings = []
+    for recording_file_path, (url, recording) in zip(recording_file_paths, results):
+        if url is None:
+            logger.info("Skipping empty recording file %s", recording_file_path)
+            continue
+        if recording is None:
+            recording = persister.load_recording_file(recording_file_path)
+        recordings.append((url, recording))
+    logger.info(
+        "📼 Preloaded %s recordings from %s in %.2fs",
+        len(recordings),
+        persister.recording_dir,
+        time.perf_counter() - start_time,
+    )
+    return recordings
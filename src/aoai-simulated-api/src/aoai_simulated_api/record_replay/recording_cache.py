@@ -0,0 +1,88 @@
+"""
+A memory-budgeted cache of the recordings loaded by the record/replay handler.
+
+Without a budget, every recording that has been used stays in memory, so a simulator replaying recordings for
+many deployments/operations keeps growing. With RECORDING_CACHE_MAX_BYTES set, the least recently used recordings
+are evicted when the (approximate) size of the loaded recordings exceeds the budget and are re-loaded from the
+recording files when next used.
+"""
+
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+import logging
+
+from aoai_simulated_api.metrics import simulator_metrics
+from aoai_simulated_api.record_replay.replay import LoadedRecording
+
+logger = logging.getLogger(__name__)
+
+
+class RecordingCache:
+    """
+    An LRU cache of recordings keyed by URL, bounded by the size of the recordings (max_bytes=0 for no limit).
+    on_evict is called with the URL and recording for each evicted recording
+    """
+
+    _max_bytes: int
+    _recordings: OrderedDict[str, LoadedRecording]
+    _sizes: dict[str, int]
+    _resident_bytes: int
+    _on_evict: Callable[[str, LoadedRecording], None] | None
+
+    def __init__(self, max_bytes: int = 0, on_evict: Callable[[str, LoadedRecording], None] | None = None):
+        self._max_bytes = max_bytes
+        self._recordings = OrderedDict()
+        self._sizes = {}
+        self._resident_bytes = 0
+        self._on_evict = on_evict
+
+    @property
+    def resident_bytes(self) -> int:
+        """The approximate size of the cached recordings (as of the last time each recording was used)"""
+        return self._resident_bytes
+
+    def get(self, url: str) -> LoadedRecording | None:
+        recording = self._recordings.get(url)
+        if recording is None:
+            simulator_metrics.counter_recording_cache.add(1, {"result": "miss"})
+            return None
+        simulator_metrics.counter_recording_cache.add(1, {"result": "hit"})
+        self._recordings.move_to_end(url)
+        # the recording grows as responses are rendered/recorded
+        self._update_size(url, recording)
+        return recording
+
+    def set(self, url: str, recording: LoadedRecording):
+        self._recordings[url] = recording
+        self._recordings.move_to_end(url)
+        self._update_size(url, recording)
+
+    def items(self) -> Iterator[tuple[str, LoadedRecording]]:
+        return iter(list(self._recordings.items()))
+
+    def __len__(self) -> int:
+        return len(self._recordings)
+
+    def _update_size(self, url: str, recording: LoadedRecording):
+        size = recording.size_bytes
+        size_change = size - self._sizes.get(url, 0)
+        if size_change == 0:
+            return
+        self._sizes[url] = size
+        self._resident_bytes += size_change
+        simulator_metrics.updown_counter_recording_cache_size.add(size_change)
+        self._evict()
+
+    def _evict(self):
+        if self._max_bytes <= 0:
+            return
+        # the most recently used recording is kept, even if it is larger than the budget
+        while self._resident_bytes > self._max_bytes and len(self._recordings) > 1:
+            url, recording = self._recordings.popitem(last=False)
+            size = self._sizes.pop(url)
+            self._resident_bytes -= size
+            simulator_metrics.updown_counter_recording_cache_size.add(-size)
+            simulator_metrics.counter_recording_cache_evictions.add(1)
+            logger.debug("Evicted recording for %s from the recording cache (%s bytes)", url, size)
+            if self._on_evict:
+                self._on_evict(url, recording)
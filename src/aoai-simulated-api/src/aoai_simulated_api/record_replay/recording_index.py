@@ -0,0 +1,201 @@
+"""
+Index files for JSON Lines recordings.
+
+Each JSON Lines recording file (the data file) has an index file alongside it with a fixed-size record per line
+in the data file. The index records the request hash for the line and the offset and length of the line.
+This allows a recording to be loaded by reading only the index: the data file is memory-mapped and a line is
+only decoded when it is matched by an incoming request.
+"""
+
+from collections.abc import Callable, Iterator, MutableMapping
+import logging
+import mmap
+import os
+import struct
+
+import orjson
+
+from .models import RecordedResponse
+
+logger = logging.getLogger(__name__)
+
+# each line in the data file starts with the serialized request
+LINE_REQUEST_PREFIX = b'{"request":'
+
+# the version is incremented when the record format changes - index files with a different version are re-created
+_index_header = b"AOAIIDX\x02"
+# request hash, line offset, line length
+_index_record = struct.Struct("<QQI")
+
+
+class IndexEntry:
+    __slots__ = ("request_hash", "offset", "length")
+
+    request_hash: int
+    offset: int
+    length: int
+
+    def __init__(self, request_hash: int, offset: int, length: int):
+        self.request_hash = request_hash
+        self.offset = offset
+        self.length = length
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.length
+
+    def pack(self) -> bytes:
+        return _index_record.pack(self.request_hash, self.offset, self.length)
+
+
+def get_index_file_path(data_file_path: str) -> str:
+    return data_file_path + ".idx"
+
+
+def create_index_file(index_file_path: str, entries: list[IndexEntry]):
+    # write to a temporary file and replace so that a partially written index is never loaded
+    temp_path = index_file_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_index_header)
+        for entry in entries:
+            f.write(entry.pack())
+    os.replace(temp_path, index_file_path)
+
+
+def append_index_entry(index_file_path: str, entry: IndexEntry):
+    """
+    Appends the entry to the index file if the index covers the data file up to the entry.
+    Otherwise the index is left as-is and the missing lines are indexed when the recording is loaded
+    """
+    with open(index_file_path, "r+b") as f:
+        index_size = f.seek(0, os.SEEK_END)
+        if index_size >= len(_index_header) + _index_record.size:
+            f.seek(-_index_record.size, os.SEEK_END)
+            last_entry = IndexEntry(*_index_record.unpack(f.read(_index_record.size)))
+            indexed_end = last_entry.end
+        else:
+            indexed_end = 0
+        if indexed_end != entry.offset:
+            return
+        f.seek(0, os.SEEK_END)
+        f.write(entry.pack())
+
+
+def read_index_file(index_file_path: str, data: mmap.mmap) -> list[IndexEntry] | None:
+    """
+    Reads the entries from the index file, returning None if the index file is missing
+    or doesn't match the data file (e.g. the data file was replaced without updating the index)
+    """
+    if not os.path.exists(index_file_path):
+        return None
+    with open(index_file_path, "rb") as f:
+        index_data = f.read()
+    if not index_data.startswith(_index_header):
+        logger.info("Ignoring index file %s with unknown format", index_file_path)
+        return None
+    records_data = memoryview(index_data)[len(_index_header) :]
+    if len(records_data) % _index_record.size != 0:
+        logger.info("Ignoring truncated index file %s", index_file_path)
+        return None
+
+    entries = [IndexEntry(*values) for values in _index_record.iter_unpack(records_data)]
+    if entries:
+        last_entry = entries[-1]
+        if (
+            last_entry.end > len(data)
+            or data[last_entry.end - 1] != ord("\n")
+            or data[last_entry.offset : last_entry.offset + len(LINE_REQUEST_PREFIX)] != LINE_REQUEST_PREFIX
+        ):
+            logger.info("Ignoring index file %s that doesn't match the data file", index_file_path)
+            return None
+    return entries
+
+
+def index_lines(
+    data: mmap.mmap, start: int, data_file_path: str, get_request_hash: Callable[[dict], int]
+) -> list[IndexEntry]:
+    """
+    Creates index entries for the lines in the data file from the start offset.
+    get_request_hash is called with the interaction for each line
+    """
+    entries = []
+    position = start
+    data_size = len(data)
+    while position < data_size:
+        line_end = data.find(b"\n", position)
+        if line_end == -1:
+            # e.g. the simulator was stopped part way through appending a response
+            logger.warning("Skipping incomplete line at offset %s in recording file %s", position, data_file_path)
+            break
+        line = data[position : line_end + 1]
+        try:
+            interaction = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            logger.warning("Skipping invalid line at offset %s in recording file %s", position, data_file_path)
+            interaction = None
+        if interaction is not None:
+            entries.append(IndexEntry(get_request_hash(interaction), position, len(line)))
+        position = line_end + 1
+    return entries
+
+
+class IndexedRecording(MutableMapping[int, RecordedResponse]):
+    """
+    A recording backed by a memory-mapped JSON Lines data file.
+
+    Recorded responses from the data file are decoded when they are accessed.
+    Recorded responses that are added (e.g. in record mode) are held in memory
+    """
+
+    _data: mmap.mmap | None
+    _entries: dict[int, IndexEntry]
+    _added: dict[int, RecordedResponse]
+    _decode_line: Callable[[bytes, int], RecordedResponse]
+
+    def __init__(
+        self,
+        data: mmap.mmap | None,
+        entries: dict[int, IndexEntry],
+        decode_line: Callable[[bytes, int], RecordedResponse],
+    ):
+        self._data = data
+        self._entries = entries
+        self._added = {}
+        self._decode_line = decode_line
+
+    def __getitem__(self, request_hash: int) -> RecordedResponse:
+        recorded_response = self._added.get(request_hash)
+        if recorded_response is not None:
+            return recorded_response
+        entry = self._entries[request_hash]
+        # the entry has the persisted request hash (see rekey)
+        return self._decode_line(self._data[entry.offset : entry.end], entry.request_hash)
+
+    def rekey(self, get_key: Callable[[RecordedResponse], int]):
+        """
+        Re-keys the recorded responses with the key returned by get_key (e.g. to match requests by a different hash).
+        Each recorded response is decoded to get its key, but the decoded responses aren't kept
+        """
+        self._entries = {get_key(self[request_hash]): entry for request_hash, entry in self._entries.items()}
+        self._added = {get_key(recorded_response): recorded_response for recorded_response in self._added.values()}
+
+    def __setitem__(self, request_hash: int, recorded_response: RecordedResponse):
+        self._added[request_hash] = recorded_response
+
+    def __delitem__(self, request_hash: int):
+        found = self._added.pop(request_hash, None) is not None
+        found = self._entries.pop(request_hash, None) is not None or found
+        if not found:
+            raise KeyError(request_hash)
+
+    def __contains__(self, request_hash: object) -> bool:
+        return request_hash in self._added or request_hash in self._entries
+
+    def __iter__(self) -> Iterator[int]:
+        for request_hash in self._entries:
+            if request_hash not in self._added:
+                yield request_hash
+        yield from self._added
+
+    def __len__(self) -> int:
+        return len(self._entries) + sum(1 for request_hash in self._added if request_hash not in self._entries)
@@ -0,0 +1,219 @@
+"""
+Pre-rendered responses for replay mode.
+
+Creating a response for a recorded response involves building the headers, encoding the body and copying the
+recorded context values. Since a recorded response is typically replayed many times (e.g. in a load test), this
+is done once per recorded response: the RenderedResponse holds the encoded body, the raw (ASGI) headers and the
+context values, and each replayed response only copies the header list (as limiters add headers to responses).
+"""
+
+from collections.abc import Callable, Iterator, Mapping, MutableMapping
+from types import MappingProxyType
+
+import fastapi
+
+from aoai_simulated_api import constants
+from aoai_simulated_api.models import RequestContext
+from aoai_simulated_api.record_replay.models import RecordedResponse
+from aoai_simulated_api.record_replay.recording_index import IndexedRecording
+from aoai_simulated_api.record_replay.similarity import SimilarityIndex
+from aoai_simulated_api.record_replay.streaming import create_replay_streaming_response, split_event_stream
+
+# approximate memory used by the objects for a recorded/rendered response in addition to the body and headers
+_response_overhead_bytes = 512
+# approximate memory used for each entry in an IndexedRecording (the data file is memory-mapped)
+_index_entry_bytes = 150
+
+
+def estimate_recorded_response_size(recorded_response: RecordedResponse) -> int:
+    request_body = recorded_response.full_request.get("body") if recorded_response.full_request else None
+    return (
+        _response_overhead_bytes
+        + len(recorded_response.body or b"")
+        + len(request_body or b"")
+        + sum(len(k) + sum(len(v) for v in values) for k, values in recorded_response.headers.items())
+    )
+
+
+class PrerenderedResponse(fastapi.Response):
+    """A response with an already encoded body and headers"""
+
+    # pylint: disable-next=super-init-not-called
+    def __init__(self, status_code: int, body: bytes, raw_headers: list[tuple[bytes, bytes]]):
+        # Response.__init__ would re-encode the body and headers
+        self.status_code = status_code
+        self.body = body
+        self.raw_headers = raw_headers
+        self.background = None
+
+
+class RenderedResponse:
+    """A recorded response, prepared for replaying (see module docstring)"""
+
+    __slots__ = ("status_code", "body", "raw_headers", "context_values", "stream_events", "stream_event_offsets_ms")
+
+    status_code: int
+    body: bytes
+    raw_headers: tuple[tuple[bytes, bytes], ...]
+    context_values: Mapping[str, any]
+    stream_events: tuple[bytes, ...] | None
+    stream_event_offsets_ms: tuple[int, ...] | None
+
+    def __init__(self, recorded_response: RecordedResponse):
+        body = recorded_response.body
+        if body is None:
+            body = b""
+        elif isinstance(body, str):
+            body = body.encode("utf-8")
+        self.status_code = recorded_response.status_code
+        self.body = body
+
+        raw_headers = [
+            (k.lower().encode("latin-1"), v[0].encode("latin-1"))
+            for k, v in recorded_response.headers.items()
+            if k.lower() != "content-length"
+        ]
+        if recorded_response.stream_event_offsets_ms is not None:
+            self.stream_events = tuple(split_event_stream(body))
+            self.stream_event_offsets_ms = tuple(recorded_response.stream_event_offsets_ms)
+        else:
+            self.stream_events = None
+            self.stream_event_offsets_ms = None
+            # matches the content-length handling in fastapi.Response
+            if not (self.status_code < 200 or self.status_code in (204, 304)):
+                raw_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        self.raw_headers = tuple(raw_headers)
+
+        context_values = dict(recorded_response.context_values)
+        context_values[constants.TARGET_DURATION_MS] = recorded_response.duration_ms
+        self.context_values = MappingProxyType(context_values)
+
+    def estimate_size(self) -> int:
+        # streamed responses hold the body and the events split from the body
+        body_size = len(self.body) * (2 if self.stream_events is not None else 1)
+        return _response_overhead_bytes + body_size + sum(len(k) + len(v) for k, v in self.raw_headers)
+
+    def create_response(self, context: RequestContext, stream_timing_scale: float) -> fastapi.Response:
+        """Sets the recorded context values on the context and returns a response for the request"""
+        context.values.update(self.context_values)
+        if self.stream_events is not None:
+            return create_replay_streaming_response(
+                context,
+                events=self.stream_events,
+                event_offsets_ms=self.stream_event_offsets_ms,
+                timing_scale=stream_timing_scale,
+                status_code=self.status_code,
+                headers={k.decode("latin-1"): v.decode("latin-1") for k, v in self.raw_headers},
+            )
+        return PrerenderedResponse(self.status_code, self.body, list(self.raw_headers))
+
+
+class LoadedRecording(MutableMapping[int, RecordedResponse]):
+    """
+    A recording with the rendered responses for the recorded responses that have been replayed.
+    Responses are rendered when first replayed so that recordings that decode recorded responses on demand
+    (see recording_index.IndexedRecording) aren't fully decoded when loaded.
+
+    If get_key is set, the recording is re-keyed with get_key(recorded_response) rather than the persisted
+    request hash (see matching.RequestMatcher).
+    If similarity_threshold is set, a similarity index of the recorded prompts is built for finding the nearest
+    match for requests without a recorded response (see similarity.SimilarityIndex)
+    """
+
+    _recording: MutableMapping[int, RecordedResponse]
+    _rendered_responses: dict[int, RenderedResponse]
+    _recording_size: int
+    _rendered_size: int
+    _modified: bool
+    _similarity_index: SimilarityIndex | None
+
+    def __init__(
+        self,
+        recording: MutableMapping[int, RecordedResponse],
+        get_key: Callable[[RecordedResponse], int] | None = None,
+        similarity_threshold: float | None = None,
+    ):
+        if get_key is not None:
+            if isinstance(recording, IndexedRecording):
+                recording.rekey(get_key)
+            else:
+                recording = {get_key(recorded_response): recorded_response for recorded_response in recording.values()}
+        self._recording = recording
+        self._rendered_responses = {}
+        if isinstance(recording, IndexedRecording):
+            # recorded responses are decoded on demand
+            self._recording_size = _index_entry_bytes * len(recording)
+        else:
+            self._recording_size = sum(
+                estimate_recorded_response_size(recorded_response) for recorded_response in recording.values()
+            )
+        self._rendered_size = 0
+        self._modified = False
+        self._similarity_index = None
+        if similarity_threshold is not None:
+            self._similarity_index = SimilarityIndex.from_recording(recording.items(), similarity_threshold)
+            self._recording_size += self._similarity_index.estimate_size()
+
+    @property
+    def recording(self) -> MutableMapping[int, RecordedResponse]:
+        return self._recording
+
+    @property
+    def size_bytes(self) -> int:
+        """The approximate memory used by the recording and its rendered responses"""
+        return self._recording_size + self._rendered_size
+
+    @property
+    def modified(self) -> bool:
+        """True if recorded responses have been added to (or removed from) the recording since it was loaded"""
+        return self._modified
+
+    @property
+    def similarity_index(self) -> SimilarityIndex | None:
+        """The index for finding the nearest recorded request (None if not enabled or the recording is modified)"""
+        return self._similarity_index
+
+    def get_rendered_response(self, request_hash: int) -> RenderedResponse | None:
+        rendered_response = self._rendered_responses.get(request_hash)
+        if rendered_response is None:
+            recorded_response = self._recording.get(request_hash)
+            if recorded_response is None:
+                return None
+            rendered_response = RenderedResponse(recorded_response)
+            self._rendered_responses[request_hash] = rendered_response
+            self._rendered_size += rendered_response.estimate_size()
+        return rendered_response
+
+    def __getitem__(self, request_hash: int) -> RecordedResponse:
+        return self._recording[request_hash]
+
+    def __setitem__(self, request_hash: int, recorded_response: RecordedResponse):
+        self._recording[request_hash] = recorded_response
+        self._recording_size += estimate_recorded_response_size(recorded_response)
+        self._on_modified(request_hash)
+
+    def __delitem__(self, request_hash: int):
+        del self._recording[request_hash]
+        self._on_modified(request_hash)
+
+    def _on_modified(self, request_hash: int):
+        self._remove_rendered_response(request_hash)
+        self._modified = True
+        if self._similarity_index is not None:
+            # the index doesn't support updates (recordings are only modified in record mode)
+            self._recording_size -= self._similarity_index.estimate_size()
+            self._similarity_index = None
+
+    def _remove_rendered_response(self, request_hash: int):
+        rendered_response = self._rendered_responses.pop(request_hash, None)
+        if rendered_response is not None:
+            self._rendered_size -= rendered_response.estimate_size()
+
+    def __contains__(self, request_hash: object) -> bool:
+        return request_hash in self._recording
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._recording)
+
+    def __len__(self) -> int:
+        return len(self._recording)
@@ -0,0 +1,188 @@
+"""
+Nearest-match fallback for replay misses.
+
+In replay mode, a request that doesn't match a recorded request fails, so any drift in the prompts sent by a load
+test (e.g. a changed prompt template) breaks the whole test. With RECORDING_SIMILARITY_MATCH enabled, a
+SimilarityIndex is built for each recording (i.e. for each deployment and operation) when the recording is loaded,
+and a miss is served by the recorded response for the most similar recorded prompt, as long as the similarity is
+at least RECORDING_SIMILARITY_THRESHOLD.
+
+The similarity of two prompts is the Jaccard similarity of their word 3-grams (shingles), estimated using MinHash
+signatures. The signatures are indexed using locality-sensitive hashing (LSH): each signature is split into bands
+and only recorded prompts that share a band with the request prompt are compared, so the cost of a lookup depends
+on the length of the prompt rather than the size of the recording.
+"""
+
+from collections.abc import Iterable
+import re
+import zlib
+
+import numpy as np
+import orjson
+
+from aoai_simulated_api.record_replay.models import RecordedResponse
+
+_num_perm = 64
+_shingle_size = 3
+# the probability that a recorded prompt with the threshold similarity shares a band with the request prompt
+_min_candidate_probability = 0.99
+# the maximum number of recorded prompts compared from each band bucket. Prompts that share most of their text
+# (e.g. a long prompt template) share buckets, so this bounds the cost of a lookup for recordings of such prompts
+_max_bucket_candidates = 256
+
+# multiply-shift hash functions (the products wrap around at 2^64 and the high 32 bits are used)
+_rng = np.random.default_rng(seed=1)
+_perm_a = (_rng.integers(1, 2**63, size=_num_perm, dtype=np.uint64) | np.uint64(1)).reshape(-1, 1)
+_perm_b = _rng.integers(0, 2**63, size=_num_perm, dtype=np.uint64).reshape(-1, 1)
+_shift = np.uint64(32)
+
+_word_regex = re.compile(r"\w+")
+
+
+def _get_text_values(value: any) -> Iterable[str]:
+    # prompts can be strings, lists of strings or (for chat messages) lists of content parts
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, dict):
+                text = item.get("text")
+                if isinstance(text, str):
+                    yield text
+            else:
+                yield from _get_text_values(item)
+    elif isinstance(value, (int, float)):
+        # e.g. token inputs for embeddings
+        yield str(value)
+
+
+def get_prompt_text(body_json: any) -> str | None:
+    """
+    Returns the prompt text for an OpenAI request body: the message content for chat completions,
+    the prompt for completions or the input for embeddings (or None if the body has no prompt)
+    """
+    if not isinstance(body_json, dict):
+        return None
+    messages = body_json.get("messages")
+    if isinstance(messages, list):
+        texts = [
+            text
+            for message in messages
+            if isinstance(message, dict)
+            for text in _get_text_values(message.get("content"))
+        ]
+    else:
+        texts = list(_get_text_values(body_json.get("prompt", body_json.get("input"))))
+    return "\n".join(texts) if texts else None
+
+
+def get_minhash_signature(text: str) -> np.ndarray | None:
+    """Returns the MinHash signature for the word 3-grams in the text (or None if the text has no words)"""
+    words = _word_regex.findall(text.lower())
+    if not words:
+        return None
+    if len(words) <= _shingle_size:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i : i + _shingle_size]) for i in range(len(words) - _shingle_size + 1)}
+    shingle_hashes = np.fromiter(
+        (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles)
+    )
+    return ((_perm_a * shingle_hashes + _perm_b) >> _shift).min(axis=1).astype(np.uint32)
+
+
+def _get_rows_per_band(threshold: float) -> int:
+    # use the largest band size (fewest candidates) that still finds prompts with the threshold similarity
+    rows_per_band = 1
+    for rows in (2, 4, 8, 16):
+        bands = _num_perm // rows
+        if 1 - (1 - threshold**rows) ** bands < _min_candidate_probability:
+            break
+        rows_per_band = rows
+    return rows_per_band
+
+
+class SimilarityIndex:
+    """An LSH index of the MinHash signatures of the prompts in a recording (see module docstring)"""
+
+    threshold: float
+    _rows_per_band: int
+    _keys: list[int]
+    _signatures: np.ndarray
+    _bands: list[dict[bytes, np.ndarray]]
+
+    def __init__(self, entries: Iterable[tuple[int, str]], threshold: float):
+        """entries are the request key and prompt text for each recorded request"""
+        self.threshold = threshold
+        self._rows_per_band = _get_rows_per_band(threshold)
+        band_count = _num_perm // self._rows_per_band
+
+        keys = []
+        signatures = []
+        bands: list[dict[bytes, list[int]]] = [{} for _ in range(band_count)]
+        for key, text in entries:
+            signature = get_minhash_signature(text)
+            if signature is None:
+                continue
+            index = len(keys)
+            keys.append(key)
+            signatures.append(signature)
+            for band, band_key in zip(bands, self._get_band_keys(signature)):
+                band.setdefault(band_key, []).append(index)
+
+        self._keys = keys
+        self._signatures = np.vstack(signatures) if signatures else np.empty((0, _num_perm), dtype=np.uint32)
+        self._bands = [
+            {band_key: np.array(indexes, dtype=np.int64) for band_key, indexes in band.items()} for band in bands
+        ]
+
+    @staticmethod
+    def from_recording(recording: Iterable[tuple[int, RecordedResponse]], threshold: float) -> "SimilarityIndex":
+        """Creates an index from the (key, recorded response) items of a recording"""
+        entries = ((key, _get_recorded_prompt_text(recorded_response)) for key, recorded_response in recording)
+        return SimilarityIndex(((key, text) for key, text in entries if text), threshold)
+
+    def _get_band_keys(self, signature: np.ndarray) -> list[bytes]:
+        signature_bytes = signature.tobytes()
+        band_size = self._rows_per_band * signature.itemsize
+        return [signature_bytes[i : i + band_size] for i in range(0, len(signature_bytes), band_size)]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def estimate_size(self) -> int:
+        # the signatures plus an index entry per band for each signature
+        return self._signatures.nbytes + len(self._keys) * (len(self._bands) * 8 + 64)
+
+    def find(self, text: str) -> tuple[int, float] | None:
+        """
+        Returns the key of the most similar recorded prompt and its (estimated) similarity to the text
+        (or None if no recorded prompt is at least as similar as the threshold)
+        """
+        signature = get_minhash_signature(text)
+        if signature is None:
+            return None
+        candidates = [
+            indexes[:_max_bucket_candidates]
+            for band, band_key in zip(self._bands, self._get_band_keys(signature))
+            if (indexes := band.get(band_key)) is not None
+        ]
+        if not candidates:
+            return None
+        candidates = np.unique(np.concatenate(candidates))
+        similarities = (self._signatures[candidates] == signature).mean(axis=1)
+        best = int(similarities.argmax())
+        similarity = float(similarities[best])
+        if similarity < self.threshold:
+            return None
+        return self._keys[int(candidates[best])], similarity
+
+
+def _get_recorded_prompt_text(recorded_response: RecordedResponse) -> str | None:
+    body = recorded_response.full_request.get("body") if recorded_response.full_request else None
+    if not body:
+        return None
+    try:
+        return get_prompt_text(orjson.loads(body))
+    except orjson.JSONDecodeError:
+        return None
@@ -0,0 +1,92 @@
+"""
+Recording and replaying server-sent event (SSE) streams (e.g. streamed chat completions).
+
+In record mode, the events in a streamed response are captured along with the time (in milliseconds since the
+start of the request) that each event was received. In replay mode, the events are re-sent as a streamed
+response with the recorded timing (optionally scaled by RECORDING_STREAM_TIMING_SCALE).
+"""
+
+import asyncio
+from collections.abc import Sequence
+import time
+
+from fastapi.responses import StreamingResponse
+import httpx
+
+from aoai_simulated_api import constants
+from aoai_simulated_api.models import RequestContext
+
+EVENT_STREAM_CONTENT_TYPE = "text/event-stream"
+
+_event_separator = b"\n\n"
+
+
+def is_event_stream(content_type: str | None) -> bool:
+    return content_type is not None and content_type.split(";")[0].strip() == EVENT_STREAM_CONTENT_TYPE
+
+
+def split_event_stream(body: str | bytes) -> list[bytes]:
+    """Splits an SSE body into events (each event includes its trailing blank line)"""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    events = []
+    position = 0
+    while position < len(body):
+        event_end = body.find(_event_separator, position)
+        if event_end == -1:
+            events.append(body[position:])
+            break
+        event_end += len(_event_separator)
+        events.append(body[position:event_end])
+        position = event_end
+    return events
+
+
+async def read_event_stream(response: httpx.Response, start_time: float) -> tuple[bytes, list[int]]:
+    """
+    Reads a streamed httpx response (i.e. sent with stream=True) and returns the body and the offset
+    (in milliseconds from start_time) at which each event in the body was received
+    """
+    body = bytearray()
+    event_offsets_ms = []
+    async for chunk in response.aiter_bytes():
+        offset_ms = int((time.perf_counter() - start_time) * 1000)
+        # only count complete events, starting from the last separator that might span the previous chunk
+        search_start = max(0, len(body) - len(_event_separator) + 1)
+        body += chunk
+        event_offsets_ms += [offset_ms] * body.count(_event_separator, search_start)
+    if body and not body.endswith(_event_separator):
+        # trailing event without a terminating blank line
+        event_offsets_ms.append(int((time.perf_counter() - start_time) * 1000))
+    return bytes(body), event_offsets_ms
+
+
+def create_replay_streaming_response(
+    context: RequestContext,
+    events: Sequence[bytes],
+    event_offsets_ms: Sequence[int],
+    timing_scale: float,
+    status_code: int,
+    headers: dict[str, str],
+) -> StreamingResponse:
+    """
+    Creates a streamed response that sends the events (see split_event_stream) with the recorded event_offsets_ms
+    (relative to the start of the request) multiplied by timing_scale
+    """
+    start_time = context.start_time
+
+    async def send_events():
+        for index, event in enumerate(events):
+            # if the recording has been edited, events without an offset are sent with the last offset
+            offset_ms = event_offsets_ms[min(index, len(event_offsets_ms) - 1)] if event_offsets_ms else 0
+            delay = start_time + offset_ms * timing_scale / 1000 - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield event
+
+    # latency is applied while streaming, so LatencyGenerator shouldn't add latency
+    context.values[constants.SIMULATOR_KEY_STREAMING_LATENCY_APPLIED] = True
+    headers = {k: v for k, v in headers.items() if k.lower() != "content-length"}
+    return StreamingResponse(
+        content=send_events(), status_code=status_code, headers=headers, media_type=EVENT_STREAM_CONTENT_TYPE
+    )
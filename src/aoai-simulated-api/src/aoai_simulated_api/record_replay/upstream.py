@@ -0,0 +1,153 @@
+"""
+Load-balancing forwarded requests across multiple upstream Azure OpenAI endpoints in record mode.
+
+Each endpoint (e.g. a resource in another region or subscription) has its own quota, so spreading requests across
+endpoints increases the rate at which responses can be recorded. The pool tracks the health and capacity of each
+endpoint for each deployment and selects an endpoint for each request using either:
+
+- least-outstanding: the endpoint with the fewest requests currently forwarded (or waiting to be forwarded)
+- remaining-tokens: the endpoint with the most remaining tokens (from the x-ratelimit-remaining-tokens header)
+  per outstanding request
+
+Endpoints that respond with a 429 are avoided until the retry-after period has passed, and endpoints that fail
+(connection errors or 5xx responses) are avoided for a back-off period that grows with consecutive failures.
+"""
+
+from contextlib import contextmanager
+import logging
+import math
+import time
+from typing import Iterator, Mapping
+
+from aoai_simulated_api.models import RecordingConfig, UpstreamEndpoint
+from aoai_simulated_api.record_replay.admission import get_retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# used when a 429 response doesn't include a retry-after value
+_default_retry_after_s = 1.0
+_max_failure_backoff_s = 30.0
+
+
+class _UpstreamState:
+    outstanding: int
+    remaining_tokens: int | None
+    unavailable_until: float
+    consecutive_failures: int
+
+    def __init__(self):
+        self.outstanding = 0
+        self.remaining_tokens = None
+        self.unavailable_until = 0.0
+        self.consecutive_failures = 0
+
+
+class UpstreamEndpointPool:
+    """Selects the endpoint to forward each request to (see module docstring)"""
+
+    endpoints: list[UpstreamEndpoint]
+    routing: str
+    _states: dict[tuple[str, str], _UpstreamState]
+
+    def __init__(self, endpoints: list[UpstreamEndpoint], routing: str):
+        if not endpoints:
+            raise ValueError("At least one upstream endpoint is required")
+        self.endpoints = list(endpoints)
+        self.routing = routing
+        self._states = {}
+
+    def _get_state(self, endpoint: UpstreamEndpoint, deployment_name: str) -> _UpstreamState:
+        key = (endpoint.name, deployment_name)
+        state = self._states.get(key)
+        if state is None:
+            state = _UpstreamState()
+            self._states[key] = state
+        return state
+
+    def _get_score(self, state: _UpstreamState) -> tuple[float, float]:
+        # higher scores are selected
+        if self.routing == "remaining-tokens":
+            # endpoints without a known remaining value are tried first to learn their capacity
+            remaining_tokens = math.inf if state.remaining_tokens is None else state.remaining_tokens
+            return (remaining_tokens / (state.outstanding + 1), -state.outstanding)
+        return (-state.outstanding, 0)
+
+    def select_endpoint(self, deployment_name: str) -> UpstreamEndpoint:
+        """Returns the endpoint to forward the next request for the deployment to"""
+        now = time.monotonic()
+        candidates = [(endpoint, self._get_state(endpoint, deployment_name)) for endpoint in self.endpoints]
+        available = [(endpoint, state) for endpoint, state in candidates if state.unavailable_until <= now]
+        if not available:
+            # all endpoints are unavailable - use the one that becomes available first
+            return min(candidates, key=lambda candidate: candidate[1].unavailable_until)[0]
+        # max returns the first of equal scores, so ties go to the earlier endpoint in the list
+        return max(available, key=lambda candidate: self._get_score(candidate[1]))[0]
+
+    @contextmanager
+    def acquire(self, deployment_name: str) -> Iterator[UpstreamEndpoint]:
+        """Selects an endpoint and counts the request as outstanding on the endpoint until the context exits"""
+        endpoint = self.select_endpoint(deployment_name)
+        state = self._get_state(endpoint, deployment_name)
+        state.outstanding += 1
+        try:
+            yield endpoint
+        finally:
+            state.outstanding -= 1
+
+    def record_response(
+        self, endpoint: UpstreamEndpoint, deployment_name: str, status_code: int, headers: Mapping[str, str]
+    ):
+        """Updates the health and capacity of the endpoint based on an upstream response"""
+        state = self._get_state(endpoint, deployment_name)
+        now = time.monotonic()
+        if status_code == 429:
+            retry_after = get_retry_after_seconds(headers)
+            if retry_after is None:
+                retry_after = _default_retry_after_s
+            state.unavailable_until = max(state.unavailable_until, now + retry_after)
+            state.remaining_tokens = 0
+            return
+        if status_code >= 500:
+            self._record_failure(endpoint, state, now)
+            return
+
+        state.consecutive_failures = 0
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if remaining_tokens is not None:
+            try:
+                state.remaining_tokens = int(remaining_tokens)
+            except ValueError:
+                pass
+
+    def record_failure(self, endpoint: UpstreamEndpoint, deployment_name: str):
+        """Records a failure to send a request to the endpoint (e.g. a connection error)"""
+        self._record_failure(endpoint, self._get_state(endpoint, deployment_name), time.monotonic())
+
+    def _record_failure(self, endpoint: UpstreamEndpoint, state: _UpstreamState, now: float):
+        state.consecutive_failures += 1
+        backoff = min(_max_failure_backoff_s, 2 ** (state.consecutive_failures - 1))
+        state.unavailable_until = max(state.unavailable_until, now + backoff)
+        logger.warning("⚠️ Upstream endpoint %s failed - avoiding for %ss", endpoint.name, backoff)
+
+
+_upstream_pool: UpstreamEndpointPool | None = None
+
+
+def get_upstream_pool(recording_config: RecordingConfig) -> UpstreamEndpointPool | None:
+    """
+    Returns the shared endpoint pool for the upstream endpoints in recording_config
+    (or None if no endpoints are configured)
+    """
+    # pylint: disable-next=global-statement
+    global _upstream_pool
+
+    endpoints = recording_config.get_upstream_endpoints()
+    if not endpoints:
+        return None
+    if (
+        _upstream_pool is None
+        or _upstream_pool.endpoints != endpoints
+        or _upstream_pool.routing != recording_config.upstream_routing
+    ):
+        _upstream_pool = UpstreamEndpointPool(endpoints, recording_config.upstream_routing)
+    return _upstream_pool
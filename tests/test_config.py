@@ -94,6 +94,39 @@ async def test_config_update_latency():
         assert config_json["latency"]["open_ai_chat_completions"]["std_dev"] == 0.1
 
 
+@pytest.mark.asyncio
+async def test_config_update_streaming_latency():
+    """
+    Ensure that the streaming latency values can be updated
+    """
+    config = _get_generator_config()
+    server = UvicornTestServer(config)
+    with server.run_in_thread():
+        url = "http://localhost:8001/++/config"
+        headers = {"api-key": "123456789"}
+
+        response = requests.get(url, headers=headers, timeout=10)
+        config_json = response.json()
+        assert config_json["latency"]["open_ai_chat_completions_streaming"] == {
+            "ttft_mean": 500,
+            "ttft_std_dev": 100,
+            "per_token_mean": 19,
+            "per_token_std_dev": 6,
+        }
+
+        config_update = {"latency": {"open_ai_chat_completions_streaming": {"ttft_mean": 200, "per_token_mean": 5}}}
+        response = requests.patch(url, headers=headers, json=config_update, timeout=10)
+        config_json = response.json()
+
+        assert config_json["latency"]["open_ai_chat_completions_streaming"] == {
+            "ttft_mean": 200,
+            "ttft_std_dev": 100,
+            "per_token_mean": 5,
+            "per_token_std_dev": 6,
+        }
+        assert config_json["latency"]["open_ai_chat_completions"]["mean"] == 0
+
+
 def _get_record_config(httpserver: HTTPServer, recording_path: str) -> Config:
     forwarding_server_url = httpserver.url_for("/").removesuffix("/")
     config = Config(generators=[])
@@ -0,0 +1,54 @@
+import os
+import threading
+
+from aoai_simulated_api.executor import configure_executor, offload, run_in_executor
+from aoai_simulated_api.models import ExecutorConfig
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def reset_executor():
+    yield
+    configure_executor(ExecutorConfig())
+
+
+def _get_thread_id(_: str) -> int:
+    return threading.get_ident()
+
+
+@offload(get_size=len)
+def get_process_id(_: str) -> int:
+    return os.getpid()
+
+
+def _create_executor_config(executor_type: str, min_offload_size: int) -> ExecutorConfig:
+    return ExecutorConfig(EXECUTOR_TYPE=executor_type, EXECUTOR_MIN_OFFLOAD_SIZE=min_offload_size)
+
+
+@pytest.mark.asyncio
+async def test_small_work_runs_inline():
+    configure_executor(_create_executor_config("thread", min_offload_size=10))
+
+    assert await run_in_executor(_get_thread_id, "small", size=5) == threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_large_work_runs_in_thread_pool():
+    configure_executor(_create_executor_config("thread", min_offload_size=10))
+
+    assert await run_in_executor(_get_thread_id, "large", size=10) != threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_executor_type_none_runs_inline():
+    configure_executor(_create_executor_config("none", min_offload_size=0))
+
+    assert await run_in_executor(_get_thread_id, "large", size=1000) == threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_offload_decorator_with_process_pool():
+    configure_executor(_create_executor_config("process", min_offload_size=10))
+
+    assert await get_process_id("small") == os.getpid()
+    assert await get_process_id("large enough") != os.getpid()
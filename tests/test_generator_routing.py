@@ -0,0 +1,63 @@
+from aoai_simulated_api.generator.routing import GeneratorRouteIndex, generator_route
+
+
+@generator_route(path="/openai/deployments/{deployment}/embeddings", methods=["POST"])
+def embeddings_generator(context):
+    pass
+
+
+@generator_route(path="/openai/deployments/{deployment}/chat/completions", methods=["POST"])
+def chat_completions_generator(context):
+    pass
+
+
+@generator_route(path="/formrecognizer/documentModels/{modelId}:analyze", methods=["POST"])
+def analyze_generator(context):
+    pass
+
+
+@generator_route(path="/files/{file_path:path}", methods=["GET"])
+def files_generator(context):
+    pass
+
+
+def fallback_generator(context):
+    pass
+
+
+def _get_candidates(route_index: GeneratorRouteIndex, method: str, path: str):
+    return [(generator.__name__, path_params) for generator, path_params in route_index.get_candidates(method, path)]
+
+
+def test_declared_routes_are_matched():
+    route_index = GeneratorRouteIndex([embeddings_generator, chat_completions_generator, analyze_generator])
+
+    assert _get_candidates(route_index, "POST", "/openai/deployments/dep1/chat/completions") == [
+        ("chat_completions_generator", {"deployment": "dep1"})
+    ]
+    assert _get_candidates(route_index, "POST", "/formrecognizer/documentModels/prebuilt-read:analyze") == [
+        ("analyze_generator", {"modelId": "prebuilt-read"})
+    ]
+
+
+def test_unmatched_requests_have_no_candidates():
+    route_index = GeneratorRouteIndex([embeddings_generator, chat_completions_generator, analyze_generator])
+
+    assert not _get_candidates(route_index, "GET", "/openai/deployments/dep1/chat/completions")
+    assert not _get_candidates(route_index, "POST", "/openai/deployments/dep1/completions")
+    assert not _get_candidates(route_index, "POST", "/openai/deployments//embeddings")
+    assert not _get_candidates(route_index, "POST", "/formrecognizer/documentModels/prebuilt-read")
+
+
+def test_undeclared_generators_are_invoked_in_order():
+    route_index = GeneratorRouteIndex([fallback_generator, embeddings_generator, files_generator])
+
+    assert _get_candidates(route_index, "POST", "/openai/deployments/dep1/embeddings") == [
+        ("fallback_generator", None),
+        ("embeddings_generator", {"deployment": "dep1"}),
+    ]
+    assert _get_candidates(route_index, "GET", "/files/a/b.txt") == [
+        ("fallback_generator", None),
+        ("files_generator", {"file_path": "a/b.txt"}),
+    ]
+    assert _get_candidates(route_index, "GET", "/other") == [("fallback_generator", None)]
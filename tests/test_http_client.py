@@ -0,0 +1,26 @@
+from aoai_simulated_api.models import RecordingConfig
+from aoai_simulated_api.record_replay.http_client import get_http_client
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_http_client_is_shared():
+    recording_config = RecordingConfig(RECORDING_FORWARDER_TIMEOUT=5, RECORDING_FORWARDER_MAX_CONNECTIONS=3)
+
+    http_client = get_http_client(recording_config)
+
+    assert get_http_client(recording_config) is http_client
+    assert http_client.timeout.read == 5
+    assert http_client.timeout.connect == 10
+
+
+@pytest.mark.asyncio
+async def test_http_client_is_replaced_when_settings_change():
+    recording_config = RecordingConfig()
+    http_client = get_http_client(recording_config)
+
+    recording_config.forwarder_timeout = 60
+    updated_http_client = get_http_client(recording_config)
+
+    assert updated_http_client is not http_client
+    assert updated_http_client.timeout.read == 60
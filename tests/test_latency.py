@@ -0,0 +1,41 @@
+import time
+
+from aoai_simulated_api import constants
+from aoai_simulated_api.latency import LatencyGenerator
+from aoai_simulated_api.models import Config, RequestContext
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+import pytest
+
+
+def _create_context(target_duration_ms: int) -> RequestContext:
+    scope = {"type": "http", "method": "POST", "path": "/test", "query_string": b"", "headers": []}
+    context = RequestContext(config=Config(generators=[]), request=Request(scope))
+    context.values[constants.TARGET_DURATION_MS] = target_duration_ms
+    return context
+
+
+async def _empty_stream():
+    yield b""
+
+
+async def _time_latency_generator(context: RequestContext) -> float:
+    start_time = time.perf_counter()
+    async with LatencyGenerator(context) as latency_generator:
+        latency_generator.set_response(StreamingResponse(content=_empty_stream()))
+    return time.perf_counter() - start_time
+
+
+@pytest.mark.asyncio
+async def test_latency_added_for_extension_streaming_response():
+    context = _create_context(target_duration_ms=200)
+
+    assert await _time_latency_generator(context) >= 0.2
+
+
+@pytest.mark.asyncio
+async def test_latency_skipped_when_applied_while_streaming():
+    context = _create_context(target_duration_ms=200)
+    context.values[constants.SIMULATOR_KEY_STREAMING_LATENCY_APPLIED] = True
+
+    assert await _time_latency_generator(context) < 0.1
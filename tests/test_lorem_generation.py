@@ -5,7 +5,7 @@ The main challenges have been ensuring low max_token values generate the correct
 """
 
 import time
-from aoai_simulated_api.generator.openai import generate_lorem_text
+from aoai_simulated_api.generator.openai import generate_lorem_text, generate_lorem_text_with_token_count
 from aoai_simulated_api.generator.openai_tokens import num_tokens_from_string
 import pytest
 
@@ -17,7 +17,7 @@ def test_generation_min_max_time_10_tokens():
 
     run_test(
         max_tokens=10,
-        expected_min=8,
+        expected_min=10,
         expected_max=10,
         max_duration=0.001,
     )
@@ -29,7 +29,7 @@ def test_generation_min_max_time_100_tokens():
     """
     run_test(
         max_tokens=100,
-        expected_min=95,
+        expected_min=100,
         expected_max=100,
         max_duration=0.001,
     )
@@ -42,12 +42,27 @@ def test_generation_min_max_time_10_000_tokens():
     """
     run_test(
         max_tokens=10000,
-        expected_min=9994,
+        expected_min=10000,
         expected_max=10000,
         max_duration=0.01,
     )
 
 
+@pytest.mark.parametrize("model_name", ["gpt-3.5-turbo-0613", "text-davinci-003"])
+def test_generation_returns_exact_token_count(model_name):
+    """
+    Ensure that the generated text has exactly max_tokens tokens and that the returned token count matches the text
+    """
+    for max_tokens in list(range(1, 50)) + [100, 1000, 4000]:
+        text, token_count = generate_lorem_text_with_token_count(max_tokens, model_name)
+        assert token_count == max_tokens
+        assert num_tokens_from_string(text, model_name) == max_tokens
+
+
+def test_generation_zero_tokens():
+    assert generate_lorem_text_with_token_count(0, "gpt-3.5-turbo-0613") == ("", 0)
+
+
 def run_test(max_tokens, expected_min, expected_max, max_duration, iteration_count=200):
 
     generate_lorem_text(1, "gpt-3.5-turbo-0613")  # ignore first run
@@ -8,12 +8,15 @@ from aoai_simulated_api.models import (
     ChatCompletionLatency,
     CompletionLatency,
     EmbeddingLatency,
+    ChatCompletionStreamingLatency,
     OpenAIDeployment,
+    ResponsePoolConfig,
 )
 from aoai_simulated_api.generator.manager import get_default_generators
 from openai import AzureOpenAI, AuthenticationError, NotFoundError, RateLimitError, Stream
 from openai.types.chat import ChatCompletionChunk
 import pytest
+import time
 
 from .test_uvicorn_server import UvicornTestServer
 
@@ -224,3 +227,93 @@ async def test_custom_generator():
         assert response.choices[0].message.role == "assistant"
         assert response.usage.completion_tokens <= 10, "Custom generator hard-codes max_tokens to 10"
         assert response.choices[0].finish_reason == "stop"
+
+
+@pytest.mark.asyncio
+async def test_success_with_response_pool():
+    """
+    Ensure we can call the chat completion endpoint with the response pool enabled
+    """
+    config = _get_generator_config()
+    config.response_pool = ResponsePoolConfig(GENERATOR_RESPONSE_POOL_SIZE=2, GENERATOR_RESPONSE_POOL_BUCKET_SIZE=16)
+    server = UvicornTestServer(config)
+    with server.run_in_thread():
+        aoai_client = AzureOpenAI(
+            api_key=API_KEY,
+            api_version="2023-12-01-preview",
+            azure_endpoint="http://localhost:8001",
+            max_retries=0,
+        )
+        messages = [{"role": "user", "content": "What is the meaning of life?"}]
+
+        ids = set()
+        contents = set()
+        for _ in range(6):
+            response = aoai_client.chat.completions.create(model="deployment1", messages=messages, max_tokens=50)
+            assert len(response.choices) == 1
+            assert response.choices[0].message.role == "assistant"
+            assert response.choices[0].finish_reason == "length"
+            # max_tokens is rounded down to a multiple of the bucket size
+            assert response.usage.completion_tokens == 48
+            assert response.usage.prompt_tokens == 14
+            assert response.usage.total_tokens == 62
+            ids.add(response.id)
+            contents.add(response.choices[0].message.content)
+
+        assert len(ids) == 6, "Each response should have a unique id"
+        assert len(contents) <= 2, "Responses should be served from the pool"
+
+
+@pytest.mark.asyncio
+async def test_stream_latency():
+    """
+    Ensure that the time-to-first-token and per-token latency are applied to streamed responses
+    and that deployments can override the streaming latency
+    """
+    config = _get_generator_config()
+    config.latency.open_ai_chat_completions_streaming = ChatCompletionStreamingLatency(
+        LATENCY_OPENAI_CHAT_COMPLETIONS_STREAMING_TTFT_MEAN=500,
+        LATENCY_OPENAI_CHAT_COMPLETIONS_STREAMING_TTFT_STD_DEV=0,
+        LATENCY_OPENAI_CHAT_COMPLETIONS_STREAMING_PER_TOKEN_MEAN=20,
+        LATENCY_OPENAI_CHAT_COMPLETIONS_STREAMING_PER_TOKEN_STD_DEV=0,
+    )
+    config.openai_deployments["fast_stream"] = OpenAIDeployment(
+        name="fast_stream",
+        model="gpt-3.5-turbo",
+        tokens_per_minute=100000,
+        streaming_latency=ChatCompletionStreamingLatency(
+            LATENCY_OPENAI_CHAT_COMPLETIONS_STREAMING_TTFT_MEAN=0,
+            LATENCY_OPENAI_CHAT_COMPLETIONS_STREAMING_TTFT_STD_DEV=0,
+            LATENCY_OPENAI_CHAT_COMPLETIONS_STREAMING_PER_TOKEN_MEAN=0,
+            LATENCY_OPENAI_CHAT_COMPLETIONS_STREAMING_PER_TOKEN_STD_DEV=0,
+        ),
+    )
+    server = UvicornTestServer(config)
+    with server.run_in_thread():
+        aoai_client = AzureOpenAI(
+            api_key=API_KEY,
+            api_version="2023-12-01-preview",
+            azure_endpoint="http://localhost:8001",
+            max_retries=0,
+        )
+        messages = [{"role": "user", "content": "What is the meaning of life?"}]
+
+        def measure_stream(deployment: str) -> tuple[float, float]:
+            start = time.perf_counter()
+            response = aoai_client.chat.completions.create(
+                model=deployment, messages=messages, max_tokens=20, stream=True
+            )
+            ttft = None
+            for _ in response:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+            return ttft, time.perf_counter() - start
+
+        ttft, duration = measure_stream("deployment1")
+        assert 0.5 <= ttft < 0.8
+        # 19 further tokens at 20ms per token
+        assert 0.5 + 19 * 0.02 <= duration < 1.5
+
+        ttft, duration = measure_stream("fast_stream")
+        assert ttft < 0.3
+        assert duration < 0.3
@@ -2,6 +2,8 @@
 Test the OpenAI generator endpoints
 """
 
+import base64
+
 from aoai_simulated_api.models import (
     Config,
     LatencyConfig,
@@ -11,8 +13,9 @@ from aoai_simulated_api.models import (
     OpenAIDeployment,
 )
 from aoai_simulated_api.generator.manager import get_default_generators
-from openai import AzureOpenAI, AuthenticationError, NotFoundError, RateLimitError, Stream
+from openai import AzureOpenAI, AuthenticationError, BadRequestError, NotFoundError, RateLimitError, Stream
 from openai.types.chat import ChatCompletionChunk
+import numpy as np
 import pytest
 
 from .test_uvicorn_server import UvicornTestServer
@@ -46,6 +49,9 @@ def _get_generator_config(extension_path: str | None = None) -> Config:
         "deployment2": OpenAIDeployment(
             name="text-embedding-ada-001", model="text-embedding-ada-001", embedding_size=768, tokens_per_minute=10000
         ),
+        "deployment3": OpenAIDeployment(
+            name="text-embedding-3-small", model="text-embedding-3-small", embedding_size=1536, tokens_per_minute=10000
+        ),
     }
     config.extension_path = extension_path
     return config
@@ -107,6 +113,84 @@ async def test_success():
         assert len(response.data[0].embedding) == 768
 
 
+@pytest.mark.asyncio
+async def test_success_encoding_formats():
+    """
+    Ensure that the float and base64 encoding formats return embeddings of the expected size
+    """
+    config = _get_generator_config()
+    server = UvicornTestServer(config)
+    with server.run_in_thread():
+        aoai_client = AzureOpenAI(
+            api_key=API_KEY,
+            api_version="2023-12-01-preview",
+            azure_endpoint="http://localhost:8001",
+            max_retries=0,
+        )
+
+        content = ["This is some text to generate embeddings for", "And some more text"]
+        for encoding_format in ["float", "base64"]:
+            response = aoai_client.embeddings.create(
+                model="deployment1", input=content, encoding_format=encoding_format
+            )
+            assert len(response.data) == 2
+            for index, embedding in enumerate(response.data):
+                assert embedding.index == index
+                values = embedding.embedding
+                if encoding_format == "base64":
+                    # the client only decodes base64 values when it chose the encoding format
+                    values = np.frombuffer(base64.b64decode(values), dtype="<f4").tolist()
+                assert len(values) == 1536
+                assert all(-2 <= value <= 2 for value in values)
+            assert response.usage.prompt_tokens == 12
+
+
+@pytest.mark.asyncio
+async def test_success_with_dimensions():
+    """
+    Ensure that the dimensions parameter is honoured for models that support it
+    """
+    config = _get_generator_config()
+    server = UvicornTestServer(config)
+    with server.run_in_thread():
+        aoai_client = AzureOpenAI(
+            api_key=API_KEY,
+            api_version="2023-12-01-preview",
+            azure_endpoint="http://localhost:8001",
+            max_retries=0,
+        )
+        content = "This is some text to generate embeddings for"
+        response = aoai_client.embeddings.create(model="deployment3", input=content, dimensions=256)
+        assert len(response.data) == 1
+        assert len(response.data[0].embedding) == 256
+
+
+@pytest.mark.asyncio
+async def test_dimensions_not_supported_by_model():
+    """
+    Ensure that the dimensions parameter is rejected for models that don't support it
+    """
+    config = _get_generator_config()
+    server = UvicornTestServer(config)
+    with server.run_in_thread():
+        aoai_client = AzureOpenAI(
+            api_key=API_KEY,
+            api_version="2023-12-01-preview",
+            azure_endpoint="http://localhost:8001",
+            max_retries=0,
+        )
+        content = "This is some text to generate embeddings for"
+        try:
+            aoai_client.embeddings.create(model="deployment1", input=content, dimensions=256)
+            assert False, "Expected 400 error"
+        except BadRequestError as e:
+            assert e.status_code == 400
+            assert (
+                e.message
+                == "Error code: 400 - {'error': {'code': '400', 'message': 'This model does not support specifying dimensions.'}}"
+            )
+
+
 @pytest.mark.asyncio
 async def test_limit_reached():
     """
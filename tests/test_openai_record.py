@@ -2,12 +2,16 @@
 Test the OpenAI generator endpoints
 """
 
+import json
+import os
 import shutil
 import tempfile
+import time
 
 from openai import AzureOpenAI, InternalServerError, RateLimitError
 import pytest
 from pytest_httpserver import HTTPServer
+from werkzeug import Request, Response
 
 from .test_uvicorn_server import UvicornTestServer
 
@@ -19,6 +23,7 @@ from aoai_simulated_api.models import (
     CompletionLatency,
     EmbeddingLatency,
     OpenAIDeployment,
+    UpstreamEndpoint,
 )
 
 
@@ -45,7 +50,7 @@ class TempDirectory:
 API_KEY = "123456879"
 
 
-def _get_record_config(httpserver: HTTPServer, recording_path: str) -> Config:
+def _get_record_config(httpserver: HTTPServer, recording_path: str, recording_format: str = "yaml") -> Config:
     forwarding_server_url = httpserver.url_for("/").removesuffix("/")
     config = Config(generators=[])
     config.simulator_api_key = API_KEY
@@ -53,6 +58,7 @@ def _get_record_config(httpserver: HTTPServer, recording_path: str) -> Config:
     config.recording.aoai_api_endpoint = forwarding_server_url
     config.recording.aoai_api_key = "123456789"
     config.recording.dir = recording_path
+    config.recording.format = recording_format
     config.recording.forwarders = get_default_forwarders()
     config.latency = LatencyConfig(
         open_ai_completions=CompletionLatency(
@@ -71,11 +77,12 @@ def _get_record_config(httpserver: HTTPServer, recording_path: str) -> Config:
     return config
 
 
-def _get_replay_config(recording_path: str) -> Config:
+def _get_replay_config(recording_path: str, recording_format: str = "yaml") -> Config:
     config = Config(generators=[])
     config.simulator_api_key = API_KEY
     config.simulator_mode = "replay"
     config.recording.dir = recording_path
+    config.recording.format = recording_format
     config.recording.forwarders = get_default_forwarders()
     config.latency = LatencyConfig(
         open_ai_completions=CompletionLatency(
@@ -165,6 +172,136 @@ async def test_openai_record_replay_completion(httpserver: HTTPServer):
                 assert e.status_code == 500
 
 
+@pytest.mark.asyncio
+async def test_openai_record_replay_completion_jsonl(httpserver: HTTPServer):
+    """
+    Ensure we can record and replay using the JSON Lines recording format
+    """
+
+    httpserver.expect_request(
+        uri="/openai/deployments/deployment1/completions",
+        query_string="api-version=2023-12-01-preview",
+        method="POST",
+    ).respond_with_data(
+        '{"id":"cmpl-95FbXadIqJEMZZ1Rl0chTcKRxk2ez","object":"text_completion","created":1711038651,"model":"gpt-35-turbo","choices":[{"text":"This is a test","index":0,"finish_reason":"length","logprobs":null}],"usage":{"prompt_tokens":7,"completion_tokens":50,"total_tokens":57}}\n'
+    )
+
+    with TempDirectory() as temp_dir:
+        config = _get_record_config(httpserver, temp_dir.path, recording_format="jsonl")
+        server = UvicornTestServer(config)
+        with server.run_in_thread():
+            aoai_client = AzureOpenAI(
+                api_key=API_KEY,
+                api_version="2023-12-01-preview",
+                azure_endpoint="http://localhost:8001",
+                max_retries=0,
+            )
+            response = aoai_client.completions.create(
+                model="deployment1", prompt="This is a test prompt", max_tokens=50
+            )
+            assert response.choices[0].text == "This is a test"
+
+        assert os.path.exists(os.path.join(temp_dir.path, "openai_deployments_deployment1_completions.jsonl"))
+        httpserver.clear_all_handlers()
+
+        config = _get_replay_config(temp_dir.path, recording_format="jsonl")
+        server = UvicornTestServer(config)
+        with server.run_in_thread():
+            aoai_client = AzureOpenAI(
+                api_key=API_KEY,
+                api_version="2023-12-01-preview",
+                azure_endpoint="http://localhost:8001",
+                max_retries=0,
+            )
+            response = aoai_client.completions.create(
+                model="deployment1", prompt="This is a test prompt", max_tokens=50
+            )
+            assert response.choices[0].text == "This is a test"
+
+
+@pytest.mark.asyncio
+async def test_openai_record_retries_upstream_rate_limited_request(httpserver: HTTPServer):
+    """
+    Ensure that a request that is rate-limited by the upstream is retried after the retry-after period and recorded
+    """
+
+    httpserver.expect_oneshot_request(
+        uri="/openai/deployments/deployment1/completions",
+        query_string="api-version=2023-12-01-preview",
+        method="POST",
+    ).respond_with_data('{"error": {"code": "429"}}', status=429, headers={"retry-after-ms": "100"})
+    httpserver.expect_request(
+        uri="/openai/deployments/deployment1/completions",
+        query_string="api-version=2023-12-01-preview",
+        method="POST",
+    ).respond_with_data(
+        '{"id":"cmpl-95FbXadIqJEMZZ1Rl0chTcKRxk2ez","object":"text_completion","created":1711038651,"model":"gpt-35-turbo","choices":[{"text":"This is a test","index":0,"finish_reason":"length","logprobs":null}],"usage":{"prompt_tokens":7,"completion_tokens":50,"total_tokens":57}}\n'
+    )
+
+    with TempDirectory() as temp_dir:
+        config = _get_record_config(httpserver, temp_dir.path)
+        server = UvicornTestServer(config)
+        with server.run_in_thread():
+            aoai_client = AzureOpenAI(
+                api_key=API_KEY,
+                api_version="2023-12-01-preview",
+                azure_endpoint="http://localhost:8001",
+                max_retries=0,
+            )
+            response = aoai_client.completions.create(
+                model="deployment1", prompt="This is a test prompt", max_tokens=50
+            )
+            assert response.choices[0].text == "This is a test"
+
+        assert len(httpserver.log) == 2
+        assert os.path.exists(os.path.join(temp_dir.path, "openai_deployments_deployment1_completions.yaml"))
+
+
+@pytest.mark.asyncio
+async def test_openai_record_forwards_to_available_upstream_endpoint(httpserver: HTTPServer):
+    """
+    Ensure that requests are forwarded to another upstream endpoint when an endpoint is rate-limited
+    """
+
+    httpserver.expect_request(
+        uri="/endpoint1/openai/deployments/deployment1/completions",
+        query_string="api-version=2023-12-01-preview",
+        method="POST",
+    ).respond_with_data('{"error": {"code": "429"}}', status=429, headers={"retry-after": "10"})
+    httpserver.expect_request(
+        uri="/endpoint2/openai/deployments/deployment1/completions",
+        query_string="api-version=2023-12-01-preview",
+        method="POST",
+    ).respond_with_data(
+        '{"id":"cmpl-95FbXadIqJEMZZ1Rl0chTcKRxk2ez","object":"text_completion","created":1711038651,"model":"gpt-35-turbo","choices":[{"text":"This is a test","index":0,"finish_reason":"length","logprobs":null}],"usage":{"prompt_tokens":7,"completion_tokens":50,"total_tokens":57}}\n'
+    )
+
+    with TempDirectory() as temp_dir:
+        config = _get_record_config(httpserver, temp_dir.path)
+        config.recording.upstream_endpoints = [
+            UpstreamEndpoint(name="endpoint1", endpoint=httpserver.url_for("/endpoint1/"), key="key1"),
+            UpstreamEndpoint(name="endpoint2", endpoint=httpserver.url_for("/endpoint2/"), key="key2"),
+        ]
+        server = UvicornTestServer(config)
+        with server.run_in_thread():
+            aoai_client = AzureOpenAI(
+                api_key=API_KEY,
+                api_version="2023-12-01-preview",
+                azure_endpoint="http://localhost:8001",
+                max_retries=0,
+            )
+            for _ in range(2):
+                response = aoai_client.completions.create(
+                    model="deployment1", prompt="This is a test prompt", max_tokens=50
+                )
+                assert response.choices[0].text == "This is a test"
+
+        # the rate-limited endpoint is only tried once
+        forwarded_paths = [request.path for request, _ in httpserver.log]
+        assert forwarded_paths.count("/endpoint1/openai/deployments/deployment1/completions") == 1
+        assert httpserver.log[-1][0].headers["api-key"] == "key2"
+
+
 @pytest.mark.asyncio
 async def test_openai_record_replay_completion_limit_reached(httpserver: HTTPServer):
     """
@@ -228,3 +365,89 @@ async def test_openai_record_replay_completion_limit_reached(httpserver: HTTPSer
                     e.message
                     == "Error code: 429 - {'error': {'code': '429', 'message': 'Requests to the OpenAI API Simulator have exceeded call rate limit. Please retry after 10 seconds.'}}"
                 )
+
+
+def _stream_chat_completion_events(_: Request) -> Response:
+    def generate_events():
+        for index, content in enumerate(["This", " is", " a", " test"]):
+            if index > 0:
+                time.sleep(0.2)
+            chunk = {
+                "id": "chatcmpl-123",
+                "object": "chat.completion.chunk",
+                "created": 1711038651,
+                "model": "gpt-35-turbo",
+                "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return Response(generate_events(), content_type="text/event-stream")
+
+
+def _get_stream_chunk_times(aoai_client: AzureOpenAI) -> tuple[str, list[float]]:
+    start_time = time.perf_counter()
+    response = aoai_client.chat.completions.create(
+        model="deployment1", messages=[{"role": "user", "content": "What is this?"}], max_tokens=10, stream=True
+    )
+    content = ""
+    chunk_times = []
+    for chunk in response:
+        content += chunk.choices[0].delta.content
+        chunk_times.append(time.perf_counter() - start_time)
+    return content, chunk_times
+
+
+@pytest.mark.asyncio
+async def test_openai_record_replay_chat_completion_stream(httpserver: HTTPServer):
+    """
+    Ensure that streamed responses are recorded and replayed with the recorded timing
+    """
+    httpserver.expect_request(
+        uri="/openai/deployments/deployment1/chat/completions",
+        query_string="api-version=2023-12-01-preview",
+        method="POST",
+    ).respond_with_handler(_stream_chat_completion_events)
+
+    with TempDirectory() as temp_dir:
+        config = _get_record_config(httpserver, temp_dir.path)
+        server = UvicornTestServer(config)
+        with server.run_in_thread():
+            aoai_client = AzureOpenAI(
+                api_key=API_KEY,
+                api_version="2023-12-01-preview",
+                azure_endpoint="http://localhost:8001",
+                max_retries=0,
+            )
+            content, _ = _get_stream_chunk_times(aoai_client)
+            assert content == "This is a test"
+
+        httpserver.clear_all_handlers()
+
+        config = _get_replay_config(temp_dir.path)
+        server = UvicornTestServer(config)
+        with server.run_in_thread():
+            aoai_client = AzureOpenAI(
+                api_key=API_KEY,
+                api_version="2023-12-01-preview",
+                azure_endpoint="http://localhost:8001",
+                max_retries=0,
+            )
+            content, chunk_times = _get_stream_chunk_times(aoai_client)
+            assert content == "This is a test"
+            # the chunks were recorded ~200ms apart
+            assert chunk_times[-1] - chunk_times[0] >= 0.5
+
+        config = _get_replay_config(temp_dir.path)
+        config.recording.stream_timing_scale = 0
+        server = UvicornTestServer(config)
+        with server.run_in_thread():
+            aoai_client = AzureOpenAI(
+                api_key=API_KEY,
+                api_version="2023-12-01-preview",
+                azure_endpoint="http://localhost:8001",
+                max_retries=0,
+            )
+            content, chunk_times = _get_stream_chunk_times(aoai_client)
+            assert content == "This is a test"
+            assert chunk_times[-1] - chunk_times[0] < 0.2
@@ -0,0 +1,57 @@
+import json
+
+from aoai_simulated_api.generator.openai_streaming import (
+    SSE_DONE_EVENT,
+    ChatCompletionChunkRenderer,
+    split_text_into_token_chunks,
+)
+from aoai_simulated_api.generator.openai_tokens import num_tokens_from_string
+import pytest
+
+
+def _parse_event(event: bytes) -> dict:
+    assert event.startswith(b"data: ")
+    assert event.endswith(b"\n\n")
+    return json.loads(event[len(b"data: ") : -2])
+
+
+def test_render_events():
+    renderer = ChatCompletionChunkRenderer(model_name="gpt-3.5-turbo-0613", finish_reason="length")
+
+    first = _parse_event(renderer.render_content_event("Hello", is_first=True))
+    second = _parse_event(renderer.render_content_event(' "world"\n', is_first=False))
+    finish = _parse_event(renderer.render_finish_event())
+
+    assert first["choices"][0]["delta"]["content"] == "Hello"
+    assert first["choices"][0]["delta"]["role"] == "assistant"
+    assert second["choices"][0]["delta"]["content"] == ' "world"\n'
+    assert second["choices"][0]["delta"]["role"] is None
+    assert finish["choices"][0]["delta"]["content"] is None
+    assert finish["choices"][0]["delta"]["finish_reason"] == "length"
+
+    # all chunks in a stream share the same id
+    assert first["id"] == second["id"] == finish["id"]
+    assert first["id"].startswith("chatcmpl-")
+    assert SSE_DONE_EVENT == b"data: [DONE]\n\n"
+
+
+@pytest.mark.parametrize("tokens_per_chunk", [1, 3, 10])
+def test_split_text_into_token_chunks(tokens_per_chunk):
+    text = "lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor"
+    chunks = split_text_into_token_chunks(text, "gpt-3.5-turbo-0613", tokens_per_chunk)
+
+    assert "".join(chunks) == text
+    token_count = num_tokens_from_string(text, "gpt-3.5-turbo-0613")
+    assert len(chunks) == (token_count + tokens_per_chunk - 1) // tokens_per_chunk
+
+
+def test_split_text_into_token_chunks_multi_byte_characters():
+    text = "héllo wörld 👋 こんにちは"
+    chunks = split_text_into_token_chunks(text, "gpt-3.5-turbo-0613", 1)
+
+    assert "".join(chunks) == text
+    assert all("�" not in chunk for chunk in chunks)
+
+
+def test_split_empty_text():
+    assert not split_text_into_token_chunks("", "gpt-3.5-turbo-0613", 1)
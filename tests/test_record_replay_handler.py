@@ -0,0 +1,141 @@
+import asyncio
+
+import fastapi
+from fastapi import Request
+import pytest
+
+from aoai_simulated_api import constants
+from aoai_simulated_api.models import Config, RequestContext
+from aoai_simulated_api.record_replay.handler import RecordReplayHandler
+from aoai_simulated_api.record_replay.models import RecordedResponse, hash_request_parts
+from aoai_simulated_api.record_replay.persistence import YamlRecordingPersister
+from aoai_simulated_api.record_replay.replay import LoadedRecording
+
+from .test_openai_record import TempDirectory
+
+
+def _create_context(body: bytes, path: str = "/openai/deployments/deployment1/embeddings") -> RequestContext:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json")],
+    }
+    return RequestContext(config=Config(generators=[]), request=Request(scope, receive))
+
+
+@pytest.mark.asyncio
+async def test_identical_in_flight_requests_are_forwarded_once():
+    forwarded_bodies = []
+
+    async def forwarder(context: RequestContext):
+        forwarded_bodies.append(await context.get_request_body())
+        await asyncio.sleep(0.2)
+        return fastapi.Response(content=b'{"data": 1}', status_code=200, headers={"content-type": "application/json"})
+
+    with TempDirectory() as temp_dir:
+        handler = RecordReplayHandler(
+            simulator_mode="record",
+            persister=YamlRecordingPersister(temp_dir.path),
+            forwarders=[forwarder],
+            autosave=False,
+        )
+
+        responses = await asyncio.gather(
+            *[handler.handle_request(_create_context(b'{"input": "one"}')) for _ in range(5)],
+            handler.handle_request(_create_context(b'{"input": "two"}')),
+        )
+
+        assert sorted(forwarded_bodies) == [b'{"input": "one"}', b'{"input": "two"}']
+        assert [response.body for response in responses] == [b'{"data": 1}'] * 6
+        assert [response.status_code for response in responses] == [200] * 6
+
+
+@pytest.mark.asyncio
+async def test_in_flight_requests_are_forwarded_if_forwarding_fails():
+    call_count = 0
+
+    async def forwarder(_: RequestContext):
+        nonlocal call_count
+        call_count += 1
+        await asyncio.sleep(0.1)
+        if call_count == 1:
+            raise ValueError("upstream failed")
+        return fastapi.Response(content=b'{"data": 1}', status_code=200, headers={"content-type": "application/json"})
+
+    with TempDirectory() as temp_dir:
+        handler = RecordReplayHandler(
+            simulator_mode="record",
+            persister=YamlRecordingPersister(temp_dir.path),
+            forwarders=[forwarder],
+            autosave=False,
+        )
+
+        responses = await asyncio.gather(
+            *[handler.handle_request(_create_context(b'{"input": "one"}')) for _ in range(3)],
+            return_exceptions=True,
+        )
+
+        assert isinstance(responses[0], ValueError)
+        assert [response.body for response in responses[1:]] == [b'{"data": 1}'] * 2
+        assert call_count == 2
+
+
+def _create_recorded_response(request_body: str, response_body: str) -> RecordedResponse:
+    return RecordedResponse(
+        request_hash=hash_request_parts("POST", "/openai/deployments/deployment1/embeddings", request_body),
+        status_code=200,
+        headers={"content-type": ["application/json"], "x-ratelimit-remaining-tokens": ["100"]},
+        body=response_body,
+        duration_ms=123,
+        context_values={"Deployment-Name": "deployment1"},
+        full_request={},
+    )
+
+
+@pytest.mark.asyncio
+async def test_replayed_responses_are_prerendered():
+    with TempDirectory() as temp_dir:
+        persister = YamlRecordingPersister(temp_dir.path)
+        recorded_response = _create_recorded_response('{"input": "one"}', '{"data": "héllo"}')
+        persister.save_recording(
+            "/openai/deployments/deployment1/embeddings", {recorded_response.request_hash: recorded_response}
+        )
+        handler = RecordReplayHandler(simulator_mode="replay", persister=persister, forwarders=[], autosave=False)
+
+        context = _create_context(b'{"input": "one"}')
+        response = await handler.handle_request(context)
+
+        expected_response = fastapi.Response(
+            content='{"data": "héllo"}',
+            status_code=200,
+            headers={"content-type": "application/json", "x-ratelimit-remaining-tokens": "100"},
+        )
+        assert response.body == expected_response.body
+        assert response.raw_headers == expected_response.raw_headers
+        assert context.values["Deployment-Name"] == "deployment1"
+        assert context.values[constants.TARGET_DURATION_MS] == 123
+
+        # e.g. limiters update the response headers - this mustn't affect other replayed responses
+        response.headers["x-ratelimit-remaining-tokens"] = "50"
+        next_response = await handler.handle_request(_create_context(b'{"input": "one"}'))
+        assert next_response.headers["x-ratelimit-remaining-tokens"] == "100"
+
+
+@pytest.mark.asyncio
+async def test_rendered_response_is_replaced_when_recording_is_updated():
+    recorded_response = _create_recorded_response('{"input": "one"}', '{"data": 1}')
+    recording = LoadedRecording({recorded_response.request_hash: recorded_response})
+    assert recording.get_rendered_response(recorded_response.request_hash).body == b'{"data": 1}'
+    assert recording.get_rendered_response(recorded_response.request_hash) is recording.get_rendered_response(
+        recorded_response.request_hash
+    )
+
+    recording[recorded_response.request_hash] = _create_recorded_response('{"input": "one"}', '{"data": 2}')
+
+    assert recording.get_rendered_response(recorded_response.request_hash).body == b'{"data": 2}'
+    assert recording.get_rendered_response(1234) is None
@@ -0,0 +1,107 @@
+import pytest
+
+from aoai_simulated_api.record_replay.handler import RecordReplayHandler
+from aoai_simulated_api.record_replay.models import RecordedResponse, hash_request_parts
+from aoai_simulated_api.record_replay.persistence import YamlRecordingPersister
+from aoai_simulated_api.record_replay.recording_cache import RecordingCache
+from aoai_simulated_api.record_replay.replay import LoadedRecording
+
+from .test_openai_record import TempDirectory
+from .test_record_replay_handler import _create_context
+
+URL_PATH = "/openai/deployments/deployment1/embeddings"
+
+
+def _create_recorded_response(url: str, response_body: str) -> RecordedResponse:
+    return RecordedResponse(
+        request_hash=hash_request_parts("POST", url, '{"input": "one"}'),
+        status_code=200,
+        headers={"content-type": ["application/json"]},
+        body=response_body,
+        duration_ms=123,
+        context_values={},
+        full_request={"body": '{"input": "one"}'},
+    )
+
+
+def _create_recording(url: str, response_body: str) -> LoadedRecording:
+    recorded_response = _create_recorded_response(url, response_body)
+    return LoadedRecording({recorded_response.request_hash: recorded_response})
+
+
+def test_least_recently_used_recordings_are_evicted():
+    evicted_urls = []
+    recording_size = _create_recording("/a", "x" * 1000).size_bytes
+    cache = RecordingCache(max_bytes=recording_size * 2, on_evict=lambda url, _: evicted_urls.append(url))
+
+    cache.set("/a", _create_recording("/a", "x" * 1000))
+    cache.set("/b", _create_recording("/b", "x" * 1000))
+    assert cache.get("/a") is not None
+    cache.set("/c", _create_recording("/c", "x" * 1000))
+
+    assert evicted_urls == ["/b"]
+    assert cache.get("/b") is None
+    assert len(cache) == 2
+    assert cache.resident_bytes == recording_size * 2
+
+
+def test_most_recently_used_recording_is_kept_when_over_budget():
+    cache = RecordingCache(max_bytes=100)
+
+    cache.set("/a", _create_recording("/a", "x" * 1000))
+    cache.set("/b", _create_recording("/b", "x" * 1000))
+
+    assert cache.get("/a") is None
+    assert cache.get("/b") is not None
+
+
+def test_rendered_responses_are_included_in_size():
+    cache = RecordingCache()
+    recording = _create_recording("/a", "x" * 1000)
+    cache.set("/a", recording)
+    initial_size = cache.resident_bytes
+
+    recording.get_rendered_response(next(iter(recording)))
+    cache.get("/a")
+
+    assert cache.resident_bytes > initial_size + 1000
+
+
+@pytest.mark.asyncio
+async def test_evicted_recording_is_reloaded():
+    with TempDirectory() as temp_dir:
+        persister = YamlRecordingPersister(temp_dir.path)
+        other_url = "/openai/deployments/deployment2/embeddings"
+        for url in [URL_PATH, other_url]:
+            recorded_response = _create_recorded_response(url, '{"data": 1}')
+            persister.save_recording(url, {recorded_response.request_hash: recorded_response})
+        handler = RecordReplayHandler(
+            simulator_mode="replay", persister=persister, forwarders=[], autosave=False, cache_max_bytes=1
+        )
+
+        response = await handler.handle_request(_create_context(b'{"input": "one"}'))
+        assert response.body == b'{"data": 1}'
+        # loading another recording evicts the first recording
+        assert await handler._get_recording_for_url(other_url) is not None
+
+        response = await handler.handle_request(_create_context(b'{"input": "one"}'))
+        assert response.body == b'{"data": 1}'
+
+
+def test_modified_recording_is_saved_when_evicted():
+    with TempDirectory() as temp_dir:
+        persister = YamlRecordingPersister(temp_dir.path)
+        handler = RecordReplayHandler(
+            simulator_mode="record", persister=persister, forwarders=[], autosave=False, cache_max_bytes=1
+        )
+        recorded_response = _create_recorded_response(URL_PATH, '{"data": 1}')
+        handler.store_recorded_response(_create_context(b'{"input": "one"}').request, recorded_response)
+
+        other_recorded_response = _create_recorded_response("/other", '{"data": 2}')
+        handler.store_recorded_response(
+            _create_context(b'{"input": "one"}', path="/other").request, other_recorded_response
+        )
+
+        assert persister.load_recording_for_url(URL_PATH, expect_recording_file=True) == {
+            recorded_response.request_hash: recorded_response
+        }
@@ -0,0 +1,221 @@
+import os
+
+from aoai_simulated_api.record_replay.models import RecordedResponse, hash_request_parts
+from aoai_simulated_api.record_replay.persistence import (
+    JsonlRecordingPersister,
+    YamlRecordingPersister,
+    convert_yaml_recordings,
+    create_recording_persister,
+)
+from aoai_simulated_api.record_replay.recording_index import get_index_file_path
+import orjson
+import pytest
+import yaml
+
+from .test_openai_record import TempDirectory
+
+URL_PATH = "/openai/deployments/deployment1/embeddings"
+
+
+def _create_recorded_response(request_body: str | bytes, response_body: str | bytes) -> RecordedResponse:
+    return RecordedResponse(
+        request_hash=hash_request_parts("POST", URL_PATH, request_body),
+        status_code=200,
+        headers={"content-type": ["application/json"]},
+        body=response_body,
+        duration_ms=123,
+        context_values={"Deployment-Name": "deployment1"},
+        full_request={
+            "method": "POST",
+            "uri": "http://localhost:8000" + URL_PATH + "?api-version=2023-12-01-preview",
+            "headers": {"content-type": ["application/json"]},
+            "body": request_body,
+        },
+    )
+
+
+def _to_recording(*recorded_responses: RecordedResponse) -> dict[int, RecordedResponse]:
+    return {recorded_response.request_hash: recorded_response for recorded_response in recorded_responses}
+
+
+def test_jsonl_append_writes_one_line_per_response():
+    with TempDirectory() as temp_dir:
+        persister = JsonlRecordingPersister(temp_dir.path)
+        first = _create_recorded_response('{"input": "one"}', '{"data": 1}')
+        second = _create_recorded_response('{"input": "two"}', '{"data": 2}')
+
+        persister.append_recorded_response(URL_PATH, first, _to_recording(first))
+        persister.append_recorded_response(URL_PATH, second, _to_recording(first, second))
+
+        with open(persister.get_recording_file_path(URL_PATH), "rb") as f:
+            assert len(f.readlines()) == 2
+        assert persister.load_recording_for_url(URL_PATH, expect_recording_file=True) == _to_recording(first, second)
+
+
+def test_jsonl_save_compacts_superseded_responses():
+    with TempDirectory() as temp_dir:
+        persister = JsonlRecordingPersister(temp_dir.path)
+        original = _create_recorded_response('{"input": "one"}', '{"data": 1}')
+        updated = _create_recorded_response('{"input": "one"}', '{"data": 2}')
+        persister.append_recorded_response(URL_PATH, original, _to_recording(original))
+        persister.append_recorded_response(URL_PATH, updated, _to_recording(updated))
+
+        # the later line wins when loading
+        assert persister.load_recording_for_url(URL_PATH, expect_recording_file=True) == _to_recording(updated)
+
+        persister.save_recording(URL_PATH, _to_recording(updated))
+
+        with open(persister.get_recording_file_path(URL_PATH), "rb") as f:
+            assert len(f.readlines()) == 1
+        assert persister.load_recording_for_url(URL_PATH, expect_recording_file=True) == _to_recording(updated)
+
+
+def test_jsonl_load_skips_partially_written_line():
+    with TempDirectory() as temp_dir:
+        persister = JsonlRecordingPersister(temp_dir.path)
+        recorded_response = _create_recorded_response('{"input": "one"}', '{"data": 1}')
+        persister.append_recorded_response(URL_PATH, recorded_response, _to_recording(recorded_response))
+        with open(persister.get_recording_file_path(URL_PATH), "ab") as f:
+            f.write(b'{"request": {"method": "PO')
+
+        assert persister.load_recording_for_url(URL_PATH, expect_recording_file=True) == _to_recording(
+            recorded_response
+        )
+
+
+def test_jsonl_round_trips_binary_bodies():
+    with TempDirectory() as temp_dir:
+        persister = JsonlRecordingPersister(temp_dir.path)
+        recorded_response = _create_recorded_response(b"\x00\x01binary", b"\xff\xfeimage")
+        persister.save_recording(URL_PATH, _to_recording(recorded_response))
+
+        assert persister.load_recording_for_url(URL_PATH, expect_recording_file=True) == _to_recording(
+            recorded_response
+        )
+
+
+def test_convert_yaml_recordings():
+    with TempDirectory() as temp_dir:
+        recording = _to_recording(
+            _create_recorded_response('{"input": "one"}', '{"data": 1}'),
+            _create_recorded_response(b"\x00\x01binary", b"\xff\xfeimage"),
+        )
+        YamlRecordingPersister(temp_dir.path).save_recording(URL_PATH, recording)
+
+        converted_paths = convert_yaml_recordings(temp_dir.path)
+
+        jsonl_persister = JsonlRecordingPersister(temp_dir.path)
+        assert converted_paths == [jsonl_persister.get_recording_file_path(URL_PATH)]
+        assert os.path.exists(converted_paths[0])
+        assert jsonl_persister.load_recording_for_url(URL_PATH, expect_recording_file=True) == recording
+
+
+def test_create_recording_persister():
+    assert isinstance(create_recording_persister("yaml", ".recording"), YamlRecordingPersister)
+    assert isinstance(create_recording_persister("jsonl", ".recording"), JsonlRecordingPersister)
+    with pytest.raises(ValueError):
+        create_recording_persister("xml", ".recording")
+
+
+def test_jsonl_responses_are_decoded_when_matched():
+    with TempDirectory() as temp_dir:
+        persister = JsonlRecordingPersister(temp_dir.path)
+        first = _create_recorded_response('{"input": "one"}', '{"data": 1}')
+        second = _create_recorded_response('{"input": "two"}', '{"data": "xxxxxxxx"}')
+        persister.save_recording(URL_PATH, _to_recording(first, second))
+        assert os.path.exists(get_index_file_path(persister.get_recording_file_path(URL_PATH)))
+
+        # corrupt the response in the second line - loading the recording only reads the requests
+        recording_path = persister.get_recording_file_path(URL_PATH)
+        with open(recording_path, "rb") as f:
+            data = f.read()
+        with open(recording_path, "wb") as f:
+            f.write(data.replace(b"xxxxxxxx", b'"}}}}}}"'))
+
+        recording = persister.load_recording_for_url(URL_PATH, expect_recording_file=True)
+
+        assert len(recording) == 2
+        assert recording[first.request_hash] == first
+        with pytest.raises(orjson.JSONDecodeError):
+            _ = recording[second.request_hash]
+
+
+def test_jsonl_index_is_rebuilt_when_missing_or_out_of_date():
+    with TempDirectory() as temp_dir:
+        persister = JsonlRecordingPersister(temp_dir.path)
+        first = _create_recorded_response('{"input": "one"}', '{"data": 1}')
+        second = _create_recorded_response('{"input": "two"}', '{"data": 2}')
+        third = _create_recorded_response('{"input": "three"}', '{"data": 3}')
+        persister.append_recorded_response(URL_PATH, first, _to_recording(first))
+        index_path = get_index_file_path(persister.get_recording_file_path(URL_PATH))
+        with open(index_path, "rb") as f:
+            index_data = f.read()
+        persister.append_recorded_response(URL_PATH, second, _to_recording(first, second))
+
+        # simulate the index not being updated for the second response
+        with open(index_path, "wb") as f:
+            f.write(index_data)
+        persister.append_recorded_response(URL_PATH, third, _to_recording(first, second, third))
+
+        expected_recording = _to_recording(first, second, third)
+        assert persister.load_recording_for_url(URL_PATH, expect_recording_file=True) == expected_recording
+        with open(index_path, "rb") as f:
+            assert len(f.read()) > len(index_data)
+
+        os.remove(index_path)
+        assert persister.load_recording_for_url(URL_PATH, expect_recording_file=True) == expected_recording
+        assert os.path.exists(index_path)
+
+
+def test_request_hash_is_stable():
+    # the hash is persisted with recordings so must be the same in every process
+    assert hash_request_parts("POST", URL_PATH, '{"input": "héllo"}') == 9170177216350589736
+    assert hash_request_parts("POST", URL_PATH, '{"input": "héllo"}'.encode("utf-8")) == 9170177216350589736
+
+
+def test_jsonl_uses_persisted_request_hash():
+    with TempDirectory() as temp_dir:
+        persister = JsonlRecordingPersister(temp_dir.path)
+        recorded_response = _create_recorded_response('{"input": "one"}', '{"data": 1}')
+        recorded_response.request_hash = 1234
+        persister.save_recording(URL_PATH, _to_recording(recorded_response))
+        os.remove(get_index_file_path(persister.get_recording_file_path(URL_PATH)))
+
+        recording = persister.load_recording_for_url(URL_PATH, expect_recording_file=True)
+
+        assert list(recording.keys()) == [1234]
+
+
+def test_jsonl_loads_interactions_without_request_hash():
+    with TempDirectory() as temp_dir:
+        persister = JsonlRecordingPersister(temp_dir.path)
+        current = _create_recorded_response('{"input": "one"}', '{"data": 1}')
+        legacy = _create_recorded_response('{"input": "two"}', '{"data": 2}')
+        persister.save_recording(URL_PATH, _to_recording(current, legacy))
+        recording_path = persister.get_recording_file_path(URL_PATH)
+        with open(recording_path, "rb") as f:
+            lines = f.readlines()
+        legacy_interaction = orjson.loads(lines[1])
+        del legacy_interaction["request_hash"]
+        with open(recording_path, "wb") as f:
+            f.write(lines[0] + orjson.dumps(legacy_interaction, option=orjson.OPT_APPEND_NEWLINE))
+
+        assert persister.load_recording_for_url(URL_PATH, expect_recording_file=True) == _to_recording(current, legacy)
+
+
+def test_yaml_loads_interactions_without_request_hash():
+    with TempDirectory() as temp_dir:
+        persister = YamlRecordingPersister(temp_dir.path)
+        recorded_response = _create_recorded_response('{"input": "one"}', '{"data": 1}')
+        persister.save_recording(URL_PATH, _to_recording(recorded_response))
+        recording_path = persister.get_recording_file_path(URL_PATH)
+        with open(recording_path, "r", encoding="utf-8") as f:
+            recording_data = yaml.load(f, Loader=yaml.CLoader)
+        assert recording_data["interactions"][0]["request_hash"] == recorded_response.request_hash
+        del recording_data["interactions"][0]["request_hash"]
+        with open(recording_path, "w", encoding="utf-8") as f:
+            yaml.dump(recording_data, stream=f, Dumper=yaml.CDumper)
+
+        assert persister.load_recording_for_url(URL_PATH, expect_recording_file=True) == _to_recording(
+            recorded_response
+        )
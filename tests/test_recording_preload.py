@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from aoai_simulated_api.record_replay.handler import RecordReplayHandler
+from aoai_simulated_api.record_replay.models import RecordedResponse, hash_request_parts
+from aoai_simulated_api.record_replay.persistence import JsonlRecordingPersister, YamlRecordingPersister
+
+from .test_openai_record import TempDirectory
+from .test_record_replay_handler import _create_context
+
+# "_" in the deployment name means that the URL can't be determined from the recording file name
+URL_PATHS = ["/openai/deployments/gpt_4/embeddings", "/openai/deployments/deployment1/embeddings"]
+
+
+def _create_recorded_response(url: str, response_body: str) -> RecordedResponse:
+    return RecordedResponse(
+        request_hash=hash_request_parts("POST", url, '{"input": "one"}'),
+        status_code=200,
+        headers={"content-type": ["application/json"]},
+        body=response_body,
+        duration_ms=123,
+        context_values={},
+        full_request={
+            "method": "POST",
+            "uri": "http://localhost:8000" + url + "?api-version=2023-12-01-preview",
+            "headers": {"content-type": ["application/json"]},
+            "body": '{"input": "one"}',
+        },
+    )
+
+
+@pytest.mark.parametrize("persister_type", [YamlRecordingPersister, JsonlRecordingPersister])
+@pytest.mark.asyncio
+async def test_preload_recordings(persister_type):
+    with TempDirectory() as temp_dir:
+        persister = persister_type(temp_dir.path)
+        for index, url in enumerate(URL_PATHS):
+            recorded_response = _create_recorded_response(url, f'{{"data": {index}}}')
+            persister.save_recording(url, {recorded_response.request_hash: recorded_response})
+        handler = RecordReplayHandler(simulator_mode="replay", persister=persister, forwarders=[], autosave=False)
+
+        handler.preload(max_workers=2)
+
+        if persister_type is YamlRecordingPersister:
+            # the recordings are served without re-loading the files
+            for url in URL_PATHS:
+                os.remove(persister.get_recording_file_path(url))
+        for index, url in enumerate(URL_PATHS):
+            response = await handler.handle_request(_create_context(b'{"input": "one"}', path=url))
+            assert response.body == f'{{"data": {index}}}'.encode("utf-8")
+
+
+def test_preload_empty_recording_dir():
+    with TempDirectory() as temp_dir:
+        handler = RecordReplayHandler(
+            simulator_mode="replay", persister=YamlRecordingPersister(temp_dir.path), forwarders=[], autosave=False
+        )
+
+        handler.preload(max_workers=1)
@@ -0,0 +1,171 @@
+import random
+import time
+
+import orjson
+import pytest
+
+from aoai_simulated_api.record_replay.handler import RecordReplayHandler
+from aoai_simulated_api.record_replay.models import RecordedResponse, hash_request_parts
+from aoai_simulated_api.record_replay.persistence import YamlRecordingPersister
+from aoai_simulated_api.record_replay.replay import LoadedRecording
+from aoai_simulated_api.record_replay.similarity import SimilarityIndex, get_prompt_text
+
+from .test_openai_record import TempDirectory
+from .test_record_replay_handler import _create_context
+
+URL_PATH = "/openai/deployments/deployment1/chat/completions"
+
+PROMPT_TEMPLATE = (
+    "You are a helpful assistant for an online store. Answer the customer question using the product details "
+    "below and keep the answer short. Product: {product}. Question: {question}"
+)
+
+
+def _create_chat_body(content: str) -> str:
+    return orjson.dumps({"messages": [{"role": "user", "content": content}], "max_tokens": 10}).decode("utf-8")
+
+
+def _create_recorded_response(request_body: str, response_body: str) -> RecordedResponse:
+    return RecordedResponse(
+        request_hash=hash_request_parts("POST", URL_PATH, request_body),
+        status_code=200,
+        headers={"content-type": ["application/json"]},
+        body=response_body,
+        duration_ms=123,
+        context_values={},
+        full_request={"method": "POST", "uri": "http://localhost" + URL_PATH, "body": request_body},
+    )
+
+
+def _save_recording(persister: YamlRecordingPersister):
+    recorded_responses = [
+        _create_recorded_response(
+            _create_chat_body(PROMPT_TEMPLATE.format(product="red kettle", question="how much water does it hold")),
+            '{"answer": "kettle"}',
+        ),
+        _create_recorded_response(
+            _create_chat_body(PROMPT_TEMPLATE.format(product="blue toaster", question="how many slices fit in it")),
+            '{"answer": "toaster"}',
+        ),
+    ]
+    persister.save_recording(URL_PATH, {r.request_hash: r for r in recorded_responses})
+
+
+def test_get_prompt_text():
+    assert get_prompt_text({"input": "one"}) == "one"
+    assert get_prompt_text({"input": ["one", "two"]}) == "one\ntwo"
+    assert get_prompt_text({"prompt": "one"}) == "one"
+    assert (
+        get_prompt_text(
+            {
+                "messages": [
+                    {"role": "system", "content": "one"},
+                    {"role": "user", "content": [{"type": "text", "text": "two"}, {"type": "image_url"}]},
+                ]
+            }
+        )
+        == "one\ntwo"
+    )
+    assert get_prompt_text({"model": "gpt-4"}) is None
+    assert get_prompt_text([1, 2]) is None
+
+
+def test_similarity_index_finds_most_similar_prompt():
+    index = SimilarityIndex(
+        [
+            (1, PROMPT_TEMPLATE.format(product="red kettle", question="how much water does it hold")),
+            (2, PROMPT_TEMPLATE.format(product="blue toaster", question="how many slices fit in it")),
+        ],
+        threshold=0.6,
+    )
+
+    # the template has changed slightly
+    match = index.find(
+        PROMPT_TEMPLATE.replace("keep the answer short", "keep the answer brief").format(
+            product="blue toaster", question="how many slices fit in it"
+        )
+    )
+    assert match is not None
+    assert match[0] == 2
+    assert 0.6 <= match[1] < 1
+
+    assert index.find("a completely different prompt about the weather in the mountains") is None
+
+
+def test_similarity_index_is_removed_when_recording_is_modified():
+    request_body = _create_chat_body("one two three")
+    recorded_response = _create_recorded_response(request_body, "{}")
+    recording = LoadedRecording({recorded_response.request_hash: recorded_response}, similarity_threshold=0.8)
+    assert len(recording.similarity_index) == 1
+    assert recording.size_bytes > LoadedRecording({recorded_response.request_hash: recorded_response}).size_bytes
+
+    other_recorded_response = _create_recorded_response(_create_chat_body("four five six"), "{}")
+    recording[other_recorded_response.request_hash] = other_recorded_response
+
+    assert recording.similarity_index is None
+    assert (
+        recording.size_bytes
+        == LoadedRecording(
+            {
+                recorded_response.request_hash: recorded_response,
+                other_recorded_response.request_hash: other_recorded_response,
+            }
+        ).size_bytes
+    )
+
+
+@pytest.mark.asyncio
+async def test_replay_miss_is_served_by_most_similar_recorded_request():
+    with TempDirectory() as temp_dir:
+        persister = YamlRecordingPersister(temp_dir.path)
+        _save_recording(persister)
+        handler = RecordReplayHandler(
+            simulator_mode="replay", persister=persister, forwarders=[], autosave=False, similarity_threshold=0.6
+        )
+
+        drifted_prompt = PROMPT_TEMPLATE.replace("online store", "online shop").format(
+            product="red kettle", question="how much water does it hold"
+        )
+        response = await handler.handle_request(_create_context(_create_chat_body(drifted_prompt).encode(), URL_PATH))
+        assert response.body == b'{"answer": "kettle"}'
+
+        unrelated_prompt = "Write a poem about the sea"
+        response = await handler.handle_request(_create_context(_create_chat_body(unrelated_prompt).encode(), URL_PATH))
+        assert response is None
+
+
+@pytest.mark.asyncio
+async def test_replay_miss_is_not_served_without_similarity_threshold():
+    with TempDirectory() as temp_dir:
+        persister = YamlRecordingPersister(temp_dir.path)
+        _save_recording(persister)
+        handler = RecordReplayHandler(simulator_mode="replay", persister=persister, forwarders=[], autosave=False)
+
+        drifted_prompt = PROMPT_TEMPLATE.replace("online store", "online shop").format(
+            product="red kettle", question="how much water does it hold"
+        )
+        response = await handler.handle_request(_create_context(_create_chat_body(drifted_prompt).encode(), URL_PATH))
+        assert response is None
+
+
+@pytest.mark.slow
+def test_similarity_index_lookup_time_with_large_recording():
+    random.seed(1)
+    words = [f"word{i}" for i in range(5000)]
+    prompts = [
+        PROMPT_TEMPLATE.format(
+            product=" ".join(random.choices(words, k=3)), question=" ".join(random.choices(words, k=8))
+        )
+        for _ in range(100_000)
+    ]
+    index = SimilarityIndex(enumerate(prompts), threshold=0.7)
+
+    query_count = 1000
+    # a similarity of ~0.84 with the recorded prompt
+    queries = [prompt.replace("short", "brief") for prompt in prompts[:query_count]]
+    start_time = time.perf_counter()
+    matches = [index.find(query) for query in queries]
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+    assert [match[0] if match else None for match in matches] == list(range(query_count))
+    assert elapsed_ms / query_count < 1
@@ -0,0 +1,49 @@
+from aoai_simulated_api.models import Config, RequestContext
+from fastapi import Request
+import pytest
+
+
+def _create_request(body: bytes) -> tuple[Request, list]:
+    receive_calls = []
+
+    async def receive():
+        receive_calls.append(1)
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {"type": "http", "method": "POST", "path": "/test", "query_string": b"", "headers": []}
+    return Request(scope, receive), receive_calls
+
+
+@pytest.mark.asyncio
+async def test_request_json_is_parsed_once():
+    request, receive_calls = _create_request(b'{"input": "hello", "max_tokens": 10}')
+    context = RequestContext(config=Config(generators=[]), request=request)
+
+    first = await context.get_request_json()
+    second = await context.get_request_json()
+
+    assert first == {"input": "hello", "max_tokens": 10}
+    assert first is second
+    assert len(receive_calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_request_body_is_shared_with_json():
+    request, receive_calls = _create_request(b'{"input": "h\xc3\xa9llo"}')
+    context = RequestContext(config=Config(generators=[]), request=request)
+
+    body = await context.get_request_body()
+    request_json = await context.get_request_json()
+
+    assert body == b'{"input": "h\xc3\xa9llo"}'
+    assert request_json == {"input": "héllo"}
+    assert len(receive_calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_request_json_null_body_is_cached():
+    request, _ = _create_request(b"null")
+    context = RequestContext(config=Config(generators=[]), request=request)
+
+    assert await context.get_request_json() is None
+    assert await context.get_request_json() is None
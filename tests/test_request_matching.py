@@ -0,0 +1,130 @@
+import pytest
+
+from aoai_simulated_api.models import RecordingConfig, RequestMatchRule
+from aoai_simulated_api.record_replay.handler import RecordReplayHandler
+from aoai_simulated_api.record_replay.matching import RequestMatcher, remove_fields
+from aoai_simulated_api.record_replay.models import RecordedResponse, hash_request_parts
+from aoai_simulated_api.record_replay.persistence import JsonlRecordingPersister, YamlRecordingPersister
+
+from .test_openai_record import TempDirectory
+from .test_record_replay_handler import _create_context
+
+URL_PATH = "/openai/deployments/deployment1/embeddings"
+RECORDED_REQUEST_BODY = '{"input": "one", "model": "embedding"}'
+
+
+def _create_recorded_response(request_body: str, response_body: str) -> RecordedResponse:
+    return RecordedResponse(
+        request_hash=hash_request_parts("POST", URL_PATH, request_body),
+        status_code=200,
+        headers={"content-type": ["application/json"]},
+        body=response_body,
+        duration_ms=123,
+        context_values={},
+        full_request={
+            "method": "POST",
+            "uri": "http://localhost:8000" + URL_PATH + "?api-version=2023-12-01-preview",
+            "headers": {"content-type": ["application/json"]},
+            "body": request_body,
+        },
+    )
+
+
+def test_remove_fields():
+    value = {"user": "abc", "messages": [{"role": "user", "name": "x"}, {"role": "system"}], "metadata": {"id": 1}}
+
+    assert remove_fields(value, ("user",)) == {
+        "messages": [{"role": "user", "name": "x"}, {"role": "system"}],
+        "metadata": {"id": 1},
+    }
+    assert remove_fields(value, ("messages", "*", "name")) == {
+        "user": "abc",
+        "messages": [{"role": "user"}, {"role": "system"}],
+        "metadata": {"id": 1},
+    }
+    assert remove_fields(value, ("metadata", "*")) == {
+        "user": "abc",
+        "messages": [{"role": "user", "name": "x"}, {"role": "system"}],
+        "metadata": {},
+    }
+    assert remove_fields(value, ("missing", "field")) is value
+    # the original value isn't modified
+    assert value == {
+        "user": "abc",
+        "messages": [{"role": "user", "name": "x"}, {"role": "system"}],
+        "metadata": {"id": 1},
+    }
+
+
+@pytest.mark.asyncio
+async def test_canonical_json_request_key():
+    matcher = RequestMatcher("canonical-json", ignored_fields=["user"])
+
+    key = await matcher.get_request_key(_create_context(b'{"input": "one", "model": "embedding"}'))
+
+    assert key == await matcher.get_request_key(_create_context(b'{ "model":"embedding",\n "input":"one" }'))
+    assert key == await matcher.get_request_key(
+        _create_context(b'{"input": "one", "model": "embedding", "user": "123"}')
+    )
+    assert key != await matcher.get_request_key(_create_context(b'{"input": "two", "model": "embedding"}'))
+    assert key == matcher.get_recorded_request_key(_create_recorded_response(RECORDED_REQUEST_BODY, "{}"))
+    # non-JSON bodies are matched exactly
+    assert await matcher.get_request_key(_create_context(b"not json")) == hash_request_parts(
+        "POST", URL_PATH, b"not json"
+    )
+
+
+@pytest.mark.asyncio
+async def test_match_rules_apply_to_matching_routes():
+    matcher = RequestMatcher(
+        "canonical-json",
+        rules=[RequestMatchRule(route="/openai/deployments/{deployment}/embeddings", ignored_fields=["seed"])],
+    )
+    other_path = "/openai/deployments/deployment1/chat/completions"
+
+    async def get_key(body: bytes, path: str = URL_PATH) -> int:
+        return await matcher.get_request_key(_create_context(body, path=path))
+
+    assert await get_key(b'{"input": "one", "seed": 1}') == await get_key(b'{"input": "one", "seed": 2}')
+    assert await get_key(b'{"input": "one", "seed": 1}', other_path) != await get_key(
+        b'{"input": "one", "seed": 2}', other_path
+    )
+
+
+def test_matcher_from_recording_config():
+    matcher = RequestMatcher.from_recording_config(
+        RecordingConfig(RECORDING_MATCH_MODE="canonical-json", RECORDING_MATCH_IGNORED_FIELDS="user, metadata.id")
+    )
+
+    assert matcher.mode == "canonical-json"
+    assert matcher.get_recording_key_function() is not None
+    assert RequestMatcher.from_recording_config(RecordingConfig()).get_recording_key_function() is None
+
+
+@pytest.mark.parametrize("persister_type", [YamlRecordingPersister, JsonlRecordingPersister])
+@pytest.mark.asyncio
+async def test_replay_matches_canonical_json(persister_type):
+    with TempDirectory() as temp_dir:
+        persister = persister_type(temp_dir.path)
+        recorded_response = _create_recorded_response(RECORDED_REQUEST_BODY, '{"data": 1}')
+        persister.save_recording(URL_PATH, {recorded_response.request_hash: recorded_response})
+        request_body = b'{"model": "embedding", "input": "one", "user": "random-id"}'
+
+        exact_handler = RecordReplayHandler(simulator_mode="replay", persister=persister, forwarders=[], autosave=False)
+        assert await exact_handler.handle_request(_create_context(request_body)) is None
+
+        handler = RecordReplayHandler(
+            simulator_mode="replay",
+            persister=persister,
+            forwarders=[],
+            autosave=False,
+            request_matcher=RequestMatcher("canonical-json", ignored_fields=["user"]),
+        )
+        response = await handler.handle_request(_create_context(request_body))
+        assert response.body == b'{"data": 1}'
+
+        # the persisted request hash is unchanged
+        recording = await handler._get_recording_for_url(URL_PATH)
+        assert [recorded_response.request_hash for recorded_response in recording.values()] == [
+            recorded_response.request_hash
+        ]
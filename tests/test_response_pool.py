@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+from aoai_simulated_api.generator.response_pool import (
+    ResponsePool,
+    ResponseTemplate,
+    get_max_tokens_bucket,
+    placeholder,
+)
+import pytest
+
+
+def test_template_render_splices_values():
+    template = ResponseTemplate(
+        {
+            "id": placeholder("id"),
+            "created": placeholder("created"),
+            "text": 'some "quoted" text',
+            "usage": {"prompt_tokens": placeholder("prompt_tokens"), "completion_tokens": 5},
+        },
+        completion_tokens=5,
+    )
+
+    body = json.loads(template.render({"id": "cmpl-123", "created": 1000, "prompt_tokens": 10}))
+
+    assert body == {
+        "id": "cmpl-123",
+        "created": 1000,
+        "text": 'some "quoted" text',
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+    }
+    assert template.completion_tokens == 5
+
+
+@pytest.mark.parametrize(
+    "max_tokens, bucket_size, expected",
+    [(10, 16, 10), (16, 16, 16), (50, 16, 48), (4000, 100, 4000), (4096, 100, 4000)],
+)
+def test_get_max_tokens_bucket(max_tokens, bucket_size, expected):
+    assert get_max_tokens_bucket(max_tokens, bucket_size) == expected
+
+
+@pytest.mark.asyncio
+async def test_pool_fills_in_background_and_rotates():
+    pool = ResponsePool()
+    created_count = 0
+
+    def factory():
+        nonlocal created_count
+        created_count += 1
+        return ResponseTemplate({"value": created_count}, completion_tokens=created_count)
+
+    first = pool.get_template(key=("test",), size=3, factory=factory)
+    assert created_count == 1
+
+    # allow the background fill to run
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert created_count == 3
+
+    templates = [pool.get_template(key=("test",), size=3, factory=factory) for _ in range(6)]
+    assert created_count == 3
+    assert first in templates
+    assert len({id(template) for template in templates}) == 3
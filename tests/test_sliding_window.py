@@ -1,8 +1,20 @@
 import math
+import multiprocessing
+import os
+import random
 import time
-from aoai_simulated_api.limiters import SlidingWindow
+from aoai_simulated_api.limiters import (
+    IndexedSlidingWindow,
+    RedisLimiterStore,
+    SharedMemoryLimiterStore,
+    SharedMemorySlidingWindow,
+    SlidingWindow,
+)
+from fakeredis import FakeServer, aioredis
 import pytest
 
+window_classes = pytest.mark.parametrize("window_class", [SlidingWindow, IndexedSlidingWindow])
+
 
 def add_success_request(
     window: SlidingWindow,
@@ -23,16 +35,18 @@ def add_success_request(
     return result
 
 
-def test_allow_first_request_within_limits():
+@window_classes
+def test_allow_first_request_within_limits(window_class):
 
-    window = SlidingWindow(requests_per_10_seconds=10, tokens_per_minute=100)
+    window = window_class(requests_per_10_seconds=10, tokens_per_minute=100)
 
     add_success_request(window, timestamp=1, token_count=5, expected_remaining_requests=9, expected_remaining_tokens=95)
 
 
-def test_allow_request_in_new_window_period():
+@window_classes
+def test_allow_request_in_new_window_period(window_class):
 
-    window = SlidingWindow(requests_per_10_seconds=10, tokens_per_minute=100)
+    window = window_class(requests_per_10_seconds=10, tokens_per_minute=100)
 
     add_success_request(window, timestamp=1, token_count=5, expected_remaining_requests=9, expected_remaining_tokens=95)
     add_success_request(window, timestamp=2, token_count=5, expected_remaining_requests=8, expected_remaining_tokens=90)
@@ -54,9 +68,10 @@ def test_allow_request_in_new_window_period():
     )
 
 
-def test_block_when_too_many_requests():
+@window_classes
+def test_block_when_too_many_requests(window_class):
 
-    window = SlidingWindow(requests_per_10_seconds=10, tokens_per_minute=100)
+    window = window_class(requests_per_10_seconds=10, tokens_per_minute=100)
 
     # Time:                 0    1     2     3    4     5    6    7     8     9   10    11   12
     # # Requests                       1     8    1
@@ -80,9 +95,10 @@ def test_block_when_too_many_requests():
     assert result.retry_after == 7
 
 
-def test_block_when_too_many_tokens_exact():
+@window_classes
+def test_block_when_too_many_tokens_exact(window_class):
 
-    window = SlidingWindow(requests_per_10_seconds=10, tokens_per_minute=100)
+    window = window_class(requests_per_10_seconds=10, tokens_per_minute=100)
 
     add_success_request(window, timestamp=10, token_count=20)
     add_success_request(window, timestamp=20, token_count=20)
@@ -118,9 +134,10 @@ def test_block_when_too_many_tokens_exact():
     assert result.retry_after == 50
 
 
-def test_block_when_too_many_tokens_overflow():
+@window_classes
+def test_block_when_too_many_tokens_overflow(window_class):
 
-    window = SlidingWindow(requests_per_10_seconds=10, tokens_per_minute=100)
+    window = window_class(requests_per_10_seconds=10, tokens_per_minute=100)
 
     add_success_request(window, timestamp=10, token_count=24)
     add_success_request(window, timestamp=20, token_count=24)
@@ -156,9 +173,10 @@ def test_block_when_too_many_tokens_overflow():
     assert result.retry_after == 50
 
 
-def test_block_second_request():
+@window_classes
+def test_block_second_request(window_class):
 
-    window = SlidingWindow(requests_per_10_seconds=10, tokens_per_minute=100)
+    window = window_class(requests_per_10_seconds=10, tokens_per_minute=100)
 
     add_success_request(window, timestamp=10, token_count=100)
 
@@ -171,12 +189,13 @@ def test_block_second_request():
     assert result.retry_after == 50
 
 
+@window_classes
 @pytest.mark.slow
-def test_perf_successful_requests_SLOW():
+def test_perf_successful_requests_SLOW(window_class):
     simulated_tpm = 1_000_000
     requests_per_10_seconds = simulated_tpm * 60 / 1000
 
-    window = SlidingWindow(requests_per_10_seconds=requests_per_10_seconds, tokens_per_minute=simulated_tpm)
+    window = window_class(requests_per_10_seconds=requests_per_10_seconds, tokens_per_minute=simulated_tpm)
 
     start = time.perf_counter()
 
@@ -190,12 +209,13 @@ def test_perf_successful_requests_SLOW():
     assert avg_duration < 0.000_1
 
 
+@window_classes
 @pytest.mark.slow
-def test_perf_blocked_requests():
+def test_perf_blocked_requests(window_class):
     simulated_tpm = 1_000_000
     requests_per_10_seconds = simulated_tpm * 60 / 1000
 
-    window = SlidingWindow(requests_per_10_seconds=requests_per_10_seconds, tokens_per_minute=simulated_tpm)
+    window = window_class(requests_per_10_seconds=requests_per_10_seconds, tokens_per_minute=simulated_tpm)
 
     start = time.perf_counter()
 
@@ -209,9 +229,10 @@ def test_perf_blocked_requests():
     assert avg_duration < 0.000_1
 
 
-def test_100k_token_limit():
+@window_classes
+def test_100k_token_limit(window_class):
     # Test the sliding window with a large number of requests
-    window = SlidingWindow(requests_per_10_seconds=100, tokens_per_minute=100_000)
+    window = window_class(requests_per_10_seconds=100, tokens_per_minute=100_000)
 
     # simulate 10 RPS, with 200 tokens
     # should manage 100,000 / 200 = 500 requests successfully
@@ -236,3 +257,215 @@ def test_100k_token_limit():
 
     # Check that we can send requests again after 10s
     add_success_request(window, timestamp=timestamp, token_count=200)
+
+
+def test_indexed_window_matches_sliding_window():
+    # Drive both implementations with the same (randomised) traffic and check the results match
+    rng = random.Random(42)
+    window = SlidingWindow(requests_per_10_seconds=20, tokens_per_minute=2000)
+    indexed_window = IndexedSlidingWindow(requests_per_10_seconds=20, tokens_per_minute=2000)
+
+    timestamp = 1000.0
+    for i in range(5000):
+        timestamp += rng.choice([0, 0.01, 0.1, 0.5, 2, 15])
+        token_cost = rng.choice([1, 10, 50, 100, 500, 2000])
+        expected = window.add_request(token_cost=token_cost, timestamp=timestamp)
+        actual = indexed_window.add_request(token_cost=token_cost, timestamp=timestamp)
+        assert actual == expected, f"Mismatch at request {i} (timestamp={timestamp}, token_cost={token_cost})"
+
+
+def _measure_add_request_duration(window_entry_count: int, sample_count: int = 20_000) -> float:
+    # Fill the window with window_entry_count entries in the last 10s (limits set high enough to not be hit)
+    # and then measure the average cost of adding a request
+    window = IndexedSlidingWindow(requests_per_10_seconds=10_000_000, tokens_per_minute=10_000_000_000)
+    timestamp = 1000.0
+    step = 5 / window_entry_count
+    for _ in range(window_entry_count):
+        window.add_request(token_cost=10, timestamp=timestamp)
+        timestamp += step
+
+    start = time.perf_counter()
+    for _ in range(sample_count):
+        window.add_request(token_cost=10, timestamp=timestamp)
+    return (time.perf_counter() - start) / sample_count
+
+
+@pytest.mark.slow
+def test_perf_indexed_window_cost_is_flat():
+    small_window_duration = min(_measure_add_request_duration(10) for _ in range(3))
+    large_window_duration = min(_measure_add_request_duration(100_000) for _ in range(3))
+
+    # allow some headroom for the binary searches and timing noise
+    assert large_window_duration < small_window_duration * 3
+
+
+def test_shared_memory_window_matches_sliding_window(tmp_path):
+    rng = random.Random(42)
+    window = SlidingWindow(requests_per_10_seconds=20, tokens_per_minute=2000)
+    shared_window = SharedMemorySlidingWindow(
+        path=os.path.join(tmp_path, "test.window"), requests_per_10_seconds=20, tokens_per_minute=2000
+    )
+
+    timestamp = 1000.0
+    for i in range(5000):
+        timestamp += rng.choice([0, 0.01, 0.1, 0.5, 2, 15])
+        token_cost = rng.choice([1, 10, 50, 100, 500, 2000])
+        expected = window.add_request(token_cost=token_cost, timestamp=timestamp)
+        actual = shared_window.add_request(token_cost=token_cost, timestamp=timestamp)
+        assert actual == expected, f"Mismatch at request {i} (timestamp={timestamp}, token_cost={token_cost})"
+
+
+def test_shared_memory_windows_share_state(tmp_path):
+    path = os.path.join(tmp_path, "test.window")
+    window1 = SharedMemorySlidingWindow(path=path, requests_per_10_seconds=10, tokens_per_minute=100)
+    window2 = SharedMemorySlidingWindow(path=path, requests_per_10_seconds=10, tokens_per_minute=100)
+
+    add_success_request(
+        window1, timestamp=1, token_count=5, expected_remaining_requests=9, expected_remaining_tokens=95
+    )
+    add_success_request(
+        window2, timestamp=2, token_count=5, expected_remaining_requests=8, expected_remaining_tokens=90
+    )
+    add_success_request(
+        window1, timestamp=3, token_count=80, expected_remaining_requests=7, expected_remaining_tokens=10
+    )
+
+    result = window2.add_request(timestamp=4, token_cost=20)
+    assert not result.success
+    assert result.retry_reason == "tokens"
+
+
+def _add_shared_memory_requests(path: str, timestamp: float, count: int, results):
+    window = SharedMemorySlidingWindow(path=path, requests_per_10_seconds=100, tokens_per_minute=1_000_000)
+    success_count = 0
+    for _ in range(count):
+        if window.add_request(token_cost=1, timestamp=timestamp).success:
+            success_count += 1
+    results.put(success_count)
+
+
+def test_shared_memory_window_limits_across_processes(tmp_path):
+    # 4 processes each send 50 requests against a limit of 100 requests per 10s
+    # (i.e. each process is within the limit on its own, but not combined)
+    path = os.path.join(tmp_path, "test.window")
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_add_shared_memory_requests, args=(path, 1000.0, 50, results)) for _ in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    total_success_count = sum(results.get() for _ in processes)
+    assert total_success_count == 100
+
+
+def _add_inherited_shared_memory_requests(window: SharedMemorySlidingWindow, timestamp: float, count: int, results):
+    success_count = 0
+    for _ in range(count):
+        if window.add_request(token_cost=1, timestamp=timestamp).success:
+            success_count += 1
+    results.put(success_count)
+
+
+def test_shared_memory_window_limits_across_forked_processes(tmp_path):
+    # the window is created before forking (e.g. gunicorn --preload) so the processes inherit the open file
+    path = os.path.join(tmp_path, "test.window")
+    window = SharedMemorySlidingWindow(path=path, requests_per_10_seconds=100, tokens_per_minute=1_000_000)
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = [
+        context.Process(target=_add_inherited_shared_memory_requests, args=(window, 1000.0, 50, results))
+        for _ in range(4)
+    ]
+    for process in processes:
+        process.start()
+    total_success_count = sum(results.get(timeout=30) for _ in processes)
+    for process in processes:
+        process.join(timeout=30)
+
+    assert total_success_count == 100
+
+
+def test_shared_memory_store_reuses_windows(tmp_path):
+    store = SharedMemoryLimiterStore(str(tmp_path))
+    window1 = store.create_window("deployment1", requests_per_10_seconds=10, tokens_per_minute=100)
+    window2 = SharedMemoryLimiterStore(str(tmp_path)).create_window(
+        "deployment1", requests_per_10_seconds=10, tokens_per_minute=100
+    )
+    window3 = store.create_window("deployment1", requests_per_10_seconds=20, tokens_per_minute=200)
+
+    assert window1 is window2
+    assert window1 is not window3
+
+
+@pytest.mark.asyncio
+async def test_redis_window_matches_sliding_window():
+    rng = random.Random(42)
+    window = SlidingWindow(requests_per_10_seconds=20, tokens_per_minute=2000)
+    store = RedisLimiterStore(aioredis.FakeRedis(), key_prefix="test")
+    redis_window = store.create_window("deployment1", requests_per_10_seconds=20, tokens_per_minute=2000)
+
+    timestamp = 1000.0
+    for i in range(2000):
+        timestamp += rng.choice([0, 0.01, 0.1, 0.5, 2, 15])
+        token_cost = rng.choice([0, 1, 10, 50, 100, 500, 2000])
+        expected = window.add_request(token_cost=token_cost, timestamp=timestamp)
+        actual = await redis_window.add_request_async(token_cost=token_cost, timestamp=timestamp)
+        assert actual == expected, f"Mismatch at request {i} (timestamp={timestamp}, token_cost={token_cost})"
+
+
+@pytest.mark.asyncio
+async def test_redis_windows_share_state():
+    # windows created by different stores (i.e. different simulator instances) share state via the server
+    server = FakeServer()
+    window1 = RedisLimiterStore(aioredis.FakeRedis(server=server), key_prefix="test").create_window(
+        "deployment1", requests_per_10_seconds=10, tokens_per_minute=100
+    )
+    window2 = RedisLimiterStore(aioredis.FakeRedis(server=server), key_prefix="test").create_window(
+        "deployment1", requests_per_10_seconds=10, tokens_per_minute=100
+    )
+
+    result = await window1.add_request_async(timestamp=1, token_cost=5)
+    assert result.success
+    assert result.remaining_tokens == 95
+    result = await window2.add_request_async(timestamp=2, token_cost=80)
+    assert result.success
+    assert result.remaining_tokens == 15
+    assert result.remaining_requests == 8
+
+    result = await window1.add_request_async(timestamp=3, token_cost=20)
+    assert not result.success
+    assert result.retry_reason == "tokens"
+    assert result.retry_after == 58
+
+
+@pytest.mark.asyncio
+async def test_redis_window_with_out_of_order_timestamps():
+    # instances with different clocks can add requests with timestamps earlier than the latest entry
+    store = RedisLimiterStore(aioredis.FakeRedis(), key_prefix="test")
+    window = store.create_window("deployment1", requests_per_10_seconds=10, tokens_per_minute=1000)
+
+    assert (await window.add_request_async(timestamp=1000.0, token_cost=100)).success
+    assert (await window.add_request_async(timestamp=999.9, token_cost=10)).success
+
+    # both earlier requests are still in the window so this exceeds the limit
+    result = await window.add_request_async(timestamp=1059.95, token_cost=950)
+    assert not result.success
+    assert result.retry_reason == "tokens"
+    assert result.retry_after == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_window_uses_server_time():
+    store = RedisLimiterStore(aioredis.FakeRedis(), key_prefix="test")
+    window = store.create_window("deployment1", requests_per_10_seconds=10, tokens_per_minute=100)
+
+    result = await window.add_request_async(token_cost=60)
+    assert result.success
+    assert result.remaining_tokens == 40
+
+    result = await window.add_request_async(token_cost=60)
+    assert not result.success
+    assert 59 <= result.retry_after <= 60
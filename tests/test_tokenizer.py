@@ -0,0 +1,70 @@
+from aoai_simulated_api.generator import tokenizer
+from aoai_simulated_api.generator.openai_tokens import get_encoding_for_model
+from aoai_simulated_api.generator.tokenizer import (
+    TokenCountCache,
+    count_tokens,
+    count_tokens_batch,
+    token_count_cache,
+)
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_token_count_cache():
+    token_count_cache.clear()
+    yield
+    token_count_cache.clear()
+
+
+def _long_text(word: str) -> str:
+    return " ".join([word] * tokenizer.min_cached_length)
+
+
+def test_count_tokens_caches_long_text():
+    encoding = get_encoding_for_model("gpt-3.5-turbo-0613")
+    text = _long_text("lorem")
+
+    assert count_tokens(encoding, text) == len(encoding.encode(text))
+    assert len(token_count_cache) == 1
+    assert count_tokens(encoding, text) == len(encoding.encode(text))
+    assert len(token_count_cache) == 1
+
+
+def test_count_tokens_does_not_cache_short_text():
+    encoding = get_encoding_for_model("gpt-3.5-turbo-0613")
+
+    assert count_tokens(encoding, "hello world") == 2
+    assert len(token_count_cache) == 0
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TokenCountCache(max_size=2)
+    cache.set(("e", b"1"), 1)
+    cache.set(("e", b"2"), 2)
+    assert cache.get(("e", b"1")) == 1  # mark 1 as recently used
+    cache.set(("e", b"3"), 3)
+
+    assert cache.get(("e", b"1")) == 1
+    assert cache.get(("e", b"2")) is None
+    assert cache.get(("e", b"3")) == 3
+
+
+def test_cache_key_includes_encoding():
+    text = _long_text("lorem")
+    key_cl100k = TokenCountCache.get_key(get_encoding_for_model("gpt-3.5-turbo-0613"), text)
+    key_p50k = TokenCountCache.get_key(get_encoding_for_model("text-davinci-003"), text)
+    assert key_cl100k != key_p50k
+
+
+@pytest.mark.parametrize("text_count", [1, tokenizer.min_batch_encode_count + 1])
+def test_count_tokens_batch(text_count):
+    encoding = get_encoding_for_model("gpt-3.5-turbo-0613")
+    texts = ["hello world"] + [_long_text(f"word{i}") for i in range(text_count)]
+    expected = [len(encoding.encode(text)) for text in texts]
+
+    # prime the cache with one of the values
+    count_tokens(encoding, texts[-1])
+
+    assert count_tokens_batch(encoding, texts) == expected
+    assert count_tokens_batch(encoding, texts) == expected
+    assert len(token_count_cache) == text_count
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+from aoai_simulated_api.models import RecordingConfig
+from aoai_simulated_api.record_replay.admission import (
+    UpstreamAdmissionController,
+    get_admission_controller,
+    get_retry_after_seconds,
+)
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_admission_limits_concurrent_requests():
+    admission_controller = UpstreamAdmissionController(max_concurrency=2)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def forward():
+        nonlocal in_flight, max_in_flight
+        async with admission_controller.admit("deployment1"):
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+    await asyncio.gather(*[forward() for _ in range(6)])
+
+    assert max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_admission_deployments_are_limited_separately():
+    admission_controller = UpstreamAdmissionController(max_concurrency=1)
+
+    async with admission_controller.admit("deployment1"):
+        # would block if deployment2 shared the limit with deployment1
+        async with admission_controller.admit("deployment2"):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_response_halves_limit_and_holds_requests():
+    admission_controller = UpstreamAdmissionController(max_concurrency=8)
+
+    admission_controller.record_response("deployment1", 429, {"retry-after-ms": "200"})
+    # responses for requests that were already in flight don't reduce the limit further
+    admission_controller.record_response("deployment1", 429, {"retry-after-ms": "200"})
+
+    assert admission_controller.get_limit("deployment1") == 4
+    start_time = time.perf_counter()
+    async with admission_controller.admit("deployment1"):
+        elapsed_time = time.perf_counter() - start_time
+    assert elapsed_time >= 0.15
+
+
+@pytest.mark.asyncio
+async def test_successful_responses_increase_limit():
+    admission_controller = UpstreamAdmissionController(max_concurrency=4)
+    admission_controller.record_response("deployment1", 429, {"retry-after-ms": "0"})
+    assert admission_controller.get_limit("deployment1") == 2
+
+    # approximately one increase per limit's worth of successful responses
+    for _ in range(3):
+        admission_controller.record_response("deployment1", 200, {})
+    assert admission_controller.get_limit("deployment1") == 3
+
+    for _ in range(10):
+        admission_controller.record_response("deployment1", 200, {})
+    assert admission_controller.get_limit("deployment1") == 4
+
+
+@pytest.mark.asyncio
+async def test_limit_is_not_increased_when_upstream_has_no_remaining_capacity():
+    admission_controller = UpstreamAdmissionController(max_concurrency=4)
+    admission_controller.record_response("deployment1", 429, {"retry-after-ms": "0"})
+
+    for _ in range(4):
+        admission_controller.record_response("deployment1", 200, {"x-ratelimit-remaining-tokens": "0"})
+        admission_controller.record_response("deployment1", 200, {"x-ratelimit-remaining-requests": "0"})
+
+    assert admission_controller.get_limit("deployment1") == 2
+
+
+def test_get_retry_after_seconds():
+    assert get_retry_after_seconds({"retry-after-ms": "1500", "retry-after": "2"}) == 1.5
+    assert get_retry_after_seconds({"retry-after": "2"}) == 2
+    assert get_retry_after_seconds({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}) is None
+    assert get_retry_after_seconds({}) is None
+
+
+@pytest.mark.asyncio
+async def test_admission_controller_is_shared():
+    recording_config = RecordingConfig(RECORDING_UPSTREAM_MAX_CONCURRENCY=5)
+
+    admission_controller = get_admission_controller(recording_config)
+
+    assert get_admission_controller(recording_config) is admission_controller
+    assert admission_controller.max_concurrency == 5
@@ -0,0 +1,96 @@
+import json
+import logging
+import os
+
+from aoai_simulated_api.config_loader import _load_upstream_endpoints
+from aoai_simulated_api.models import RecordingConfig, UpstreamEndpoint
+from aoai_simulated_api.record_replay.upstream import UpstreamEndpointPool, get_upstream_pool
+
+from .test_openai_record import TempDirectory
+
+ENDPOINT_1 = UpstreamEndpoint(name="endpoint1", endpoint="https://endpoint1.openai.azure.com/", key="key1")
+ENDPOINT_2 = UpstreamEndpoint(name="endpoint2", endpoint="https://endpoint2.openai.azure.com/", key="key2")
+
+
+def test_least_outstanding_routing():
+    pool = UpstreamEndpointPool([ENDPOINT_1, ENDPOINT_2], "least-outstanding")
+
+    with pool.acquire("deployment1") as first:
+        with pool.acquire("deployment1") as second:
+            assert {first.name, second.name} == {"endpoint1", "endpoint2"}
+        # deployments are tracked separately
+        with pool.acquire("deployment2") as other_deployment:
+            assert other_deployment is ENDPOINT_1
+        assert pool.select_endpoint("deployment1") is second
+
+
+def test_remaining_tokens_routing():
+    pool = UpstreamEndpointPool([ENDPOINT_1, ENDPOINT_2], "remaining-tokens")
+    pool.record_response(ENDPOINT_1, "deployment1", 200, {"x-ratelimit-remaining-tokens": "1000"})
+    pool.record_response(ENDPOINT_2, "deployment1", 200, {"x-ratelimit-remaining-tokens": "5000"})
+
+    assert pool.select_endpoint("deployment1") is ENDPOINT_2
+
+    # remaining tokens are shared between the outstanding requests
+    with pool.acquire("deployment1") as first:
+        with pool.acquire("deployment1") as second:
+            with pool.acquire("deployment1") as third:
+                assert [first, second, third] == [ENDPOINT_2, ENDPOINT_2, ENDPOINT_2]
+                with pool.acquire("deployment1") as fourth:
+                    with pool.acquire("deployment1") as fifth:
+                        assert fourth is ENDPOINT_2
+                        assert fifth is ENDPOINT_1
+
+
+def test_rate_limited_endpoint_is_avoided():
+    pool = UpstreamEndpointPool([ENDPOINT_1, ENDPOINT_2], "least-outstanding")
+
+    pool.record_response(ENDPOINT_1, "deployment1", 429, {"retry-after": "10"})
+
+    assert pool.select_endpoint("deployment1") is ENDPOINT_2
+    assert pool.select_endpoint("deployment2") is ENDPOINT_1
+
+
+def test_failed_endpoint_is_avoided():
+    pool = UpstreamEndpointPool([ENDPOINT_1, ENDPOINT_2], "least-outstanding")
+
+    pool.record_failure(ENDPOINT_1, "deployment1")
+    pool.record_response(ENDPOINT_2, "deployment1", 503, {})
+    pool.record_response(ENDPOINT_2, "deployment1", 503, {})
+
+    # both endpoints are unavailable - use the one that becomes available first
+    assert pool.select_endpoint("deployment1") is ENDPOINT_1
+
+
+def test_get_upstream_endpoints():
+    recording_config = RecordingConfig()
+    assert recording_config.get_upstream_endpoints() == []
+    assert get_upstream_pool(recording_config) is None
+
+    recording_config.aoai_api_endpoint = "https://default.openai.azure.com/"
+    recording_config.aoai_api_key = "default-key"
+    assert recording_config.get_upstream_endpoints() == [
+        UpstreamEndpoint(name="default", endpoint="https://default.openai.azure.com/", key="default-key")
+    ]
+
+    recording_config.upstream_endpoints = [ENDPOINT_1, ENDPOINT_2]
+    assert recording_config.get_upstream_endpoints() == [ENDPOINT_1, ENDPOINT_2]
+    pool = get_upstream_pool(recording_config)
+    assert pool.endpoints == [ENDPOINT_1, ENDPOINT_2]
+    assert get_upstream_pool(recording_config) is pool
+
+
+def test_load_upstream_endpoints(monkeypatch):
+    with TempDirectory() as temp_dir:
+        config_path = os.path.join(temp_dir.path, "upstream.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "endpoint1": {"endpoint": ENDPOINT_1.endpoint, "key": ENDPOINT_1.key},
+                    "endpoint2": {"endpoint": ENDPOINT_2.endpoint, "key": ENDPOINT_2.key},
+                },
+                f,
+            )
+        monkeypatch.setenv("RECORDING_UPSTREAM_CONFIG_PATH", config_path)
+
+        assert _load_upstream_endpoints(logging.getLogger(__name__)) == [ENDPOINT_1, ENDPOINT_2]